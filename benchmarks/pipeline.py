@@ -0,0 +1,239 @@
+"""Benchmarks the occurrences pipeline (download, parse, accumulate and flatten)
+against synthetic pages served by an in-memory HTTP transport. Each stage is
+measured on its own; `total` is a whole query, with all stages together.
+
+    $ python -m benchmarks.pipeline --sizes 1000 10000 --output results.json
+    $ python -m benchmarks.pipeline --sizes 1000000 --formats df --no-memory
+    $ python -m benchmarks.pipeline --compare results.json
+
+Results are saved as JSON, so runs from different releases (or machines) can
+be compared with `--compare`."""
+
+import json
+import platform
+import tracemalloc
+from argparse import ArgumentParser
+from asyncio import Semaphore, gather, run
+from datetime import datetime
+from time import perf_counter, process_time
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from crossfire import AsyncClient, __version__
+from crossfire.clients.occurrences import Accumulator, Occurrences, flatten
+from crossfire.parser import HAS_GEOPANDAS, HAS_PANDAS, parse_response
+from crossfire.testing import SyntheticData
+
+URL = "http://crossfire.benchmark/api/v2"
+SIZES = (1_000, 10_000, 100_000)
+STATE_ID = "813ca36b-91e3-4a18-b408-60b27a1942ef"
+
+
+def available_formats():
+    formats = ["dict"]
+    if HAS_PANDAS:
+        formats.append("df")
+    if HAS_GEOPANDAS:
+        formats.append("geodf")
+    return formats
+
+
+class Pages:
+    """Pre-encoded synthetic pages, so generating data is not benchmarked."""
+
+    def __init__(self, size, take):
+        self.size = size
+        self.take = take
+        self.raw = tuple(SyntheticData().raw_pages(size, take))
+
+    def __len__(self):
+        return len(self.raw)
+
+    def response(self, number, request=None):
+        request = request or httpx.Request(
+            "GET", f"{URL}/occurrences?page={number}"
+        )
+        return httpx.Response(
+            200,
+            content=self.raw[number - 1],
+            headers={"Content-Type": "application/json"},
+            request=request,
+        )
+
+    def handler(self, request):
+        if request.url.path.endswith("/auth/login"):
+            body = {"data": {"accessToken": "benchmark", "expiresIn": 3600}}
+            return httpx.Response(201, json=body, request=request)
+
+        query = parse_qs(urlparse(str(request.url)).query)
+        return self.response(int(query["page"][0]), request)
+
+
+def client_for(pages):
+    client = AsyncClient(
+        email="benchmark",
+        password="benchmark",
+        transport=httpx.MockTransport(pages.handler),
+        progress=False,
+    )
+    client.URL = URL
+    return client
+
+
+def measure(prepare, function, memory):
+    """Runs `function` with the output of `prepare` and returns its wall time,
+    CPU time and, if `memory` is set, the peak memory (in MB) of a second run.
+    Only `function` is measured."""
+    data = prepare()
+    wall, cpu = perf_counter(), process_time()
+    function(data)
+    wall, cpu = perf_counter() - wall, process_time() - cpu
+
+    peak = None
+    if memory:
+        data = prepare()
+        tracemalloc.start()
+        function(data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = peak / 2**20
+
+    return wall, cpu, peak
+
+
+def benchmark(format, pages, memory=True):
+    def nothing():
+        return None
+
+    async def requests():
+        client = client_for(pages)
+        semaphore = Semaphore(Occurrences.MAX_PARALLEL_REQUESTS)
+
+        async def request(number):
+            async with semaphore:
+                return await client.request(
+                    f"{URL}/occurrences?idState={STATE_ID}&page={number}"
+                )
+
+        return await gather(*(request(n) for n in range(1, len(pages) + 1)))
+
+    def download(_):
+        return run(requests())
+
+    def total(_):
+        occurrences = Occurrences(
+            client_for(pages), STATE_ID, format=format, flat=True
+        )
+        return run(occurrences())
+
+    def responses():
+        return [pages.response(n) for n in range(1, len(pages) + 1)]
+
+    def parse(responses):
+        return [parse_response(r, format=format)[0] for r in responses]
+
+    def parsed():
+        return parse(responses())
+
+    def merge(parsed):
+        first, *remaining = parsed
+        return Accumulator().merge(first).merge(*remaining)()
+
+    def merged():
+        return merge(parsed())
+
+    stages = (
+        ("download", nothing, download),
+        ("parse", responses, parse),
+        ("merge", parsed, merge),
+        ("flatten", merged, flatten),
+        ("total", nothing, total),
+    )
+    results = []
+    for stage, prepare, function in stages:
+        wall, cpu, peak = measure(prepare, function, memory)
+        results.append(
+            {
+                "format": format,
+                "size": pages.size,
+                "stage": stage,
+                "pages": len(pages),
+                "seconds": wall,
+                "cpu_seconds": cpu,
+                "pages_per_second": len(pages) / wall,
+                "records_per_second": pages.size / wall,
+                "peak_memory_mb": peak,
+            }
+        )
+    return results
+
+
+def metadata():
+    return {
+        "crossfire": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "created_at": datetime.now().isoformat(),
+    }
+
+
+def key(result):
+    return result["format"], result["size"], result["stage"]
+
+
+def report(results, baseline=None):
+    baseline = {key(result): result for result in (baseline or [])}
+    header = (
+        f"{'format':<6} {'size':>9} {'stage':<9} {'seconds':>9} "
+        f"{'records/s':>12} {'pages/s':>10} {'peak MB':>9}"
+    )
+    if baseline:
+        header += f" {'vs baseline':>12}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        peak = result["peak_memory_mb"]
+        line = (
+            f"{result['format']:<6} {result['size']:>9} {result['stage']:<9} "
+            f"{result['seconds']:>9.3f} "
+            f"{result['records_per_second']:>12,.0f} "
+            f"{result['pages_per_second']:>10,.1f} "
+            f"{'-' if peak is None else f'{peak:.1f}':>9}"
+        )
+        if previous := baseline.get(key(result)):
+            ratio = result["seconds"] / max(previous["seconds"], 1e-9)
+            line += f" {ratio:>11.2f}x"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--formats", nargs="+", choices=("dict", "df", "geodf"))
+    parser.add_argument("--take", type=int, default=20, help="page size")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--output", help="save results as JSON in this file")
+    parser.add_argument("--compare", help="JSON file from a previous run")
+    args = parser.parse_args(args)
+
+    results = []
+    for size in args.sizes:
+        pages = Pages(size, args.take)
+        for format in args.formats or available_formats():
+            results.extend(benchmark(format, pages, not args.no_memory))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as handler:
+            baseline = json.load(handler)["results"]
+
+    print(report(results, baseline))
+    if args.output:
+        with open(args.output, "w") as handler:
+            json.dump({"metadata": metadata(), "results": results}, handler)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
 __version__ = "0.1.0"
-__all__ = ("AsyncClient", "Client", "cities", "occurrences", "states")
+__all__ = (
+    "AsyncClient",
+    "Client",
+    "cities",
+    "occurrences",
+    "profile",
+    "states",
+)
 
 from functools import lru_cache
 
 from crossfire.clients import AsyncClient, Client  # noqa
+from crossfire.profiling import profile  # noqa
 
 
 @lru_cache(maxsize=1)
@@ -30,6 +38,14 @@ def occurrences(
     max_parallel_requests=None,
     format=None,
     flat=False,
+    prefetch=None,
+    page_size=None,
+    max_memory=None,
+    snapshot=None,
+    timeout=None,
+    max_retries=None,
+    on_error="raise",
+    priority=1,
 ):
     return client().occurrences(
         id_state,
@@ -40,4 +56,12 @@ def occurrences(
         max_parallel_requests=max_parallel_requests,
         format=format,
         flat=flat,
+        prefetch=prefetch,
+        page_size=page_size,
+        max_memory=max_memory,
+        snapshot=snapshot,
+        timeout=timeout,
+        max_retries=max_retries,
+        on_error=on_error,
+        priority=priority,
     )
@@ -0,0 +1,144 @@
+try:
+    from pandas import DataFrame
+
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+from crossfire.errors import CrossfireError
+from crossfire.records import is_record
+
+
+def _victims(occurrence, situation=None):
+    return sum(
+        1
+        for victim in occurrence.get("victims") or ()
+        if situation is None or victim.get("situation") == situation
+    )
+
+
+METRICS = {
+    "count": lambda occurrence: 1,
+    "victims": _victims,
+    "killed": lambda occurrence: _victims(occurrence, "Dead"),
+    "wounded": lambda occurrence: _victims(occurrence, "Wounded"),
+    "animal_victims": lambda occurrence: len(
+        occurrence.get("animalVictims") or ()
+    ),
+}
+
+# keys derived from the date of the occurrence (e.g. 2023-10-20T14:30:00)
+PERIODS = {"day": 10, "month": 7, "year": 4}
+
+
+class UnknownMetricError(CrossfireError):
+    def __init__(self, metric):
+        message = (
+            f"Unknown metric `{metric}`. Valid metrics are: "
+            f"{', '.join(METRICS)}, or `(name, function)` pairs"
+        )
+        super().__init__(message)
+
+
+class ListValueError(CrossfireError):
+    def __init__(self, path):
+        message = (
+            f"Cannot group by `{path}`: it is a list. Group by a single value "
+            "or count the items of the list with a custom metric"
+        )
+        super().__init__(message)
+
+
+def _lookup(occurrence, path):
+    if path in PERIODS:
+        date = occurrence.get("date")
+        return date[: PERIODS[path]] if date else None
+
+    for key in path.split("."):
+        if isinstance(occurrence, list):
+            raise ListValueError(path)
+        if not isinstance(occurrence, dict):
+            return None
+        occurrence = occurrence.get(key)
+    if isinstance(occurrence, list):
+        raise ListValueError(path)
+    return occurrence
+
+
+def value(occurrence, path):
+    """Value of `path` in an occurrence: a key (e.g. `policeAction`), a dotted
+    path for nested objects (e.g. `contextInfo.mainReason`) or a period of the
+    occurrence date (`day`, `month` or `year`). Objects with a name, such as
+    cities and neighborhoods, are represented by it."""
+    found = _lookup(occurrence, path)
+    if isinstance(found, dict):
+        return found.get("name")
+    return found
+
+
+def group(occurrence, path):
+    """Group key and label of `path` in an occurrence. Objects are grouped by
+    their id, since different objects may share a name (e.g. neighborhoods
+    of different cities), and labelled with their name."""
+    found = _lookup(occurrence, path)
+    if isinstance(found, dict):
+        return found.get("id", found.get("name")), found.get("name")
+    return found, found
+
+
+def _order(value):
+    """Sort key for group keys, which might mix types and `None`."""
+    if value is None:
+        return 1, "", ""
+    return 0, type(value).__name__, value
+
+
+class Aggregation:
+    """Running group-by over occurrences: each page is folded into one row of
+    totals per group, so memory depends on the number of groups, not on the
+    number of occurrences."""
+
+    def __init__(self, by, metrics=("count",)):
+        self.by = (by,) if isinstance(by, str) else tuple(by)
+        self.metrics = []
+        for metric in metrics:
+            if isinstance(metric, tuple):
+                self.metrics.append(metric)
+            elif metric in METRICS:
+                self.metrics.append((metric, METRICS[metric]))
+            else:
+                raise UnknownMetricError(metric)
+        self.groups = {}
+        self.labels = {}
+
+    def add(self, occurrences):
+        functions = tuple(function for _, function in self.metrics)
+        for occurrence in occurrences:
+            if is_record(occurrence):
+                occurrence = occurrence.to_dict()
+            groups = [group(occurrence, path) for path in self.by]
+            key = tuple(key for key, _ in groups)
+            totals = self.groups.get(key)
+            if totals is None:
+                totals = self.groups[key] = [0] * len(functions)
+                self.labels[key] = tuple(label for _, label in groups)
+            for index, function in enumerate(functions):
+                totals[index] += function(occurrence)
+        return self
+
+    def __call__(self, format=None):
+        """Returns one dictionary per group, sorted by the group keys, or a
+        DataFrame if `format` is `"df"`."""
+        names = tuple(name for name, _ in self.metrics)
+        rows = [
+            dict(zip(self.by + names, self.labels[key] + tuple(totals)))
+            for key, totals in sorted(
+                self.groups.items(),
+                key=lambda item: tuple(
+                    _order(v) for v in self.labels[item[0]] + item[0]
+                ),
+            )
+        ]
+        if HAS_PANDAS and format == "df":
+            return DataFrame(rows, columns=list(self.by + names))
+        return rows
@@ -0,0 +1,351 @@
+import json
+import os
+import re
+from tempfile import mkstemp
+
+try:
+    import numpy
+    import pyarrow
+    from pyarrow import ipc, parquet
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    from pandas import DataFrame
+
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+from crossfire.errors import CrossfireError
+from crossfire.records import is_record, to_dicts
+from crossfire.spatial import coordinates
+
+WKB_POINT = [("order", "u1"), ("type", "<u4"), ("x", "<f8"), ("y", "<f8")]
+UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*$", re.I)
+
+
+class MissingPyArrowError(CrossfireError):
+    def __init__(self, feature):
+        message = f"{feature} requires `pyarrow`. Install it with `pip install pyarrow`."
+        super().__init__(message)
+
+
+class SizeError(CrossfireError):
+    def __init__(self, size):
+        message = (
+            f"Invalid size `{size}`. Use a number of bytes or a string such "
+            "as `'500MB'` or `'2GB'`."
+        )
+        super().__init__(message)
+
+
+def parse_size(size):
+    """Converts sizes such as `"500MB"` or `"2 GiB"` to bytes. Units are
+    powers of 1024, as in memory limits of containers."""
+    if isinstance(size, bool):
+        raise SizeError(size)
+    if isinstance(size, int):
+        if size < 1:
+            raise SizeError(size)
+        return size
+
+    match = SIZE.match(str(size))
+    if not match or float(match.group(1)) <= 0:
+        raise SizeError(size)
+    number, unit = match.groups()
+    return int(float(number) * UNITS[unit.lower()])
+
+
+def to_table(page):
+    """Converts a page (list of dictionaries or records, or a DataFrame) to an
+    Arrow table."""
+    if HAS_PANDAS and isinstance(page, DataFrame):
+        return pyarrow.Table.from_pandas(page, preserve_index=False)
+    if page and is_record(page[0]):
+        page = to_dicts(page)
+    return pyarrow.Table.from_pylist(page)
+
+
+def _unify(first, second):
+    """Type able to hold values of both types. Nested objects are merged
+    field by field, since pages often lack some of the keys."""
+    if first == second or pyarrow.types.is_null(second):
+        return first
+    if pyarrow.types.is_null(first):
+        return second
+    if pyarrow.types.is_struct(first) and pyarrow.types.is_struct(second):
+        fields = {field.name: field.type for field in first}
+        for field in second:
+            current = fields.get(field.name)
+            fields[field.name] = (
+                field.type if current is None else _unify(current, field.type)
+            )
+        return pyarrow.struct(fields.items())
+    if pyarrow.types.is_list(first) and pyarrow.types.is_list(second):
+        return pyarrow.list_(_unify(first.value_type, second.value_type))
+    try:
+        schema = pyarrow.unify_schemas(
+            [pyarrow.schema([("_", first)]), pyarrow.schema([("_", second)])],
+            promote_options="permissive",
+        )
+        return schema.field("_").type
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        return pyarrow.string()
+
+
+def _conform(array, target):
+    if array.type == target:
+        return array
+    if pyarrow.types.is_null(array.type):
+        return pyarrow.nulls(len(array), target)
+    if pyarrow.types.is_struct(target) and pyarrow.types.is_struct(array.type):
+        children = dict(
+            zip((field.name for field in array.type), array.flatten())
+        )
+        arrays = [
+            _conform(children[field.name], field.type)
+            if field.name in children
+            else pyarrow.nulls(len(array), field.type)
+            for field in target
+        ]
+        return pyarrow.StructArray.from_arrays(
+            arrays, fields=list(target), mask=array.is_null()
+        )
+    if pyarrow.types.is_list(target) and pyarrow.types.is_list(array.type):
+        return pyarrow.ListArray.from_arrays(
+            array.offsets,
+            _conform(array.values, target.value_type),
+            mask=array.is_null(),
+        )
+    try:
+        return array.cast(target)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, NotImplementedError):
+        values = (
+            None if value is None else json.dumps(value, ensure_ascii=False)
+            for value in array.to_pylist()
+        )
+        return pyarrow.array(values, pyarrow.string())
+
+
+def concat(tables):
+    """Concatenates tables whose schemas might differ (e.g. a page where all
+    values of a column are null, or nested objects with different keys)."""
+    if not tables:
+        return pyarrow.table({})
+    try:
+        return pyarrow.concat_tables(tables, promote_options="permissive")
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        pass
+
+    fields = {}
+    for table in tables:
+        for field in table.schema:
+            current = fields.get(field.name)
+            fields[field.name] = (
+                field.type if current is None else _unify(current, field.type)
+            )
+
+    def conform(table):
+        columns = {}
+        for name, target in fields.items():
+            if name not in table.column_names:
+                columns[name] = pyarrow.nulls(table.num_rows, target)
+                continue
+            chunks = table.column(name).chunks
+            columns[name] = pyarrow.chunked_array(
+                [_conform(chunk, target) for chunk in chunks], target
+            )
+        return pyarrow.table(columns)
+
+    return pyarrow.concat_tables([conform(table) for table in tables])
+
+
+def spill(table, directory=None):
+    """Writes `table` to a temporary Arrow IPC file and returns the same table
+    memory-mapped from disk. The file is deleted right away: the operating
+    system keeps its contents until the mapping is released."""
+    descriptor, path = mkstemp(
+        prefix="crossfire-", suffix=".arrow", dir=directory
+    )
+    with os.fdopen(descriptor, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    mapped = ipc.open_file(pyarrow.memory_map(path)).read_all()
+    try:
+        os.unlink(path)
+    except OSError:  # e.g. Windows does not remove files in use
+        pass
+    return mapped
+
+
+class Spill:
+    """Collects pages as Arrow tables, keeping up to `max_memory` bytes in
+    memory. Beyond that, buffered tables are written to disk and memory-mapped,
+    so the final table does not need to fit in memory.
+
+    Pages may also be added out of order with `add`: pages waiting for earlier
+    ones are held as Arrow tables, count toward `max_memory` too and are
+    spilled one by one if the held pages alone exceed it."""
+
+    def __init__(self, max_memory, directory=None):
+        if not HAS_PYARROW:
+            raise MissingPyArrowError("`max_memory`")
+        self.max_memory = parse_size(max_memory)
+        self.directory = directory
+        self.buffered = []
+        self.buffered_bytes = 0
+        self.spilled = []
+        self.expected = 1
+        self.held = {}  # page number -> (table or None, bytes in memory)
+        self.held_bytes = 0
+
+    def append(self, page):
+        self._append(to_table(page))
+
+    def _append(self, table):
+        self.buffered.append(table)
+        self.buffered_bytes += table.nbytes
+        if self.buffered_bytes + self.held_bytes > self.max_memory:
+            self.flush()
+
+    def add(self, number, page):
+        """Adds page `number` (`None` for a page that failed and is skipped).
+        Pages are appended in order of their numbers, starting at 1."""
+        if number < self.expected or number in self.held:
+            return
+
+        table = None if page is None else to_table(page)
+        size = 0 if table is None else table.nbytes
+        self.held[number] = table, size
+        self.held_bytes += size
+        while self.expected in self.held:
+            table, size = self.held.pop(self.expected)
+            self.held_bytes -= size
+            self.expected += 1
+            if table is not None:
+                self._append(table)
+
+        if self.buffered_bytes + self.held_bytes > self.max_memory:
+            self.flush()
+        if self.held_bytes > self.max_memory:
+            self.spill_held()
+
+    def spill_held(self):
+        for number, (table, size) in self.held.items():
+            if size:
+                self.held[number] = spill(table, self.directory), 0
+        self.held_bytes = 0
+
+    def flush(self):
+        if self.buffered:
+            self.spilled.append(spill(concat(self.buffered), self.directory))
+            self.buffered, self.buffered_bytes = [], 0
+
+    def __call__(self):
+        held = [table for _, (table, _) in sorted(self.held.items())]
+        tables = self.spilled + self.buffered + held
+        return concat([table for table in tables if table is not None])
+
+
+def write_snapshot(table, path):
+    """Writes `table` to `path` as an uncompressed Arrow IPC (Feather v2) file,
+    so it can be memory-mapped by `read_snapshot`. The file is written under a
+    unique temporary name and then renamed, so processes writing the same
+    snapshot never publish a partial file."""
+    descriptor, tmp = mkstemp(
+        prefix=f".{path.name}-", suffix=".tmp", dir=path.parent
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_snapshot(path):
+    """Memory-maps a file written by `write_snapshot`: no data is read until it
+    is used."""
+    return ipc.open_file(pyarrow.memory_map(str(path))).read_all()
+
+
+def points(longitudes, latitudes):
+    """Arrow array with the WKB of the points, built with NumPy instead of
+    creating geometry objects: each point is 21 bytes (byte order, geometry
+    type and two doubles). Points without valid coordinates are null."""
+    x, y = coordinates(longitudes), coordinates(latitudes)
+    records = numpy.empty(len(x), dtype=WKB_POINT)
+    records["order"], records["type"] = 1, 1  # little endian, point
+    records["x"], records["y"] = x, y
+
+    size = records.dtype.itemsize
+    offsets = numpy.arange(0, size * (len(x) + 1), size, dtype="int32")
+    valid = ~(numpy.isnan(x) | numpy.isnan(y))
+    validity = pyarrow.array(valid).buffers()[1]
+    return pyarrow.Array.from_buffers(
+        pyarrow.binary(),
+        len(x),
+        [validity, pyarrow.py_buffer(offsets), pyarrow.py_buffer(records)],
+        null_count=int(len(x) - valid.sum()),
+    )
+
+
+def geo_metadata(bbox=None):
+    """GeoParquet metadata for a `geometry` column of points in longitude and
+    latitude (the default CRS, OGC:CRS84, i.e. WGS 84 as in EPSG:4326)."""
+    column = {"encoding": "WKB", "geometry_types": ["Point"]}
+    if bbox is not None:
+        column["bbox"] = [float(value) for value in bbox]
+    metadata = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": column},
+    }
+    return {b"geo": json.dumps(metadata).encode("utf-8")}
+
+
+def to_geo_table(data):
+    """Arrow table with a `geometry` column of WKB points created from the
+    `longitude` and `latitude` of the occurrences (a list or a DataFrame; an
+    existing `geometry` column is replaced)."""
+    if HAS_PANDAS and isinstance(data, DataFrame):
+        longitudes, latitudes = data["longitude"], data["latitude"]
+        if "geometry" in data.columns:
+            data = DataFrame(data.drop(columns="geometry"))
+    else:
+        if data and is_record(data[0]):
+            data = to_dicts(data)
+        longitudes = [item.get("longitude") for item in data]
+        latitudes = [item.get("latitude") for item in data]
+
+    table = to_table(data)
+    geometry = points(longitudes, latitudes)
+    table = table.append_column("geometry", geometry)
+
+    x, y = coordinates(longitudes), coordinates(latitudes)
+    bbox = None
+    if len(x) and not numpy.isnan(x).all():
+        bbox = (
+            numpy.nanmin(x),
+            numpy.nanmin(y),
+            numpy.nanmax(x),
+            numpy.nanmax(y),
+        )
+    return table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), **geo_metadata(bbox)}
+    )
+
+
+def write_geoparquet(data, path):
+    """Writes occurrences (a list, a DataFrame or a GeoDataFrame) as a
+    GeoParquet file, without creating geometry objects."""
+    if not HAS_PYARROW:
+        raise MissingPyArrowError("GeoParquet")
+    parquet.write_table(to_geo_table(data), str(path))
@@ -0,0 +1,157 @@
+import gzip
+import json
+from asyncio import sleep
+from base64 import b64decode, b64encode
+from collections import defaultdict
+from pathlib import Path
+from time import monotonic
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+
+from crossfire.errors import CrossfireError
+
+REDACTED = "REDACTED"
+SENSITIVE_HEADERS = {"authorization", "cookie", "set-cookie"}
+# the body is stored decoded, so these headers would not match it anymore
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class UnrecordedRequestError(CrossfireError):
+    def __init__(self, method, url):
+        message = f"No recorded response for {method} {url} in the cassette"
+        super().__init__(message)
+
+
+def _key(method, url):
+    """Identifies requests regardless of the order of query parameters."""
+    url = httpx.URL(str(url))
+    query = urlencode(sorted(parse_qsl(url.query.decode())))
+    return method, str(url.copy_with(query=query.encode() or None))
+
+
+def _headers(headers):
+    return [
+        (name, REDACTED if name.lower() in SENSITIVE_HEADERS else value)
+        for name, value in headers.multi_items()
+        if name.lower() not in DROPPED_HEADERS
+    ]
+
+
+def _body(content):
+    """Bodies are stored as text when possible, so cassettes can be read (and
+    compress better); anything else is base64 encoded."""
+    try:
+        return {"body": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_base64": b64encode(content).decode("ascii")}
+
+
+def _content(interaction):
+    if "body_base64" in interaction:
+        return b64decode(interaction["body_base64"])
+    return interaction["body"].encode("utf-8")
+
+
+def _redact_login(body):
+    """Access tokens are replaced: a replayed client does not need a valid
+    one."""
+    try:
+        contents = json.loads(body)
+        contents["data"]["accessToken"] = REDACTED
+        return json.dumps(contents).encode("utf-8")
+    except (ValueError, KeyError, TypeError):
+        return body
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Forwards requests to `transport` (the network, by default) and records
+    each exchange (URL, headers, body, status and timing) in a gzipped JSON
+    lines cassette at `path`. Credentials and tokens are not recorded."""
+
+    def __init__(self, path, transport=None):
+        self.path = Path(path).expanduser()
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.started = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(b"")
+
+    async def handle_async_request(self, request):
+        start = monotonic()
+        if self.started is None:
+            self.started = start
+
+        response = await self.transport.handle_async_request(request)
+        content = await response.aread()
+        elapsed = monotonic() - start
+
+        body = content
+        if request.url.path.endswith("/auth/login"):
+            body = _redact_login(content)
+        self.save(
+            {
+                "method": request.method,
+                "url": str(request.url),
+                "request_headers": _headers(request.headers),
+                "status_code": response.status_code,
+                "headers": _headers(response.headers),
+                **_body(body),
+                "offset": start - self.started,
+                "elapsed": elapsed,
+            }
+        )
+        return httpx.Response(
+            response.status_code,
+            headers=_headers(response.headers),
+            content=content,
+            request=request,
+        )
+
+    def save(self, interaction):
+        # appending creates a multi-member gzip file, which is still valid
+        with gzip.open(self.path, "at", encoding="utf-8") as cassette:
+            cassette.write(json.dumps(interaction) + "\n")
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def load(path):
+    """Returns the interactions recorded in a cassette."""
+    with gzip.open(Path(path).expanduser(), "rt", encoding="utf-8") as cassette:
+        return [json.loads(line) for line in cassette if line.strip()]
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Answers requests with the responses recorded in a cassette, without
+    network access. Identical requests get their recorded responses in
+    order (the last one is repeated if there are more requests than
+    recordings). With `latency`, responses are delayed by the time they
+    took when recorded, multiplied by `latency` if it is a number."""
+
+    def __init__(self, path, latency=False):
+        self.latency = float(latency)
+        self.interactions = defaultdict(list)
+        for interaction in load(path):
+            key = _key(interaction["method"], interaction["url"])
+            self.interactions[key].append(interaction)
+        self.served = defaultdict(int)
+
+    async def handle_async_request(self, request):
+        key = _key(request.method, request.url)
+        recorded = self.interactions.get(key)
+        if not recorded:
+            raise UnrecordedRequestError(request.method, request.url)
+
+        index = min(self.served[key], len(recorded) - 1)
+        self.served[key] += 1
+        interaction = recorded[index]
+        if self.latency:
+            await sleep(interaction["elapsed"] * self.latency)
+
+        return httpx.Response(
+            interaction["status_code"],
+            headers=interaction["headers"],
+            content=_content(interaction),
+            request=request,
+        )
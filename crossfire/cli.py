@@ -0,0 +1,124 @@
+import re
+import sys
+from argparse import ArgumentParser, ArgumentTypeError
+from asyncio import run
+
+from crossfire.clients import AsyncClient
+from crossfire.clients.occurrences import TYPE_OCCURRENCES
+from crossfire.errors import CrossfireError
+from crossfire.export import WRITERS, export
+
+UUID = re.compile(r"^[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}$", re.I)
+
+
+def page_size(value):
+    if value == "auto":
+        return value
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if size < 1:
+        raise ArgumentTypeError("must be a positive integer or `auto`")
+    return size
+
+
+def parser():
+    parser = ArgumentParser(
+        prog="crossfire",
+        description="Download data from the Fogo Cruzado API.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser(
+        "export",
+        help="stream occurrences to a file",
+        description=(
+            "Streams occurrences to a file as pages arrive. Credentials are "
+            "read from FOGOCRUZADO_EMAIL and FOGOCRUZADO_PASSWORD."
+        ),
+    )
+    command.add_argument("--state", required=True, help="state id or name")
+    command.add_argument(
+        "--city",
+        action="append",
+        dest="cities",
+        help="city id or name (can be repeated)",
+    )
+    command.add_argument(
+        "--type",
+        default="all",
+        choices=sorted(TYPE_OCCURRENCES),
+        dest="type_occurrence",
+    )
+    command.add_argument("--from", dest="initial_date", help="YYYY-MM-DD")
+    command.add_argument("--to", dest="final_date", help="YYYY-MM-DD")
+    command.add_argument("--format", default="ndjson", choices=WRITERS)
+    command.add_argument("-o", "--output", required=True)
+    command.add_argument(
+        "--concurrency",
+        type=int,
+        help="maximum number of parallel requests",
+    )
+    command.add_argument(
+        "--page-size",
+        type=page_size,
+        help="occurrences per page, or `auto`",
+    )
+    command.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted export to the same file",
+    )
+    command.add_argument(
+        "--quiet", action="store_true", help="do not show a progress bar"
+    )
+    return parser
+
+
+async def resolve(client, value, kind, parent=None):
+    """Accepts ids as they are and resolves names with the gazetteer."""
+    if UUID.match(value):
+        return value
+
+    gazetteer = await client.gazetteer()
+    place_id = gazetteer.resolve(value, kind=kind, parent=parent)
+    if place_id is None:
+        raise CrossfireError(f"Could not find a single {kind} named `{value}`")
+    return place_id
+
+
+async def export_command(args):
+    async with AsyncClient(progress=not args.quiet) as client:
+        id_state = await resolve(client, args.state, "state")
+        id_cities = [
+            await resolve(client, city, "city", id_state)
+            for city in args.cities or ()
+        ]
+        return await export(
+            client,
+            args.output,
+            format=args.format,
+            page_size=args.page_size,
+            max_parallel_requests=args.concurrency,
+            resume=args.resume,
+            id_state=id_state,
+            id_cities=id_cities or None,
+            type_occurrence=args.type_occurrence,
+            initial_date=args.initial_date,
+            final_date=args.final_date,
+        )
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    try:
+        run(export_command(args))
+    except CrossfireError as error:
+        print(f"crossfire: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
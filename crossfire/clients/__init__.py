@@ -1,14 +1,43 @@
-from asyncio import get_event_loop
-from datetime import datetime, timedelta
+import json
+from asyncio import (
+    CancelledError,
+    Lock,
+    create_task,
+    gather,
+    get_event_loop,
+    get_running_loop,
+    shield,
+    sleep,
+    wait,
+)
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from datetime import date, timedelta
+from hashlib import sha256
 from urllib.parse import urlencode
 
 import httpx
 from decouple import UndefinedValueError, config
 from nest_asyncio import apply
 
-from crossfire.clients.occurrences import Occurrences
+from crossfire.aggregate import Aggregation
+from crossfire.clients.occurrences import Occurrences, UnsupportedOptionError
+from crossfire.clients.ratelimit import HostRateLimiter
+from crossfire.clients.reference import ReferenceData
+from crossfire.clients.scheduler import Scheduler
+from crossfire.clients.tokens import Token, TokenStore
+from crossfire.clients.tuning import PageSizeTuner
 from crossfire.errors import CrossfireError, RetryAfterError
-from crossfire.parser import parse_response
+from crossfire.events import Events, TqdmProgress
+from crossfire.gazetteer import Gazetteer
+from crossfire.logger import Logger
+from crossfire.metrics import Metrics
+from crossfire.parser import Metadata, convert, parse_response
+from crossfire.profiling import Profile, stage
+from crossfire.records import City, State
+
+logger = Logger(__name__)
 
 
 class CredentialsNotFoundError(CrossfireError):
@@ -21,19 +50,23 @@ class IncorrectCredentialsError(CrossfireError):
     pass
 
 
-class Token:
-    def __init__(self, value, expires_in):
-        self.value = value
-        self.valid_until = datetime.now() + timedelta(seconds=expires_in)
-
-    def is_valid(self):
-        return datetime.now() < self.valid_until
-
-
 class AsyncClient:
     URL = "https://api-service.fogocruzado.org.br/api/v2"
 
-    def __init__(self, email=None, password=None, max_parallel_requests=None):
+    def __init__(
+        self,
+        email=None,
+        password=None,
+        max_parallel_requests=None,
+        transport=None,
+        progress=True,
+        cache_ttl=None,
+        cache_path=None,
+        parse_workers=None,
+        token_cache=None,
+        rate_limit=None,
+        profile=False,
+    ):
         try:
             email = email or config("FOGOCRUZADO_EMAIL")
         except UndefinedValueError:
@@ -45,17 +78,85 @@ class AsyncClient:
             raise CredentialsNotFoundError("FOGOCRUZADO_PASSWORD")
 
         self.max_parallel_requests = max_parallel_requests
-        self.client = httpx.AsyncClient(default_encoding="utf-8")
+        # with `max_parallel_requests`, the client never makes more requests
+        # at once; otherwise each query is limited by its own argument
+        self.scheduler = Scheduler(
+            max_parallel_requests or Occurrences.MAX_PARALLEL_REQUESTS,
+            fixed=bool(max_parallel_requests),
+        )
+        self.client = httpx.AsyncClient(
+            default_encoding="utf-8", transport=transport
+        )
         self.credentials = {"email": email, "password": password}
         self.cached_token = None
+        self.token_lock = None
+        self.profile = Profile() if profile else None
+        self.rate_limiter = HostRateLimiter.from_value(rate_limit)
+        self.token_store = None
+        if token_cache:
+            directory = None if token_cache is True else token_cache
+            self.token_store = TokenStore(email, directory)
+        self.metrics = Metrics()
+        self.requests_in_flight = {}
+        self.request_waiters = Counter()
+        self.page_counts = {}  # last number of pages per query shape
+        self.item_counts = {}  # last number of records per query shape
+        self.page_size_tuner = PageSizeTuner()
+        self.events = Events()
+        if progress:
+            self.events.subscribe(TqdmProgress())
+
+        self.cache_ttl = cache_ttl
+        self.cache_path = cache_path
+        self.parse_workers = parse_workers
+        self.pool = None
+        self.reference = None
+        self.reference_lock = None
+        self.cached_gazetteer = None
+
+    def endpoint(self, url):
+        """Returns the path of `url` relative to the API URL, used to label
+        metrics."""
+        path = str(url).split("?", 1)[0]
+        if path.startswith(self.URL):
+            return path[len(self.URL) :] or "/"
+        return path
 
     async def token(self):
+        """Returns a valid access token, logging in only if needed. With
+        `token_cache`, tokens saved by other processes are reused, and only
+        one process at a time logs in."""
         if self.cached_token and self.cached_token.is_valid():
             return self.cached_token.value
 
-        resp = await self.client.post(
-            f"{self.URL}/auth/login", json=self.credentials
-        )
+        if self.token_lock is None:
+            self.token_lock = Lock()
+
+        async with self.token_lock:
+            if self.cached_token and self.cached_token.is_valid():
+                return self.cached_token.value
+
+            if self.token_store is None:
+                self.cached_token = await self.login()
+                return self.cached_token.value
+
+            async with self.token_store.lock:
+                token = self.token_store.load()
+                if token is None:
+                    token = await self.login()
+                    self.token_store.save(token)
+                self.cached_token = token
+            return self.cached_token.value
+
+    async def login(self):
+        self.metrics.token_refresh()
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+        with self.metrics.track("/auth/login") as track:
+            resp = await self.client.post(
+                f"{self.URL}/auth/login", json=self.credentials
+            )
+            track(resp)
 
         if resp.status_code == 401:
             data = resp.json()
@@ -65,16 +166,77 @@ class AsyncClient:
             resp.raise_for_status()
 
         data = resp.json()
-        self.cached_token = Token(
-            data["data"]["accessToken"], data["data"]["expiresIn"]
-        )
-        return self.cached_token.value
+        return Token(data["data"]["accessToken"], data["data"]["expiresIn"])
 
     async def get(self, *args, **kwargs):
         """Wraps `httpx.get` to inject the authorization header. Also, accepts the
-        `format` argument consumed by the `parse_response` decorator."""
+        `format` and `record` arguments consumed by the `parse_response`
+        decorator. Identical concurrent requests (same URL and headers) share a
+        single HTTP request."""
         format = kwargs.pop("format", None)
-        token = await self.token()
+        record = kwargs.pop("record", None)
+        response = await self.coalesced_request(*args, **kwargs)
+        return parse_response(response, format=format, record=record)
+
+    def executor(self):
+        """Process pool used to parse occurrences pages when `parse_workers`
+        is set (`True` uses one process per CPU)."""
+        if self.pool is None:
+            workers = None if self.parse_workers is True else self.parse_workers
+            self.pool = ProcessPoolExecutor(workers)
+        return self.pool
+
+    async def aclose(self):
+        """Closes the HTTP connections and shuts the worker processes down."""
+        await self.client.aclose()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def coalesced_request(self, *args, **kwargs):
+        url = args[0] if args else kwargs.get("url", "")
+        if len(args) > 1 or kwargs.keys() - {"url", "headers"}:
+            return await self.request(*args, **kwargs)
+
+        headers = tuple(sorted((kwargs.get("headers") or {}).items()))
+        key = (id(get_running_loop()), str(url), headers)
+        task = self.requests_in_flight.get(key)
+        if task is None:
+            task = create_task(self.request(*args, **kwargs))
+            self.requests_in_flight[key] = task
+
+            def forget(task):
+                if self.requests_in_flight.get(key) is task:
+                    del self.requests_in_flight[key]
+
+            task.add_done_callback(forget)
+        else:
+            self.metrics.coalesce(self.endpoint(url))
+
+        # a waiter being cancelled must not cancel the request for the others,
+        # but the request is cancelled when nobody is waiting for it anymore
+        self.request_waiters[key] += 1
+        try:
+            return await shield(task)
+        except CancelledError:
+            if self.request_waiters[key] == 1:
+                task.cancel()
+                await wait((task,))
+            raise
+        finally:
+            self.request_waiters[key] -= 1
+            if not self.request_waiters[key]:
+                del self.request_waiters[key]
+
+    async def request(self, *args, **kwargs):
+        with stage("token", cpu=False):
+            token = await self.token()
         auth = {"Authorization": f"Bearer {token}"}
 
         if "headers" not in kwargs:
@@ -82,28 +244,101 @@ class AsyncClient:
         else:
             kwargs["headers"].update(auth)
 
-        response = await self.client.get(*args, **kwargs)
+        url = args[0] if args else kwargs.get("url", "")
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+        with self.metrics.track(self.endpoint(url)) as track:
+            with stage("network", cpu=False):
+                response = await self.client.get(*args, **kwargs)
+            track(response)
+
         if response.status_code == 429:
             try:
                 wait = int(response.headers.get("retry-after") or 1)
             except ValueError:
                 wait = 1
+            if self.rate_limiter:  # every process on the host waits
+                await self.rate_limiter.pause(wait)
             raise RetryAfterError(wait)
 
         response.raise_for_status()
-        return parse_response(response, format=format)
+        return response
+
+    async def reference_data(self):
+        """Returns states and cities from the cache, loading them from the
+        cache file or from the API (one request per state) when the cache is
+        empty or older than `cache_ttl` seconds."""
+        if self.reference and self.reference.is_fresh(self.cache_ttl):
+            return self.reference
+
+        if self.reference_lock is None:
+            self.reference_lock = Lock()
+
+        async with self.reference_lock:
+            if self.reference and self.reference.is_fresh(self.cache_ttl):
+                return self.reference
+
+            if self.cache_path:
+                cached = ReferenceData.load(self.cache_path)
+                if cached and cached.is_fresh(self.cache_ttl):
+                    self.reference = cached
+                    return cached
+
+            states, _ = await self.get(f"{self.URL}/states")
+            requests = (
+                self.get(f"{self.URL}/cities?{urlencode({'stateId': s['id']})}")
+                for s in states
+            )
+            cities = []
+            for state, (data, _) in zip(states, await gather(*requests)):
+                for city in data:
+                    city.setdefault("state", state)
+                    cities.append(city)
+
+            self.reference = ReferenceData(states, cities)
+            if self.cache_path:
+                self.reference.save(self.cache_path)
+            return self.reference
+
+    async def gazetteer(self):
+        """Returns a `Gazetteer` with states and cities, built from the same
+        data as the states and cities cache (without `cache_ttl` it is loaded
+        only once). Places from occurrences can be added to it with
+        `add_occurrences`, and are kept when the cache is refreshed."""
+        reference = await self.reference_data()
+        gazetteer = self.cached_gazetteer
+        if gazetteer is None or gazetteer.reference is not reference:
+            gazetteer = Gazetteer.from_reference(
+                reference.states, reference.cities, previous=gazetteer
+            )
+            gazetteer.reference = reference
+            self.cached_gazetteer = gazetteer
+        return gazetteer
 
     async def states(self, format=None):
-        return await self.get(f"{self.URL}/states", format=format)
+        if self.cache_ttl:
+            reference = await self.reference_data()
+            states = convert(deepcopy(reference.states), format, State)
+            return states, Metadata.from_response({})
+
+        return await self.get(f"{self.URL}/states", format=format, record=State)
 
     async def cities(
         self, city_id=None, city_name=None, state_id=None, format=None
     ):
+        if self.cache_ttl:
+            reference = await self.reference_data()
+            cities = reference.find_cities(city_id, city_name, state_id)
+            cities = convert(deepcopy(cities), format, City)
+            return cities, Metadata.from_response({})
+
         params = {"cityId": city_id, "cityName": city_name, "stateId": state_id}
         cleaned = urlencode(
             {key: value for key, value in params.items() if value}
         )
-        return await self.get(f"{self.URL}/cities?{cleaned}", format=format)
+        return await self.get(
+            f"{self.URL}/cities?{cleaned}", format=format, record=City
+        )
 
     async def occurrences(
         self,
@@ -115,6 +350,14 @@ class AsyncClient:
         max_parallel_requests=None,
         format=None,
         flat=False,
+        prefetch=None,
+        page_size=None,
+        max_memory=None,
+        snapshot=None,
+        timeout=None,
+        max_retries=None,
+        on_error="raise",
+        priority=1,
     ):
         occurrences = Occurrences(
             self,
@@ -127,19 +370,182 @@ class AsyncClient:
             or self.max_parallel_requests,
             format=format,
             flat=flat,
+            prefetch=prefetch,
+            page_size=page_size,
+            max_memory=max_memory,
+            snapshot=snapshot,
+            timeout=timeout,
+            max_retries=max_retries,
+            on_error=on_error,
+            priority=priority,
         )
-        return await occurrences()
+        if self.profile is None:
+            return await occurrences()
+        with self.profile.activate():
+            return await occurrences()
+
+    async def aggregate(self, query, by, metrics=("count",), format=None):
+        """Groups the occurrences matching `query` (a dictionary with the
+        arguments of `occurrences`) by the keys in `by` and totals `metrics`,
+        folding each page as it arrives instead of keeping all occurrences
+        in memory. See `crossfire.aggregate` for the keys and metrics.
+
+        `prefetch`, `snapshot` and `max_memory` are not supported. With
+        `on_error="partial"`, returns the totals and a `FailedPages` report."""
+        for option in ("prefetch", "snapshot", "max_memory"):
+            if query.get(option):
+                raise UnsupportedOptionError(option, "aggregate")
+
+        aggregation = Aggregation(by, metrics)
+        occurrences = Occurrences(
+            self,
+            **{
+                "max_parallel_requests": self.max_parallel_requests,
+                **query,
+                "format": None,
+                "flat": False,
+            },
+        )
+
+        async def fold():
+            async for _, page in occurrences.stream():
+                aggregation.add(page)
+
+        await occurrences.deadline(fold())
+        if occurrences.on_error == "partial":
+            return aggregation(format), occurrences.report()
+        return aggregation(format)
+
+    async def refetch(self, report, max_parallel_requests=None):
+        """Downloads again the pages listed in the report returned by
+        `occurrences(..., on_error="partial")`. Returns the data of these pages
+        and a new report with the ones that failed again."""
+        occurrences = Occurrences.from_params(
+            self,
+            report.params,
+            max_parallel_requests=max_parallel_requests
+            or self.max_parallel_requests,
+            format=report.format,
+            flat=report.flat,
+            max_retries=report.max_retries,
+            on_error="partial",
+        )
+        return await occurrences.refetch(report.pages)
+
+    async def watch(
+        self,
+        id_state,
+        id_cities=None,
+        type_occurrence="all",
+        interval=300,
+        window=7,
+        format=None,
+        backfill=True,
+    ):
+        """Yields occurrences as they are published or updated, checking every
+        `interval` seconds. Each check is a single-record request comparing
+        the last update of the state's data; only when it changes are the
+        occurrences of the last `window` days downloaded, and the ones not
+        seen before (or changed since) are yielded, as dictionaries or as
+        records if `format` is `"records"`. With `backfill=False`, the
+        occurrences already in the window when watching starts are skipped."""
+        if format not in (None, "dict", "records"):
+            raise CrossfireError("`watch` supports only `dict` and `records`")
+
+        seen, last_update = None, None
+        while True:
+            occurrences = Occurrences(
+                self,
+                id_state,
+                id_cities=id_cities,
+                type_occurrence=type_occurrence,
+                initial_date=date.today() - timedelta(days=window),
+                max_parallel_requests=self.max_parallel_requests,
+                progress=False,
+            )
+            data = None
+            try:
+                updated = await occurrences.last_update()
+                if seen is None or updated is None or updated != last_update:
+                    data = await occurrences()
+            except Exception as error:
+                if not is_transient(error):
+                    raise
+                logger.warning(
+                    f"Checking for new occurrences failed, trying again in "
+                    f"{interval}s: {error!r}"
+                )
+
+            if data is not None:
+                fresh = {}
+                for occurrence in data:
+                    contents = json.dumps(occurrence, sort_keys=True)
+                    fingerprint = sha256(contents.encode("utf-8")).digest()
+                    fresh[occurrence["id"]] = fingerprint
+                    if seen is None and not backfill:
+                        continue
+                    if (
+                        seen is None
+                        or seen.get(occurrence["id"]) != fingerprint
+                    ):
+                        yield convert([occurrence], format)[0]
+                # occurrences leaving the window are forgotten
+                seen, last_update = fresh, updated
+            await sleep(interval)
+
+
+def is_transient(error):
+    """Errors worth trying again later: timeouts, network errors, rate limits
+    and server errors."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, RetryAfterError))
 
 
 class Client(AsyncClient):
-    def __init__(self, email=None, password=None, max_parallel_requests=None):
+    def __init__(
+        self,
+        email=None,
+        password=None,
+        max_parallel_requests=None,
+        transport=None,
+        progress=True,
+        cache_ttl=None,
+        cache_path=None,
+        parse_workers=None,
+        token_cache=None,
+        rate_limit=None,
+        profile=False,
+    ):
         super().__init__(
             email=email,
             password=password,
             max_parallel_requests=max_parallel_requests,
+            transport=transport,
+            progress=progress,
+            cache_ttl=cache_ttl,
+            cache_path=cache_path,
+            parse_workers=parse_workers,
+            token_cache=token_cache,
+            rate_limit=rate_limit,
+            profile=profile,
         )
         apply()
 
+    def close(self):
+        loop = get_event_loop()
+        loop.run_until_complete(self.aclose())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def gazetteer(self):
+        loop = get_event_loop()
+        return loop.run_until_complete(super().gazetteer())
+
     def states(self, format=None):
         loop = get_event_loop()
         states, _ = loop.run_until_complete(super().states(format=format))
@@ -167,6 +573,14 @@ class Client(AsyncClient):
         max_parallel_requests=None,
         format=None,
         flat=False,
+        prefetch=None,
+        page_size=None,
+        max_memory=None,
+        snapshot=None,
+        timeout=None,
+        max_retries=None,
+        on_error="raise",
+        priority=1,
     ):
         loop = get_event_loop()
         occurrences = loop.run_until_complete(
@@ -179,6 +593,26 @@ class Client(AsyncClient):
                 max_parallel_requests=max_parallel_requests,
                 format=format,
                 flat=flat,
+                prefetch=prefetch,
+                page_size=page_size,
+                max_memory=max_memory,
+                snapshot=snapshot,
+                timeout=timeout,
+                max_retries=max_retries,
+                on_error=on_error,
+                priority=priority,
             )
         )
         return occurrences
+
+    def aggregate(self, query, by, metrics=("count",), format=None):
+        loop = get_event_loop()
+        return loop.run_until_complete(
+            super().aggregate(query, by, metrics=metrics, format=format)
+        )
+
+    def refetch(self, report, max_parallel_requests=None):
+        loop = get_event_loop()
+        return loop.run_until_complete(
+            super().refetch(report, max_parallel_requests=max_parallel_requests)
+        )
@@ -1,10 +1,23 @@
+import json
 import re
-from asyncio import Semaphore, gather, sleep
+from asyncio import (
+    FIRST_EXCEPTION,
+    Queue,
+    Semaphore,
+    create_task,
+    get_running_loop,
+    sleep,
+    wait,
+    wait_for,
+)
+from asyncio import TimeoutError as AsyncTimeoutError
 from datetime import date, datetime
+from hashlib import sha256
+from pathlib import Path
+from time import perf_counter
 from urllib.parse import urlencode
 
-from httpx import ReadTimeout
-from tqdm import tqdm
+from httpx import Headers, ReadTimeout
 
 from crossfire.errors import NestedColumnError
 
@@ -15,25 +28,32 @@ try:
 except ImportError:
     HAS_PANDAS = False
 
-
-try:
-    from geopandas import GeoDataFrame
-
-    HAS_GEOPANDAS = True
-except ImportError:
-    HAS_GEOPANDAS = False
-
+from crossfire.arrow import (
+    HAS_PYARROW,
+    MissingPyArrowError,
+    Spill,
+    parse_size,
+    read_snapshot,
+    to_table,
+    write_snapshot,
+)
+from crossfire.clients.scheduler import PriorityError, is_priority
 from crossfire.errors import (
     CrossfireError,
     DateFormatError,
     DateIntervalError,
+    DeadlineExceededError,
     RetryAfterError,
 )
 from crossfire.logger import Logger
+from crossfire.parser import HAS_GEOPANDAS, parse_content, to_geo_dataframe
+from crossfire.profiling import stage
+from crossfire.records import is_record, to_dicts, to_records
 
 logger = Logger(__name__)
 
 TYPE_OCCURRENCES = {"all", "withVictim", "withoutVictim"}
+ON_ERROR = ("raise", "partial")
 NOT_NUMBER = re.compile("\D")
 NESTED_COLUMNS = {
     "contextInfo",
@@ -58,6 +78,38 @@ def date_formatter(date_parameter):
     return date_cleaned
 
 
+def is_page_size(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+async def wait_all(tasks):
+    """Like `asyncio.gather`, but raises as soon as a task fails, leaving the
+    remaining tasks to be cancelled by the caller."""
+    tasks = list(tasks)
+    done, _ = await wait(tasks, return_when=FIRST_EXCEPTION)
+    for task in done:
+        if not task.cancelled() and task.exception():
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+async def cancel(tasks):
+    """Cancels tasks and waits for them to finish, so none keeps requests or
+    retries running in the background."""
+    tasks = list(tasks)
+    for task in tasks:
+        discard(task)
+    if pending := [task for task in tasks if not task.done()]:
+        await wait(pending)
+
+
+def discard(task):
+    """Cancels a task whose result is not needed anymore. If it is already
+    done, its exception (if any) is retrieved so asyncio does not log it."""
+    if not task.cancel() and not task.cancelled():
+        task.exception()
+
+
 class UnknownTypeOccurrenceError(CrossfireError):
     def __init__(self, type_occurrence):
         message = (
@@ -67,6 +119,59 @@ class UnknownTypeOccurrenceError(CrossfireError):
         super().__init__(message)
 
 
+class UnknownOnErrorError(CrossfireError):
+    def __init__(self, on_error):
+        message = (
+            f"Unknown on_error `{on_error}`. "
+            f"Valid values are: {', '.join(ON_ERROR)}"
+        )
+        super().__init__(message)
+
+
+class FailedPages:
+    """Report of the pages of a query that could not be downloaded, with the
+    last error of each one. Hand it to `AsyncClient.refetch` to try these
+    pages again."""
+
+    def __init__(self, params, format, flat, max_retries, errors):
+        self.params = dict(params)
+        self.format = format
+        self.flat = flat
+        self.max_retries = max_retries
+        self.errors = dict(errors)
+
+    @property
+    def pages(self):
+        return sorted(self.errors)
+
+    def __bool__(self):
+        return bool(self.errors)
+
+    def __len__(self):
+        return len(self.errors)
+
+    def __repr__(self):
+        return f"<FailedPages {self.pages}>"
+
+
+class UnsupportedOptionError(CrossfireError):
+    def __init__(self, option, caller):
+        message = (
+            f"`{option}` is not supported by `{caller}`, which processes pages "
+            "as they arrive"
+        )
+        super().__init__(message)
+
+
+class PageSizeError(CrossfireError):
+    def __init__(self, page_size):
+        message = (
+            f"Invalid page_size `{page_size}`. "
+            "Use a positive integer or `'auto'`."
+        )
+        super().__init__(message)
+
+
 class Occurrences:
     MAX_PARALLEL_REQUESTS = 16
 
@@ -81,13 +186,44 @@ class Occurrences:
         max_parallel_requests=None,
         format=None,
         flat=False,
+        prefetch=None,
+        page_size=None,
+        max_memory=None,
+        snapshot=None,
+        timeout=None,
+        max_retries=None,
+        on_error="raise",
+        priority=1,
+        progress=True,
     ):
         if type_occurrence not in TYPE_OCCURRENCES:
             raise UnknownTypeOccurrenceError(type_occurrence)
+        if on_error not in ON_ERROR:
+            raise UnknownOnErrorError(on_error)
+        if max_memory and format == "geodf":
+            raise CrossfireError("`max_memory` does not support `geodf` format")
+        if page_size not in (None, "auto") and not is_page_size(page_size):
+            raise PageSizeError(page_size)
+        if not is_priority(priority):
+            raise PriorityError(priority)
 
         self.client = client
         self.format = format
+        # pages of GeoDataFrames are requested as DataFrames, and geometries
+        # are created once all pages are together
+        self.page_format = "df" if format == "geodf" else format
         self.flat = flat
+        self.prefetch = prefetch
+        self.max_memory = parse_size(max_memory) if max_memory else None
+        self.snapshot = snapshot
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.on_error = on_error
+        self.priority = priority
+        self.progress = progress  # whether progress bars show this query
+        self.failures = {}
+        if snapshot and not HAS_PYARROW:
+            raise MissingPyArrowError("`snapshot`")
         self.params = {"idState": id_state, "typeOccurrence": type_occurrence}
         if id_cities:
             self.params["idCities"] = id_cities
@@ -100,88 +236,398 @@ class Occurrences:
         if initial_date and final_date and initial_date > final_date:
             raise DateIntervalError(initial_date, final_date)
 
-        self.semaphore = Semaphore(
-            max_parallel_requests or self.MAX_PARALLEL_REQUESTS
-        )
+        self.parallel = max_parallel_requests or self.MAX_PARALLEL_REQUESTS
+        self.semaphore = Semaphore(self.parallel)
         self.total_pages = None
-        self.progress_bar = None
+        self.item_count = None
+
+        self.auto_page_size = page_size == "auto"
+        if page_size and not self.auto_page_size:
+            self.params["take"] = page_size
+
+    @classmethod
+    def from_params(cls, client, params, **kwargs):
+        """Creates a query from the `params` of another one, as sent to the
+        API (including `take`)."""
+        query = cls(client, params["idState"], **kwargs)
+        query.params = dict(params)
+        return query
+
+    @property
+    def shape(self):
+        """Key identifying queries expected to have the same number of pages."""
+        return urlencode(self.params, doseq=True)
+
+    @property
+    def filters(self):
+        """Key identifying queries expected to have the same number of
+        records, regardless of the page size."""
+        params = {k: v for k, v in self.params.items() if k != "take"}
+        return urlencode(params, doseq=True)
+
+    def choose_page_size(self):
+        """Sets `take` to the page size suggested by the client's tuner for
+        the number of records the last query with the same filters had."""
+        total = self.client.item_counts.get(self.filters)
+        tuner = self.client.page_size_tuner
+        self.params["take"] = tuner.suggest(total, self.parallel)
+
+    def speculative_pages(self):
+        """Number of pages requested before knowing how many pages there are:
+        the `prefetch` hint or, if `prefetch` is `True`, the number of pages
+        of the last query with the same shape."""
+        if self.prefetch is True:
+            return self.client.page_counts.get(self.shape, 1)
+        return max(self.prefetch or 1, 1)
+
+    @property
+    def parsed_in_workers(self):
+        """Whether pages are parsed in the client's worker processes. Only
+        DataFrames are worth it: their columns are sent back to the main
+        process as compact arrays, while sending back lists of dictionaries or
+        records costs about as much as parsing them."""
+        return bool(self.client.parse_workers and self.page_format == "df")
+
+    @property
+    def flat_pages(self):
+        """Whether pages are flattened as they are parsed, in worker
+        processes."""
+        return self.flat and self.parsed_in_workers
+
+    async def fetch(self, url):
+        """Requests and parses a page. If the client has `parse_workers`,
+        decoding, conversion to a DataFrame and flattening run in its process
+        pool."""
+        if not self.parsed_in_workers:
+            return await self.client.get(url, format=self.page_format)
+
+        response = await self.client.coalesced_request(url)
+        with stage("workers", cpu=False):
+            return await get_running_loop().run_in_executor(
+                self.client.executor(),
+                parse_page,
+                response.content,
+                response.headers.multi_items(),
+                self.page_format,
+                self.flat_pages,
+            )
 
-    async def page(self, number):
-        params = self.params.copy()
+    async def request(self, number, params=None, attempt=0):
+        """Requests page `number` of the query (or of `params`, if given)
+        within the query's concurrency limits, retrying after timeouts and
+        rate limits up to `max_retries` times. Returns the data, the metadata
+        and the duration of the successful request."""
+        params = {**(self.params if params is None else params)}
         params["page"] = number
         query = urlencode(params, doseq=True)
         url = f"{self.client.URL}/occurrences?{query}"
 
         failed = False
-        async with self.semaphore:
+        with stage("queue", cpu=False):
+            await self.semaphore.acquire()
             try:
-                occurrences, metadata = await self.client.get(
-                    url, format=self.format
-                )
+                self.client.scheduler.grow(self.parallel)
+                await self.client.scheduler.acquire(self, self.priority)
+            except BaseException:
+                self.semaphore.release()
+                raise
+        try:
+            self.client.events.emit("page_started", query=self, page=number)
+            try:
+                start = perf_counter()
+                occurrences, metadata = await self.fetch(url)
+                elapsed = perf_counter() - start
             except (ReadTimeout, RetryAfterError) as err:
-                failed = True
+                failed, error = True, err
                 wait = getattr(err, "retry_after", 1)
+        finally:
+            self.client.scheduler.release()
+            self.semaphore.release()
 
         if failed:
+            if self.max_retries is not None and attempt >= self.max_retries:
+                raise error
+            self.client.metrics.retry("/occurrences")
+            self.client.events.emit(
+                "page_retried", query=self, page=number, wait=wait, error=error
+            )
             logger.debug(
                 f"Too many requests. Waiting {wait}s before retrying page {number}"
             )
-            await sleep(wait)
-            return await self.page(number)
+            with stage("retry", cpu=False):
+                await sleep(wait)
+            return await self.request(number, params, attempt + 1)
+
+        return occurrences, metadata, elapsed
 
+    async def page(self, number):
+        occurrences, metadata, elapsed = await self.request(number)
+        if self.auto_page_size:
+            self.client.page_size_tuner.observe(
+                self.params["take"], metadata, len(occurrences), elapsed
+            )
+        self.client.events.emit("page_finished", query=self, page=number)
         if not self.total_pages:
             self.total_pages = metadata.page_count
-            self.progress_bar.total = metadata.page_count
+            self.item_count = metadata.item_count
+            self.client.events.emit(
+                "query_planned", query=self, total_pages=self.total_pages
+            )
 
-        self.progress_bar.update(1)
         return occurrences
 
+    async def attempt(self, number):
+        """Same as `page`, but with `on_error="partial"` failures are recorded
+        in `failures` and `None` is returned instead of raising."""
+        try:
+            return await self.page(number)
+        except Exception as error:
+            if self.on_error != "partial":
+                raise
+            logger.warning(f"Giving up on page {number}: {error!r}")
+            self.failures[number] = error
+            return None
+
+    def report(self):
+        return FailedPages(
+            self.params, self.format, self.flat, self.max_retries, self.failures
+        )
+
     async def __call__(self):
-        self.progress_bar = tqdm(desc="Loading pages", unit="page")
+        """Runs the query. With `timeout`, pending requests are cancelled and
+        `DeadlineExceededError` is raised once the deadline passes. With
+        `on_error="partial"`, returns the data and a `FailedPages` report."""
+        data = await self.deadline(self.run())
+        if self.on_error == "partial":
+            return data, self.report()
+        return data
+
+    async def deadline(self, awaitable):
+        """Awaits `awaitable`, cancelling it and raising
+        `DeadlineExceededError` once `timeout` passes."""
+        if self.timeout is None:
+            return await awaitable
+        try:
+            return await wait_for(awaitable, self.timeout)
+        except AsyncTimeoutError:
+            raise DeadlineExceededError(self.timeout)
+
+    async def refetch(self, numbers):
+        """Downloads only the pages `numbers`, e.g. the ones that failed in a
+        previous query. Returns the data (`None` if all pages failed again)
+        and a `FailedPages` report."""
+        tasks = [create_task(self.attempt(number)) for number in numbers]
+        try:
+            pages = await wait_all(tasks)
+        finally:
+            await cancel(tasks)
+            self.client.events.emit("query_done", query=self)
+
+        data = Accumulator().merge(*pages)()
+        return None if data is None else self.finish(data), self.report()
+
+    async def run(self):
+        if self.snapshot:
+            return await self.cached()
+        return await self.download()
+
+    async def last_update(self):
+        """Timestamp of the last update of the data, from a single-record
+        request (retried as pages are)."""
+        _, metadata, _ = await self.request(1, {**self.params, "take": 1})
+        return (
+            metadata.last_update_state_timestamp
+            or metadata.last_update_timestamp
+        )
 
-        data = Accumulator()
-        data.merge(await self.page(1))
+    def snapshot_key(self):
+        options = {
+            "filters": self.filters,
+            "format": self.format,
+            "flat": self.flat,
+            "max_memory": bool(self.max_memory),
+        }
+        contents = json.dumps(options, sort_keys=True).encode("utf-8")
+        return sha256(contents).hexdigest()[:32]
+
+    async def cached(self):
+        """Loads the result from a snapshot file in the `snapshot` directory,
+        if there is one newer than the last update of the data. Otherwise,
+        downloads the result and saves a snapshot of it."""
+        updated = await self.last_update()
+        if updated is None:
+            logger.debug("No last update information, skipping snapshot")
+            return await self.download()
+
+        directory = Path(self.snapshot).expanduser()
+        key = self.snapshot_key()
+        path = directory / f"occurrences-{key}-{updated}.arrow"
+        if path.exists():
+            return self.from_table(read_snapshot(path))
+
+        data = await self.download()
+        if self.failures:
+            return data
+
+        directory.mkdir(parents=True, exist_ok=True)
+        for outdated in directory.glob(f"occurrences-{key}-*.arrow"):
+            outdated.unlink(missing_ok=True)  # e.g. removed by another process
+        write_snapshot(self.to_table(data), path)
+        return data
 
-        if self.total_pages > 1:
-            requests = tuple(
-                self.page(n) for n in range(2, self.total_pages + 1)
+    def to_table(self, data):
+        if self.format == "geodf":
+            data = DataFrame(data.drop(columns="geometry"))
+        return data if self.max_memory else to_table(data)
+
+    def from_table(self, table):
+        """Converts a snapshot to the format of the query."""
+        if self.max_memory:
+            return table
+        if self.format == "geodf":
+            return to_geo_dataframe(table.to_pandas())
+        if self.format == "df":
+            return table.to_pandas()
+        if self.format == "records":
+            return to_records(table.to_pylist())
+        return table.to_pylist()
+
+    async def download(self):
+        if self.max_memory:
+            return await self.spill()
+
+        if self.auto_page_size:
+            self.choose_page_size()
+
+        tasks = {
+            n: create_task(self.attempt(n))
+            for n in range(2, self.speculative_pages() + 1)
+        }
+        try:
+            data = Accumulator()
+            data.merge(await self.page(1))
+            self.client.page_counts[self.shape] = self.total_pages
+            self.client.item_counts[self.filters] = self.item_count
+
+            for number in tuple(tasks):
+                if number > self.total_pages:
+                    discard(tasks.pop(number))
+            for number in range(2, self.total_pages + 1):
+                if number not in tasks:
+                    tasks[number] = create_task(self.attempt(number))
+
+            if tasks:
+                data.merge(*await wait_all(tasks[n] for n in sorted(tasks)))
+        finally:
+            await cancel(tasks.values())
+            self.client.events.emit("query_done", query=self)
+
+        return self.finish(data())
+
+    async def stream(self, skip=()):
+        """Yields `(page number, page)` pairs as pages arrive, in no particular
+        order, so callers can write them out without holding the whole result
+        in memory: at most `max_parallel_requests` pages are downloaded ahead
+        of the consumer. Pages in `skip` are not yielded (page 1 is requested
+        anyway to learn how many pages there are)."""
+        if self.auto_page_size:
+            self.choose_page_size()
+
+        queue = Queue(self.parallel)
+        workers = []
+        try:
+            first = await self.page(1)
+            self.client.page_counts[self.shape] = self.total_pages
+            self.client.item_counts[self.filters] = self.item_count
+            if 1 not in skip:
+                yield 1, self.finish(first)
+
+            pending = [
+                n for n in range(2, self.total_pages + 1) if n not in skip
+            ]
+            numbers = iter(pending)
+
+            async def worker():
+                for number in numbers:
+                    try:
+                        await queue.put((number, await self.attempt(number)))
+                    except Exception as error:
+                        await queue.put((number, error))
+                        return
+
+            workers.extend(
+                create_task(worker())
+                for _ in range(min(self.parallel, len(pending)))
             )
-            pages = await gather(*requests)
-            data.merge(*pages)
+            for _ in pending:
+                number, page = await queue.get()
+                if isinstance(page, Exception):
+                    raise page
+                if page is not None:
+                    yield number, self.finish(page)
+        finally:
+            await cancel(workers)
+            self.client.events.emit("query_done", query=self)
+
+    def finish(self, data):
+        """Flattens the data, unless pages were flattened in worker processes,
+        and, for the `geodf` format, creates the geometry, in a single
+        vectorized operation for all pages."""
+        if self.flat and not self.flat_pages:
+            with stage("flatten"):
+                data = flatten(data)
+        if self.format == "geodf" and HAS_GEOPANDAS:
+            data = to_geo_dataframe(data)
+        return data
+
+    async def spill(self):
+        """Collects the pages in an Arrow table that does not need to fit in
+        memory (see `crossfire.arrow.Spill`). Pages are appended in order, and
+        pages arriving ahead of earlier ones count toward `max_memory`."""
+        data = Spill(self.max_memory)
+        async for number, page in self.stream():
+            with stage("merge"):
+                for failed in tuple(self.failures):
+                    data.add(failed, None)
+                data.add(number, page)
+        with stage("merge"):
+            return data()
 
-        if self.flat:
-            return flatten(data())
-        return data()
+
+def parse_page(content, headers, format=None, flat=False):
+    """Parses (and flattens) a page in a worker process. Arguments and results
+    are plain picklable objects."""
+    data, metadata = parse_content(content, Headers(headers), format=format)
+    return flatten(data) if flat else data, metadata
 
 
 class Accumulator:
     def __init__(self):
         self.data = None
-        self.is_gdf = False
 
     def save_first(self, *pages):
         self.data, *remaining = pages
-        if HAS_GEOPANDAS and isinstance(self.data, GeoDataFrame):
-            self.is_gdf = True
-        return self if not remaining else self.merge(remaining)
+        return self if not remaining else self.merge(*remaining)
 
     def merge(self, *pages):
+        pages = [page for page in pages if page is not None]
+        if not pages:
+            return self
+
         if self.data is None:
             return self.save_first(*pages)
 
-        if isinstance(self.data, list):
-            for page in pages:
-                self.data.extend(page)
-            return self
+        with stage("merge"):
+            if isinstance(self.data, list):
+                for page in pages:
+                    self.data.extend(page)
+                return self
 
-        dfs = [self.data] + list(pages)
-        self.data = concat(dfs, ignore_index=True)
-        return self
+            dfs = [self.data] + list(pages)
+            self.data = concat(dfs, ignore_index=True)
+            return self
 
     def __call__(self):
-        if self.is_gdf:
-            return GeoDataFrame(self.data)
-
         return self.data
 
 
@@ -266,5 +712,7 @@ def flatten(data, nested_columns=None):
         data = _flatten_df(data, nested_columns)
         return data
 
+    if is_record(data[0]):
+        data = to_dicts(data, skip_none=True)
     data = _flatten_list(data, nested_columns)
     return data
@@ -0,0 +1,96 @@
+import json
+from asyncio import Lock, sleep
+from contextlib import asynccontextmanager
+from pathlib import Path
+from time import time
+
+from crossfire.clients.tokens import cache_directory
+from crossfire.errors import CrossfireError
+from crossfire.filelock import FileLock
+
+
+class RateLimitError(CrossfireError):
+    def __init__(self, rate_limit):
+        message = (
+            f"Invalid rate limit `{rate_limit}`. Use a `(requests, seconds)` "
+            "tuple, such as `(60, 60)`, or a `HostRateLimiter`."
+        )
+        super().__init__(message)
+
+
+class HostRateLimiter:
+    """Token bucket shared by every process on the host using the same
+    `path`: up to `requests` requests every `seconds`, refilled continuously.
+    The state of the bucket lives in a small JSON file updated under a file
+    lock, so clients in different processes draw from the same bucket.
+
+    `pause` stops every process until the given number of seconds has passed,
+    e.g. when one of them gets an HTTP 429 with a `retry-after` header."""
+
+    def __init__(self, requests, seconds=1, path=None):
+        if requests <= 0 or seconds <= 0:
+            raise RateLimitError((requests, seconds))
+        self.capacity = requests
+        self.rate = requests / seconds
+        self.path = Path(path or cache_directory() / "rate-limit.json")
+        self.file_lock = FileLock(f"{self.path}.lock")
+        self.local_lock = None
+
+    @classmethod
+    def from_value(cls, rate_limit):
+        """Accepts a `HostRateLimiter` or a `(requests, seconds)` tuple."""
+        if rate_limit is None or isinstance(rate_limit, cls):
+            return rate_limit
+        try:
+            requests, seconds = rate_limit
+        except (TypeError, ValueError):
+            raise RateLimitError(rate_limit)
+        return cls(requests, seconds)
+
+    @asynccontextmanager
+    async def lock(self):
+        """Coroutines in this process wait for each other before waiting for
+        other processes, since the file lock is not reentrant."""
+        if self.local_lock is None:
+            self.local_lock = Lock()
+        async with self.local_lock:
+            async with self.file_lock:
+                yield
+
+    def read(self, now):
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+            tokens, updated = float(state["tokens"]), float(state["updated"])
+            paused_until = float(state["paused_until"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return self.capacity, 0
+        elapsed = max(0, now - updated)
+        return min(self.capacity, tokens + elapsed * self.rate), paused_until
+
+    def write(self, now, tokens, paused_until):
+        state = {"tokens": tokens, "updated": now, "paused_until": paused_until}
+        with open(self.path, "w") as file:
+            json.dump(state, file)
+
+    async def acquire(self):
+        """Waits until a request can be made and takes a token for it."""
+        while True:
+            async with self.lock():
+                now = time()
+                tokens, paused_until = self.read(now)
+                if now < paused_until:
+                    wait = paused_until - now
+                elif tokens >= 1:
+                    self.write(now, tokens - 1, paused_until)
+                    return
+                else:
+                    wait = (1 - tokens) / self.rate
+                self.write(now, tokens, paused_until)
+            await sleep(wait)
+
+    async def pause(self, seconds):
+        async with self.lock():
+            now = time()
+            tokens, paused_until = self.read(now)
+            self.write(now, tokens, max(paused_until, now + seconds))
@@ -0,0 +1,78 @@
+import json
+from pathlib import Path
+from time import time
+
+from crossfire.logger import Logger
+
+logger = Logger(__name__)
+
+
+class ReferenceData:
+    """States and cities covered by the API, indexed by id and state so
+    lookups do not need network access."""
+
+    def __init__(self, states, cities, fetched_at=None):
+        self.states = states
+        self.cities = cities
+        self.fetched_at = time() if fetched_at is None else fetched_at
+
+        self.states_by_id = {state["id"]: state for state in states}
+        self.cities_by_id = {}
+        self.cities_by_state = {}
+        for city in cities:
+            self.cities_by_id[city["id"]] = city
+            state_id = (city.get("state") or {}).get("id")
+            self.cities_by_state.setdefault(state_id, []).append(city)
+
+    def is_fresh(self, ttl):
+        """Data is fresh for `ttl` seconds, or forever if `ttl` is `None`."""
+        return ttl is None or time() < self.fetched_at + ttl
+
+    def find_cities(self, city_id=None, city_name=None, state_id=None):
+        """Filters cities as the `/cities` endpoint does: names match if they
+        contain `city_name`, ignoring case."""
+        name = city_name.casefold() if city_name else None
+        if city_id:
+            city = self.cities_by_id.get(city_id)
+            candidates = [city] if city else []
+        elif state_id:
+            candidates = self.cities_by_state.get(state_id, [])
+        else:
+            candidates = self.cities
+
+        return [
+            city
+            for city in candidates
+            if (not city_id or city["id"] == city_id)
+            and (not name or name in city["name"].casefold())
+            and (
+                not state_id or (city.get("state") or {}).get("id") == state_id
+            )
+        ]
+
+    def save(self, path):
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        contents = {
+            "fetched_at": self.fetched_at,
+            "states": self.states,
+            "cities": self.cities,
+        }
+        tmp = path.with_suffix(f"{path.suffix}.tmp")
+        tmp.write_text(json.dumps(contents))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads the reference data saved in `path`, returns `None` if the file
+        does not exist or cannot be read."""
+        try:
+            contents = json.loads(Path(path).expanduser().read_text())
+            return cls(
+                contents["states"], contents["cities"], contents["fetched_at"]
+            )
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as error:
+            logger.warning(f"Ignoring invalid reference cache {path}: {error}")
+            return None
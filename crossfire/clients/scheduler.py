@@ -0,0 +1,106 @@
+from asyncio import CancelledError, get_running_loop
+from collections import deque
+
+from crossfire.errors import CrossfireError
+
+
+class PriorityError(CrossfireError):
+    def __init__(self, priority):
+        message = f"Invalid priority `{priority}`. Use a positive number."
+        super().__init__(message)
+
+
+def is_priority(value):
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and value > 0
+    )
+
+
+class Scheduler:
+    """Shares `slots` concurrent requests among the queries of a client.
+    While slots are free, requests start right away; once they are all in
+    use, each freed slot goes to a waiting query chosen by smooth weighted
+    round-robin (as in nginx), with the query's `priority` as its weight. A
+    query with a few pages is not stuck behind the hundreds of pages of a
+    large one, and a query with priority 3 gets three slots for each slot of
+    a query with priority 1 while both are waiting.
+
+    Unless `fixed`, the number of slots grows to the largest number of
+    parallel requests a query asks for (see `grow`)."""
+
+    def __init__(self, slots, fixed=True):
+        self.slots = slots
+        self.fixed = fixed
+        self.in_use = 0
+        self.waiting = {}  # query -> deque of futures, in arrival order
+        self.weights = {}
+        self.credits = {}
+
+    def has_waiters(self):
+        return any(self.waiting.values())
+
+    async def acquire(self, query, priority=1):
+        if self.in_use < self.slots and not self.has_waiters():
+            self.in_use += 1
+            return
+
+        future = get_running_loop().create_future()
+        self.waiting.setdefault(query, deque()).append(future)
+        self.weights[query] = priority
+        self.credits.setdefault(query, 0)
+        try:
+            await future
+        except CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # the slot was handed over, pass it on
+            else:
+                self.waiting[query].remove(future)
+                self.forget(query)
+            raise
+
+    def grow(self, slots):
+        """Raises the number of slots to `slots`, handing the new ones to
+        waiting queries. Does nothing if the number of slots is fixed."""
+        if self.fixed or slots <= self.slots:
+            return
+        self.slots = slots
+        while self.in_use < self.slots:
+            query = self.next_query()
+            if query is None:
+                return
+            future = self.waiting[query].popleft()
+            self.forget(query)
+            self.in_use += 1
+            future.set_result(None)
+
+    def release(self):
+        """Hands the slot over to the next waiting query, if any."""
+        query = self.next_query()
+        if query is None:
+            self.in_use -= 1
+            return
+
+        future = self.waiting[query].popleft()
+        self.forget(query)
+        future.set_result(None)
+
+    def next_query(self):
+        candidates = [query for query, queue in self.waiting.items() if queue]
+        if not candidates:
+            return None
+
+        total = 0
+        for query in candidates:
+            self.credits[query] += self.weights[query]
+            total += self.weights[query]
+        chosen = max(candidates, key=lambda query: self.credits[query])
+        self.credits[chosen] -= total
+        return chosen
+
+    def forget(self, query):
+        if not self.waiting.get(query):
+            self.waiting.pop(query, None)
+            self.weights.pop(query, None)
+            self.credits.pop(query, None)
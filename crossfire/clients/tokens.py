@@ -0,0 +1,64 @@
+import json
+import os
+from datetime import datetime, timedelta
+from hashlib import sha256
+from pathlib import Path
+
+from crossfire.filelock import FileLock
+
+
+def cache_directory():
+    """User cache directory for crossfire (respecting `XDG_CACHE_HOME`)."""
+    root = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(root) / "crossfire"
+
+
+class Token:
+    """Access token. It is treated as expired `MARGIN` before it actually
+    expires, so requests that start right before the expiry (or wait in a
+    queue for a while) do not get HTTP 401."""
+
+    MARGIN = timedelta(seconds=60)
+
+    def __init__(self, value, expires_in):
+        self.value = value
+        self.valid_until = datetime.now() + timedelta(seconds=expires_in)
+
+    def is_valid(self):
+        return datetime.now() < self.valid_until - self.MARGIN
+
+
+class TokenStore:
+    """Access tokens saved in files, so processes using the same credentials
+    reuse a valid token instead of logging in again. There is one file per
+    email, named after its hash, readable only by the user, and a lock file so
+    only one process refreshes an expired token while the others wait for
+    it."""
+
+    def __init__(self, email, directory=None):
+        self.directory = Path(directory or cache_directory()).expanduser()
+        key = sha256(email.encode("utf-8")).hexdigest()[:32]
+        self.path = self.directory / f"token-{key}.json"
+        self.lock = FileLock(self.directory / f"token-{key}.lock")
+
+    def load(self):
+        """Returns the saved token, or `None` if there is no valid one."""
+        try:
+            contents = json.loads(self.path.read_text())
+            token = Token(contents["value"], 0)
+            token.valid_until = datetime.fromtimestamp(contents["valid_until"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return token if token.is_valid() else None
+
+    def save(self, token):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        contents = {
+            "value": token.value,
+            "valid_until": token.valid_until.timestamp(),
+        }
+        tmp = self.path.with_suffix(f"{self.path.suffix}.tmp")
+        descriptor = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(contents, file)
+        tmp.replace(self.path)
@@ -0,0 +1,65 @@
+from collections import deque
+from math import ceil
+
+PAGE_SIZES = (20, 50, 100, 200, 500, 1000)
+
+
+class PageSizeTuner:
+    """Chooses the page size (the `take` parameter) of occurrences queries.
+
+    The time of a request is modeled as a fixed cost plus a cost per record,
+    fitted with least squares to the latencies observed. The largest page size
+    accepted by the server is learnt from the `take` it answers with, since it
+    clamps larger values."""
+
+    def __init__(self, sizes=PAGE_SIZES, window=256):
+        self.sizes = tuple(sorted(sizes))
+        self.max_size = None
+        self.observations = deque(maxlen=window)  # (records, seconds) pairs
+
+    def observe(self, requested, metadata, records, seconds):
+        if metadata.take and metadata.take < requested:
+            self.max_size = metadata.take
+        self.observations.append((records, seconds))
+
+    def model(self):
+        """Returns `(fixed, per_record)` costs in seconds, or `None` if there
+        are not enough observations (at least two different page lengths)."""
+        if len({records for records, _ in self.observations}) < 2:
+            return None
+
+        count = len(self.observations)
+        mean_x = sum(x for x, _ in self.observations) / count
+        mean_y = sum(y for _, y in self.observations) / count
+        covariance = sum(
+            (x - mean_x) * (y - mean_y) for x, y in self.observations
+        )
+        variance = sum((x - mean_x) ** 2 for x, _ in self.observations)
+        per_record = max(covariance / variance, 0)
+        fixed = max(mean_y - per_record * mean_x, 0)
+        return fixed, per_record
+
+    def candidates(self):
+        if self.max_size is None:
+            return self.sizes
+        return tuple(size for size in self.sizes if size < self.max_size) + (
+            self.max_size,
+        )
+
+    def estimate(self, size, total, parallel):
+        """Estimated seconds to download `total` records in pages of `size`
+        with up to `parallel` requests at a time."""
+        fixed, per_record = self.model()
+        rounds = ceil(ceil(total / size) / parallel)
+        return rounds * (fixed + per_record * min(size, total))
+
+    def suggest(self, total=None, parallel=1):
+        """Page size for a query expected to have `total` records. Without a
+        model or an expected total, the largest page size is used."""
+        candidates = self.candidates()
+        if not total or self.model() is None:
+            return candidates[-1]
+        return min(
+            reversed(candidates),
+            key=lambda size: self.estimate(size, total, parallel),
+        )
@@ -31,3 +31,10 @@ class NestedColumnError(CrossfireError):
     def __init__(self, nested_columns):
         message = f"Invalid `nested_columns` value: {nested_columns}"
         super().__init__(message)
+
+
+class DeadlineExceededError(CrossfireError, TimeoutError):
+    def __init__(self, timeout):
+        self.timeout = timeout
+        message = f"Query did not finish within {timeout} seconds"
+        super().__init__(message)
@@ -0,0 +1,94 @@
+from collections import Counter
+
+from tqdm import tqdm
+
+EVENTS = (
+    "page_started",
+    "page_finished",
+    "page_retried",
+    "query_planned",
+    "query_done",
+)
+
+
+class Subscriber:
+    """Base class for objects interested in the progress of occurrences
+    queries. Subscribers do not need to inherit from this class, they only
+    need to implement the methods for the events they care about. All methods
+    receive the `Occurrences` instance as `query`."""
+
+    def on_page_started(self, query, page):
+        pass
+
+    def on_page_finished(self, query, page):
+        pass
+
+    def on_page_retried(self, query, page, wait, error):
+        pass
+
+    def on_query_planned(self, query, total_pages):
+        pass
+
+    def on_query_done(self, query):
+        pass
+
+
+class Events:
+    """Dispatches events to subscribers. Handlers are looked up when a
+    subscriber is added, so emitting an event nobody listens to is cheap."""
+
+    def __init__(self, *subscribers):
+        self.subscribers = []
+        self.handlers = {event: [] for event in EVENTS}
+        for subscriber in subscribers:
+            self.subscribe(subscriber)
+
+    def _index(self):
+        for event, handlers in self.handlers.items():
+            handlers.clear()
+            for subscriber in self.subscribers:
+                if handler := getattr(subscriber, f"on_{event}", None):
+                    handlers.append(handler)
+
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+        self._index()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+        self._index()
+
+    def emit(self, event, **kwargs):
+        for handler in self.handlers[event]:
+            handler(**kwargs)
+
+
+class TqdmProgress(Subscriber):
+    """Shows a `tqdm` progress bar for each occurrences query."""
+
+    def __init__(self, **kwargs):
+        self.kwargs = {"desc": "Loading pages", "unit": "page", **kwargs}
+        self.bars = {}
+        self.finished = Counter()  # pages finished before the bar exists
+
+    def on_page_finished(self, query, page):
+        if not getattr(query, "progress", True):
+            return
+        if bar := self.bars.get(query):
+            bar.update(1)
+        else:
+            self.finished[query] += 1
+
+    def on_query_planned(self, query, total_pages):
+        if not getattr(query, "progress", True):
+            return
+        initial = self.finished.pop(query, 0)
+        self.bars[query] = tqdm(
+            total=total_pages, initial=initial, **self.kwargs
+        )
+
+    def on_query_done(self, query):
+        self.finished.pop(query, None)
+        if bar := self.bars.pop(query, None):
+            bar.close()
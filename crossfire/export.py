@@ -0,0 +1,306 @@
+import csv
+import json
+from datetime import date
+from io import StringIO
+from pathlib import Path
+
+try:
+    import pyarrow
+    from pyarrow import parquet
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+from crossfire.arrow import MissingPyArrowError, geo_metadata, points
+from crossfire.clients.occurrences import Occurrences, UnsupportedOptionError
+from crossfire.errors import CrossfireError
+from crossfire.records import Occurrence, is_record
+from crossfire.spatial import coordinates
+
+COLUMNS = Occurrence.KEYS
+
+
+class UnknownExportFormatError(CrossfireError):
+    def __init__(self, format):
+        message = (
+            f"Unknown export format `{format}`. "
+            f"Valid formats are: {', '.join(WRITERS)}"
+        )
+        super().__init__(message)
+
+
+class ResumeError(CrossfireError):
+    pass
+
+
+def _dict(item):
+    return item.to_dict() if is_record(item) else item
+
+
+def _cell(value):
+    """Nested objects and lists are kept as JSON in tabular formats."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+class Writer:
+    """Appends pages of occurrences to a file. Each page is rendered in memory
+    and written at once, so the file can be truncated back to the end of the
+    last page written (`offset`) when resuming an interrupted export."""
+
+    resumable = True
+
+    def __init__(self, path, offset=None):
+        self.path = Path(path)
+        if offset is None:
+            self.file = self.path.open("wb")
+            self.start()
+        else:
+            self.file = self.path.open("r+b")
+            self.file.truncate(offset)
+            self.file.seek(offset)
+
+    def start(self):
+        pass
+
+    def write(self, page):
+        self.file.write(self.render([_dict(item) for item in page]))
+
+    def tell(self):
+        self.file.flush()
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class NdjsonWriter(Writer):
+    def render(self, page):
+        lines = (json.dumps(item, ensure_ascii=False) + "\n" for item in page)
+        return "".join(lines).encode("utf-8")
+
+
+class CsvWriter(Writer):
+    """One column per key of `Occurrence` records. Nested objects and lists
+    (e.g. `state` or `victims`) are written as JSON."""
+
+    def start(self):
+        self.file.write(self.render(None))
+
+    def render(self, page):
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        if page is None:
+            writer.writerow(COLUMNS)
+        else:
+            writer.writerows(
+                [_cell(item.get(key)) for key in COLUMNS] for item in page
+            )
+        return buffer.getvalue().encode("utf-8")
+
+
+class ParquetWriter:
+    """Writes each page as a row group, with the same columns as `CsvWriter`.
+    Numbers, booleans and dates keep their types (coordinates, sent by the API
+    as strings, become numbers), while nested objects and lists are written as
+    JSON. Parquet files cannot be appended to, so exports to Parquet cannot be
+    resumed."""
+
+    resumable = False
+
+    def __init__(self, path, offset=None):
+        if not HAS_PYARROW:
+            raise MissingPyArrowError("Exporting to Parquet")
+        self.types = {
+            "documentNumber": pyarrow.int64(),
+            "latitude": pyarrow.float64(),
+            "longitude": pyarrow.float64(),
+            "date": pyarrow.timestamp("ms", tz="UTC"),
+            "policeAction": pyarrow.bool_(),
+            "agentPresence": pyarrow.bool_(),
+        }
+        self.schema = self.create_schema()
+        self.writer = parquet.ParquetWriter(str(path), self.schema)
+
+    def create_schema(self):
+        return pyarrow.schema(
+            (column, self.types.get(column, pyarrow.string()))
+            for column in COLUMNS
+        )
+
+    def array(self, column, values):
+        if column in {"latitude", "longitude"}:
+            return pyarrow.array(coordinates(values), from_pandas=True)
+        if column == "date":  # ISO 8601 strings
+            return pyarrow.array(values, pyarrow.string()).cast(
+                self.types[column]
+            )
+        if column in self.types:
+            return pyarrow.array(values, self.types[column])
+        return pyarrow.array(
+            [_cell(value) for value in values], pyarrow.string()
+        )
+
+    def columns(self, page):
+        columns = {column: [] for column in COLUMNS}
+        for item in page:
+            item = _dict(item)
+            for column, values in columns.items():
+                values.append(item.get(column))
+        return {
+            column: self.array(column, values)
+            for column, values in columns.items()
+        }
+
+    def write(self, page):
+        columns = self.columns(page)
+        table = pyarrow.Table.from_pydict(columns, schema=self.schema)
+        self.writer.write_table(table)
+
+    def tell(self):
+        return None
+
+    def close(self):
+        self.writer.close()
+
+
+class GeoParquetWriter(ParquetWriter):
+    """Same as `ParquetWriter`, plus a `geometry` column with the points of
+    the occurrences, as specified by GeoParquet."""
+
+    def create_schema(self):
+        fields = list(super().create_schema())
+        fields.append(pyarrow.field("geometry", pyarrow.binary()))
+        return pyarrow.schema(fields, metadata=geo_metadata())
+
+    def columns(self, page):
+        columns = super().columns(page)
+        columns["geometry"] = points(columns["longitude"], columns["latitude"])
+        return columns
+
+
+WRITERS = {
+    "ndjson": NdjsonWriter,
+    "csv": CsvWriter,
+    "parquet": ParquetWriter,
+    "geoparquet": GeoParquetWriter,
+}
+
+
+def _serializable(query):
+    return {
+        key: value.isoformat() if isinstance(value, date) else value
+        for key, value in query.items()
+    }
+
+
+class Checkpoint:
+    """Progress of an export, saved next to the output file after each page
+    is written, so an interrupted export can be resumed."""
+
+    def __init__(self, output, query, format):
+        self.path = Path(f"{output}.progress.json")
+        self.query = _serializable(query)
+        self.format = format
+        self.take = None
+        self.pages = set()
+        self.offset = None
+
+    def load(self):
+        """Restores the progress of a previous export of the same query,
+        returns `False` if there is none."""
+        if not self.path.exists():
+            return False
+
+        contents = json.loads(self.path.read_text())
+        if (contents["query"], contents["format"]) != (self.query, self.format):
+            raise ResumeError(
+                f"{self.path} belongs to a different export. Remove it or "
+                "export without resuming."
+            )
+        self.take = contents["take"]
+        self.pages = set(contents["pages"])
+        self.offset = contents["offset"]
+        return True
+
+    def save(self):
+        contents = {
+            "query": self.query,
+            "format": self.format,
+            "take": self.take,
+            "pages": sorted(self.pages),
+            "offset": self.offset,
+        }
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(contents))
+        tmp.replace(self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+async def export(
+    client,
+    output,
+    format="ndjson",
+    page_size=None,
+    max_parallel_requests=None,
+    resume=False,
+    **query,
+):
+    """Streams the occurrences matching `query` (the arguments of
+    `AsyncClient.occurrences`, except `prefetch`, `snapshot`, `max_memory` and
+    `on_error`) to `output`, writing pages as they arrive. Returns the number
+    of pages written. If the export fails or `timeout` passes, it can be
+    resumed."""
+    if format not in WRITERS:
+        raise UnknownExportFormatError(format)
+    for option in ("prefetch", "snapshot", "max_memory"):
+        if query.get(option):
+            raise UnsupportedOptionError(option, "export")
+    if query.get("on_error", "raise") != "raise":
+        raise UnsupportedOptionError("on_error", "export")
+
+    writer_class = WRITERS[format]
+    checkpoint = Checkpoint(output, query, format)
+    if resume and not writer_class.resumable:
+        raise ResumeError(f"Exports to {format} cannot be resumed.")
+
+    resuming = resume and checkpoint.load() and Path(output).exists()
+    if resuming:
+        page_size = checkpoint.take
+    else:
+        checkpoint.pages.clear()
+
+    occurrences = Occurrences(
+        client,
+        max_parallel_requests=max_parallel_requests
+        or client.max_parallel_requests,
+        page_size=page_size,
+        **query,
+    )
+    writer = writer_class(output, checkpoint.offset if resuming else None)
+    written = 0
+
+    async def write():
+        nonlocal written
+        async for number, page in occurrences.stream(skip=checkpoint.pages):
+            writer.write(page)
+            written += 1
+            if writer_class.resumable:
+                checkpoint.take = occurrences.params.get("take")
+                checkpoint.pages.add(number)
+                checkpoint.offset = writer.tell()
+                checkpoint.save()
+
+    try:
+        await occurrences.deadline(write())
+    finally:
+        writer.close()
+
+    checkpoint.remove()
+    return written
@@ -0,0 +1,79 @@
+import os
+from asyncio import sleep
+from pathlib import Path
+
+try:
+    import fcntl
+
+    HAS_FCNTL = True
+except ImportError:  # Windows
+    import msvcrt
+
+    HAS_FCNTL = False
+
+
+class FileLock:
+    """Exclusive lock shared by processes on the same host, held on a lock
+    file (created if needed). It is released when the file is closed, so a
+    crashed process does not keep others waiting.
+
+    `async with` waits polling every `interval` seconds instead of blocking the
+    event loop, and `with` blocks until the lock is acquired."""
+
+    def __init__(self, path, interval=0.05):
+        self.path = Path(path).expanduser()
+        self.interval = interval
+        self.descriptor = None
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def try_acquire(self, blocking=False):
+        """Returns whether the lock was acquired."""
+        if self.descriptor is None:
+            self.open()
+        try:
+            if HAS_FCNTL:
+                flags = (
+                    fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                )
+                fcntl.flock(self.descriptor, flags)
+            else:
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                msvcrt.locking(self.descriptor, mode, 1)
+        except OSError:
+            if blocking:
+                self.close()
+                raise
+            return False
+        return True
+
+    def release(self):
+        if self.descriptor is None:
+            return
+        if HAS_FCNTL:
+            fcntl.flock(self.descriptor, fcntl.LOCK_UN)
+        else:
+            os.lseek(self.descriptor, 0, os.SEEK_SET)
+            msvcrt.locking(self.descriptor, msvcrt.LK_UNLCK, 1)
+        self.close()
+
+    def close(self):
+        os.close(self.descriptor)
+        self.descriptor = None
+
+    def __enter__(self):
+        self.try_acquire(blocking=True)
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    async def __aenter__(self):
+        while not self.try_acquire():
+            await sleep(self.interval)
+        return self
+
+    async def __aexit__(self, *args):
+        self.release()
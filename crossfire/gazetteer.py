@@ -0,0 +1,192 @@
+import re
+from unicodedata import category
+from unicodedata import normalize as unicode_normalize
+
+from crossfire.errors import CrossfireError
+from crossfire.records import is_record
+
+KINDS = ("state", "city", "neighborhood", "subNeighborhood", "locality")
+NOT_ALPHANUMERIC = re.compile(r"[^\w]+")
+END = ""  # key used by trie nodes to store the places ending there
+
+
+class UnknownPlaceKindError(CrossfireError):
+    def __init__(self, kind):
+        message = f"Unknown kind `{kind}`. Valid kinds are: {', '.join(KINDS)}"
+        super().__init__(message)
+
+
+def normalize(name):
+    """Folds case and accents and collapses punctuation and spaces, so
+    `"São Gonçalo"`, `"SAO GONCALO"` and `" sao-goncalo "` have the same key."""
+    decomposed = unicode_normalize("NFKD", name)
+    stripped = "".join(char for char in decomposed if category(char) != "Mn")
+    return NOT_ALPHANUMERIC.sub(" ", stripped.casefold()).strip()
+
+
+class Place:
+    __slots__ = ("kind", "id", "name", "parent")
+
+    def __init__(self, kind, id, name, parent=None):
+        self.kind = kind
+        self.id = id
+        self.name = name
+        self.parent = parent
+
+    def __repr__(self):
+        return f"<Place {self.kind} {self.name!r} {self.id}>"
+
+
+class Trie:
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key, value):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(END, []).append(value)
+
+    def get(self, key):
+        node = self.root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get(END, [])
+
+    def startswith(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return
+
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield from node.get(END, ())
+            stack.extend(child for key, child in node.items() if key != END)
+
+
+def _get(obj, key):
+    if is_record(obj):
+        obj = obj.to_dict()
+    return obj.get(key) if obj else None
+
+
+class Gazetteer:
+    """Local index of places (states, cities, neighborhoods, sub-neighborhoods
+    and localities) to resolve names typed by people to API ids without
+    network access. Names are matched ignoring case, accents and punctuation,
+    and unique prefixes are accepted (e.g. `"jaboatao"`)."""
+
+    def __init__(self):
+        self.places = {}  # keys are (kind, id)
+        self.trie = Trie()
+        self.reference = None  # reference data this gazetteer was built from
+
+    def __len__(self):
+        return len(self.places)
+
+    def add(self, kind, id, name, parent=None):
+        if kind not in KINDS:
+            raise UnknownPlaceKindError(kind)
+        if not id or not name or (kind, id) in self.places:
+            return
+
+        place = Place(kind, id, name, parent)
+        self.places[(kind, id)] = place
+        self.trie.insert(normalize(name), place)
+
+    def add_states(self, states):
+        for state in states:
+            self.add("state", _get(state, "id"), _get(state, "name"))
+
+    def add_cities(self, cities):
+        for city in cities:
+            state = _get(city, "state")
+            self.add(
+                "city",
+                _get(city, "id"),
+                _get(city, "name"),
+                _get(state, "id"),
+            )
+
+    def add_occurrences(self, occurrences):
+        """Adds the places mentioned in occurrences (as dictionaries or
+        records), including neighborhoods, sub-neighborhoods and localities,
+        which are not available in other endpoints."""
+        for occurrence in occurrences:
+            if is_record(occurrence):
+                occurrence = occurrence.to_dict()
+
+            state, city = occurrence.get("state"), occurrence.get("city")
+            if state:
+                self.add("state", state.get("id"), state.get("name"))
+            if city:
+                state_id = state.get("id") if state else None
+                self.add("city", city.get("id"), city.get("name"), state_id)
+
+            city_id = city.get("id") if city else None
+            for kind in ("neighborhood", "subNeighborhood", "locality"):
+                if place := occurrence.get(kind):
+                    self.add(kind, place.get("id"), place.get("name"), city_id)
+
+    @classmethod
+    def from_reference(cls, states, cities, previous=None):
+        """Creates a gazetteer from states and cities. Places from
+        occurrences added to a `previous` gazetteer are kept."""
+        gazetteer = cls()
+        gazetteer.add_states(states)
+        gazetteer.add_cities(cities)
+        for place in previous.places.values() if previous else ():
+            if place.kind not in {"state", "city"}:
+                gazetteer.add(place.kind, place.id, place.name, place.parent)
+        return gazetteer
+
+    def candidates(self, name, kind=None, parent=None, prefix=True):
+        """Returns the places matching `name`. Exact matches take precedence
+        over places whose names start with `name`."""
+        key = normalize(name) if name else None
+        if not key:
+            return []
+
+        def select(places):
+            return [
+                place
+                for place in places
+                if (kind is None or place.kind == kind)
+                and (parent is None or place.parent == parent)
+            ]
+
+        if exact := select(self.trie.get(key)):
+            return exact
+        return select(self.trie.startswith(key)) if prefix else []
+
+    def resolve(self, name, kind="city", parent=None, prefix=True):
+        """Returns the id of the place called `name`, or `None` if there is no
+        match or if the name is ambiguous (e.g. a neighborhood called `Centro`
+        without a `parent`)."""
+        places = self.candidates(name, kind, parent, prefix)
+        ids = {place.id for place in places}
+        return ids.pop() if len(ids) == 1 else None
+
+    def resolve_many(self, names, kind="city", parent=None, prefix=True):
+        """Resolves many names at once, returning a list of ids (or `None`) in
+        the same order. Each distinct name is resolved only once."""
+        resolved, ids = {}, []
+        for name in names:
+            if name not in resolved:
+                resolved[name] = self.resolve(name, kind, parent, prefix)
+            ids.append(resolved[name])
+        return ids
+
+    def complete(self, prefix, kind=None, limit=10):
+        """Suggests places whose names start with `prefix`, shortest first."""
+        places = (
+            place
+            for place in self.trie.startswith(normalize(prefix))
+            if kind is None or place.kind == kind
+        )
+        return sorted(places, key=lambda place: len(place.name))[:limit]
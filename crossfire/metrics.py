@@ -0,0 +1,180 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+from httpx import TimeoutException
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PREFIX = "crossfire"
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+
+    def cumulative(self):
+        """Yields `(upper bound, count)` pairs as Prometheus expects: each
+        bucket counting all the observations less or equal to its bound."""
+        total = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            total += count
+            yield bucket, total
+        yield "+Inf", self.count
+
+
+class Metrics:
+    """Collects metrics about the requests made by an `AsyncClient`, labeled by
+    endpoint (e.g. `/occurrences`). Use `render` to get them in the Prometheus
+    text exposition format."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.requests = Counter()  # keys are (endpoint, status code)
+        self.latency = defaultdict(lambda: Histogram(self.buckets))
+        self.bytes_received = Counter()
+        self.rate_limited = Counter()
+        self.timeouts = Counter()
+        self.retries = Counter()
+        self.coalesced = Counter()
+        self.token_refreshes = 0
+        self.in_flight = 0
+
+    @contextmanager
+    def track(self, endpoint):
+        """Context manager around a single HTTP request. It yields a function
+        to be called with the response once it is received."""
+        start = perf_counter()
+
+        def observe(response):
+            status_code = response.status_code
+            self.requests[(endpoint, status_code)] += 1
+            self.latency[endpoint].observe(perf_counter() - start)
+            self.bytes_received[endpoint] += len(response.content)
+            if status_code == 429:
+                self.rate_limited[endpoint] += 1
+
+        self.in_flight += 1
+        try:
+            yield observe
+        except TimeoutException:
+            self.timeouts[endpoint] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def retry(self, endpoint):
+        self.retries[endpoint] += 1
+
+    def coalesce(self, endpoint):
+        self.coalesced[endpoint] += 1
+
+    def token_refresh(self):
+        self.token_refreshes += 1
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def family(name, kind, description, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(
+                    f"{PREFIX}_{name}{suffix}{_labels(labels)} {value}"
+                )
+
+        def per_endpoint(counter):
+            for endpoint, value in sorted(counter.items()):
+                yield "", {"endpoint": endpoint}, value
+
+        family(
+            "requests_total",
+            "counter",
+            "Requests made to the Fogo Cruzado API.",
+            (
+                ("", {"endpoint": endpoint, "status": status}, value)
+                for (endpoint, status), value in sorted(
+                    self.requests.items(), key=str
+                )
+            ),
+        )
+        family(
+            "request_duration_seconds",
+            "histogram",
+            "Time until the response of a request is received.",
+            self._histogram_samples(),
+        )
+        family(
+            "response_bytes_total",
+            "counter",
+            "Bytes received in response bodies.",
+            per_endpoint(self.bytes_received),
+        )
+        family(
+            "rate_limited_total",
+            "counter",
+            "Responses with HTTP status 429 Too Many Requests.",
+            per_endpoint(self.rate_limited),
+        )
+        family(
+            "timeouts_total",
+            "counter",
+            "Requests that timed out.",
+            per_endpoint(self.timeouts),
+        )
+        family(
+            "retries_total",
+            "counter",
+            "Requests retried after a rate limit or a timeout.",
+            per_endpoint(self.retries),
+        )
+        family(
+            "coalesced_requests_total",
+            "counter",
+            "Requests served by an identical request already in flight.",
+            per_endpoint(self.coalesced),
+        )
+        family(
+            "token_refreshes_total",
+            "counter",
+            "Access tokens requested to the API.",
+            (("", {}, self.token_refreshes),),
+        )
+        family(
+            "in_flight_requests",
+            "gauge",
+            "Requests waiting for a response.",
+            (("", {}, self.in_flight),),
+        )
+        return "\n".join(lines) + "\n"
+
+    def _histogram_samples(self):
+        for endpoint, histogram in sorted(self.latency.items()):
+            labels = {"endpoint": endpoint}
+            for bucket, count in histogram.cumulative():
+                yield "_bucket", dict(labels, le=bucket), count
+            yield "_sum", labels, histogram.sum
+            yield "_count", labels, histogram.count
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = (f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value):
+    value = str(value)
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
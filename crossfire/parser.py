@@ -1,8 +1,9 @@
+import json
 from dataclasses import dataclass
 from re import compile
 
 try:
-    from pandas import DataFrame
+    from pandas import DataFrame, to_numeric
 
     HAS_PANDAS = True
 except ModuleNotFoundError:
@@ -18,8 +19,10 @@ except ModuleNotFoundError:
 
 from crossfire.errors import CrossfireError
 from crossfire.logger import Logger
+from crossfire.profiling import stage
+from crossfire.records import Occurrence, to_records
 
-FORMATS = {"df", "dict", "geodf"}
+FORMATS = {"df", "dict", "geodf", "records"}
 CRS = "EPSG:4326"
 
 logger = Logger(__name__)
@@ -42,8 +45,12 @@ def to_geo_dataframe(df):
             "They are needed to create a GeoDataFrame."
         )
 
-    geometry = points_from_xy(df.longitude, df.latitude)
-    return GeoDataFrame(df, geometry=geometry, crs=CRS)
+    with stage("geodataframe"):
+        geometry = points_from_xy(
+            to_numeric(df.longitude, errors="coerce").to_numpy(),
+            to_numeric(df.latitude, errors="coerce").to_numpy(),
+        )
+        return GeoDataFrame(df, geometry=geometry, crs=CRS)
 
 
 @dataclass
@@ -72,41 +79,50 @@ class Metadata:
             cls.to_snake_case(key): value
             for key, value in response.get("pageMeta", {}).items()
         }
-        
+
         if headers:
             if "X-Last-Update" in headers:
                 kwargs["last_update"] = headers["X-Last-Update"]
-            
+
             if "X-Last-Update-Timestamp" in headers:
                 try:
-                    kwargs["last_update_timestamp"] = int(headers["X-Last-Update-Timestamp"])
+                    kwargs["last_update_timestamp"] = int(
+                        headers["X-Last-Update-Timestamp"]
+                    )
                 except (ValueError, TypeError):
                     kwargs["last_update_timestamp"] = None
-            
+
             if "X-Last-Update-State-Id" in headers:
-                kwargs["last_update_state_id"] = headers["X-Last-Update-State-Id"]
-            
+                kwargs["last_update_state_id"] = headers[
+                    "X-Last-Update-State-Id"
+                ]
+
             if "X-Last-Update-State" in headers:
                 kwargs["last_update_state"] = headers["X-Last-Update-State"]
-            
+
             if "X-Last-Update-State-Timestamp" in headers:
                 try:
-                    kwargs["last_update_state_timestamp"] = int(headers["X-Last-Update-State-Timestamp"])
+                    kwargs["last_update_state_timestamp"] = int(
+                        headers["X-Last-Update-State-Timestamp"]
+                    )
                 except (ValueError, TypeError):
                     kwargs["last_update_state_timestamp"] = None
-        
+
         for key in cls.__dataclass_fields__.keys() - kwargs.keys():
             kwargs[key] = None
         return cls(**kwargs)
 
 
-def parse_response(response, format=None):
-    """Converts API response to a dictionary, Pandas DataFrame or GeoDataFrame."""
+def parse_response(response, format=None, record=None):
+    """Converts API response to a dictionary, Pandas DataFrame, GeoDataFrame or
+    a list of typed records (`record` is the record class, defaults to
+    `Occurrence`)."""
     if format and format not in FORMATS:
         raise UnknownFormatError(format)
 
     try:
-        contents = response.json()
+        with stage("decode"):
+            contents = response.json()
     except:
         logger.error(
             "Failed to decode response as JSON (HTTP Status "
@@ -116,11 +132,38 @@ def parse_response(response, format=None):
 
     metadata = Metadata.from_response(contents, headers=response.headers)
     data = contents.get("data", [])
+    return convert(data, format=format, record=record), metadata
+
+
+def parse_content(content, headers=None, format=None, record=None):
+    """Same as `parse_response`, but from the body (bytes) and headers of a
+    response, so it can run in another process."""
+    if format and format not in FORMATS:
+        raise UnknownFormatError(format)
+
+    with stage("decode"):
+        contents = json.loads(content)
+    metadata = Metadata.from_response(contents, headers=headers)
+    data = contents.get("data", [])
+    return convert(data, format=format, record=record), metadata
+
+
+def convert(data, format=None, record=None):
+    """Converts a list of dictionaries to the requested format."""
+    if format and format not in FORMATS:
+        raise UnknownFormatError(format)
 
     if HAS_GEOPANDAS and format == "geodf":
-        return to_geo_dataframe(DataFrame(data)), metadata
+        with stage("dataframe"):
+            data = DataFrame(data)
+        return to_geo_dataframe(data)
 
     if HAS_PANDAS and format == "df":
-        return DataFrame(data), metadata
+        with stage("dataframe"):
+            return DataFrame(data)
+
+    if format == "records":
+        with stage("records"):
+            return to_records(data, record or Occurrence)
 
-    return data, metadata
+    return data
@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter, process_time
+
+try:
+    from pandas import DataFrame
+
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+# stages in the order they happen when downloading occurrences
+STAGES = (
+    "token",
+    "queue",
+    "network",
+    "decode",
+    "workers",
+    "dataframe",
+    "geodataframe",
+    "records",
+    "merge",
+    "flatten",
+    "retry",
+)
+
+COLUMNS = ("stage", "calls", "wall", "cpu", "share")
+
+active = ContextVar("crossfire_profile", default=None)
+
+
+class Stage:
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = None
+
+    def add(self, wall, cpu=None):
+        self.calls += 1
+        self.wall += wall
+        if cpu is not None:
+            self.cpu = (self.cpu or 0.0) + cpu
+
+
+class Profile:
+    """Wall and CPU time spent in each stage of the requests made while it is
+    active (see `profile`). CPU time is only measured for stages that do not
+    wait (decoding, conversion, merging, flattening): while a coroutine waits,
+    the process runs others. Stages of concurrent requests overlap, so their
+    wall times can add up to more than `wall`, the total time."""
+
+    def __init__(self):
+        self.stages = {}
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    @contextmanager
+    def measure(self, name, cpu=True):
+        wall_start = perf_counter()
+        cpu_start = process_time() if cpu else None
+        try:
+            yield
+        finally:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = Stage()
+            stage.add(
+                perf_counter() - wall_start,
+                process_time() - cpu_start if cpu else None,
+            )
+
+    @contextmanager
+    def activate(self):
+        """Makes this the active profile in the current context (and in tasks
+        created from it). Each activation adds its own duration to the
+        totals, so it can be used by concurrent calls."""
+        token = active.set(self)
+        wall, cpu = perf_counter(), process_time()
+        try:
+            yield self
+        finally:
+            self.wall += perf_counter() - wall
+            self.cpu += process_time() - cpu
+            active.reset(token)
+
+    def rows(self, format=None):
+        """One dictionary per stage, in the order the stages happen, or a
+        DataFrame if `format` is `"df"`."""
+        order = {name: index for index, name in enumerate(STAGES)}
+        names = sorted(
+            self.stages, key=lambda name: order.get(name, len(order))
+        )
+        rows = [
+            {
+                "stage": name,
+                "calls": self.stages[name].calls,
+                "wall": self.stages[name].wall,
+                "cpu": self.stages[name].cpu,
+                "share": self.stages[name].wall / self.wall
+                if self.wall
+                else None,
+            }
+            for name in names
+        ]
+        if HAS_PANDAS and format == "df":
+            return DataFrame(rows, columns=list(COLUMNS))
+        return rows
+
+    def to_dict(self):
+        """Totals and stages, e.g. to be saved as JSON."""
+        return {"wall": self.wall, "cpu": self.cpu, "stages": self.rows()}
+
+    def report(self):
+        """Table of the stages, as text."""
+        lines = [
+            f"{'stage':<14}{'calls':>8}{'wall (s)':>12}{'cpu (s)':>12}{'wall %':>9}"
+        ]
+        for row in self.rows():
+            cpu = "-" if row["cpu"] is None else f"{row['cpu']:.3f}"
+            share = "-" if row["share"] is None else f"{row['share']:.1%}"
+            lines.append(
+                f"{row['stage']:<14}{row['calls']:>8}{row['wall']:>12.3f}"
+                f"{cpu:>12}{share:>9}"
+            )
+        lines.append(f"{'total':<14}{'':>8}{self.wall:>12.3f}{self.cpu:>12.3f}")
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.report()
+
+
+@contextmanager
+def profile():
+    """Profiles crossfire calls in a `with` block, including tasks they
+    create:
+
+        with crossfire.profile() as result:
+            crossfire.occurrences(...)
+        print(result.report())
+    """
+    with Profile().activate() as result:
+        yield result
+
+
+@contextmanager
+def stage(name, cpu=True):
+    """Measures a stage in the active profile, if any. Use `cpu=False` for
+    stages that wait for something (network, locks, sleeps)."""
+    current = active.get()
+    if current is None:
+        yield
+        return
+    with current.measure(name, cpu):
+        yield
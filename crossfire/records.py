@@ -0,0 +1,157 @@
+from re import compile
+
+SNAKE_CASE_REGEX = compile("([A-Z])")
+
+
+def to_snake_case(name):
+    return SNAKE_CASE_REGEX.sub(r"_\1", name).lower()
+
+
+def slots(keys):
+    return tuple(to_snake_case(key) for key in keys)
+
+
+class Record:
+    """Base class for lightweight typed records. Subclasses declare the API keys
+    in `KEYS` and one slot per key (in snake case) with `__slots__ =
+    slots(KEYS)`. Keys sent by the API but not declared are kept in the `extra`
+    slot. `NESTED` maps keys to the record classes used for nested objects."""
+
+    __slots__ = ("extra",)
+    KEYS = ()
+    NESTED = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.ATTRIBUTES = slots(cls.KEYS)
+        cls.PAIRS = tuple(zip(cls.KEYS, cls.ATTRIBUTES))
+        cls.KEYS_SET = frozenset(cls.KEYS)
+
+    def __init__(self, **kwargs):
+        for attribute in self.ATTRIBUTES:
+            setattr(self, attribute, kwargs.pop(attribute, None))
+        self.extra = kwargs or None
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None:
+            return None
+
+        obj = cls.__new__(cls)
+        for key, attribute in cls.PAIRS:
+            value = data.get(key)
+            if value is not None and key in cls.NESTED:
+                nested = cls.NESTED[key]
+                if isinstance(value, list):
+                    value = [nested.from_dict(item) for item in value]
+                else:
+                    value = nested.from_dict(value)
+            setattr(obj, attribute, value)
+
+        extra = data.keys() - cls.KEYS_SET
+        obj.extra = {key: data[key] for key in extra} if extra else None
+        return obj
+
+    def to_dict(self, skip_none=False):
+        data = {}
+        for key, attribute in self.PAIRS:
+            value = getattr(self, attribute)
+            if value is None and skip_none:
+                continue
+            if isinstance(value, Record):
+                value = value.to_dict(skip_none)
+            elif isinstance(value, list) and key in self.NESTED:
+                value = [item.to_dict(skip_none) for item in value]
+            data[key] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __eq__(self, other):
+        if not isinstance(other, self.__class__):
+            return NotImplemented
+        return all(
+            getattr(self, attribute) == getattr(other, attribute)
+            for attribute in self.__slots__ + ("extra",)
+        )
+
+    def __repr__(self):
+        name = self.__class__.__name__
+        identifier = getattr(self, "id", None)
+        return f"<{name} {identifier}>" if identifier else f"<{name}>"
+
+
+class State(Record):
+    KEYS = ("id", "name")
+    __slots__ = slots(KEYS)
+
+
+class City(Record):
+    KEYS = ("id", "name", "state")
+    __slots__ = slots(KEYS)
+    NESTED = {"state": State}
+
+
+class Victim(Record):
+    KEYS = (
+        "id",
+        "occurrenceId",
+        "type",
+        "situation",
+        "circumstances",
+        "deathDate",
+        "personType",
+        "age",
+        "ageGroup",
+        "genre",
+        "race",
+        "place",
+        "serviceStatus",
+        "qualifications",
+        "politicalPosition",
+        "politicalStatus",
+        "partie",
+        "coorporation",
+        "agentPosition",
+        "agentStatus",
+        "unit",
+    )
+    __slots__ = slots(KEYS)
+
+
+class Occurrence(Record):
+    KEYS = (
+        "id",
+        "documentNumber",
+        "address",
+        "state",
+        "region",
+        "city",
+        "neighborhood",
+        "subNeighborhood",
+        "locality",
+        "latitude",
+        "longitude",
+        "date",
+        "policeAction",
+        "agentPresence",
+        "relatedRecord",
+        "contextInfo",
+        "transports",
+        "victims",
+        "animalVictims",
+    )
+    __slots__ = slots(KEYS)
+    NESTED = {"state": State, "city": City, "victims": Victim}
+
+
+def is_record(data):
+    return isinstance(data, Record)
+
+
+def to_records(data, record=Occurrence):
+    return [record.from_dict(item) for item in data]
+
+
+def to_dicts(data, skip_none=False):
+    return [item.to_dict(skip_none) for item in data]
@@ -0,0 +1,202 @@
+try:
+    import numpy
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    from pandas import DataFrame
+
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+from crossfire.aggregate import PERIODS
+from crossfire.errors import CrossfireError
+from crossfire.records import is_record, to_dicts
+
+KINDS = ("hex", "square")
+EARTH_RADIUS = 6_378_137  # meters, as in Web Mercator (EPSG:3857)
+SQRT3 = 3**0.5
+
+
+class UnknownGridKindError(CrossfireError):
+    def __init__(self, kind):
+        message = (
+            f"Unknown grid kind `{kind}`. Valid kinds are: {', '.join(KINDS)}"
+        )
+        super().__init__(message)
+
+
+class MissingNumPyError(CrossfireError):
+    def __init__(self):
+        super().__init__("Binning requires `numpy`. Install `crossfire[df]`.")
+
+
+def coordinates(values):
+    """Converts latitudes or longitudes (numbers or strings, as sent by the
+    API) to a float array, with `NaN` for missing or invalid values."""
+    try:
+        return numpy.asarray(values, dtype="float64")
+    except (TypeError, ValueError):
+        pass
+
+    def number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return numpy.nan
+
+    return numpy.fromiter((number(value) for value in values), "float64")
+
+
+def to_mercator(longitude, latitude):
+    x = numpy.radians(longitude) * EARTH_RADIUS
+    y = numpy.log(numpy.tan(numpy.pi / 4 + numpy.radians(latitude) / 2))
+    return x, y * EARTH_RADIUS
+
+
+def from_mercator(x, y):
+    longitude = numpy.degrees(x / EARTH_RADIUS)
+    latitude = numpy.degrees(2 * numpy.arctan(numpy.exp(y / EARTH_RADIUS)))
+    return longitude, latitude - 90
+
+
+def square_cells(x, y, cell_size):
+    return numpy.floor(x / cell_size), numpy.floor(y / cell_size)
+
+
+def square_centers(column, row, cell_size):
+    return (column + 0.5) * cell_size, (row + 0.5) * cell_size
+
+
+def hex_cells(x, y, cell_size):
+    """Axial coordinates of pointy-top hexagons whose centers are `cell_size`
+    apart, rounding fractional cube coordinates to the nearest hexagon."""
+    radius = cell_size / SQRT3
+    q = (SQRT3 / 3 * x - y / 3) / radius
+    r = (2 / 3 * y) / radius
+    s = -q - r
+
+    rounded_q, rounded_r, rounded_s = (
+        numpy.round(q),
+        numpy.round(r),
+        numpy.round(s),
+    )
+    diff_q = numpy.abs(rounded_q - q)
+    diff_r = numpy.abs(rounded_r - r)
+    diff_s = numpy.abs(rounded_s - s)
+
+    fix_q = (diff_q > diff_r) & (diff_q > diff_s)
+    fix_r = ~fix_q & (diff_r > diff_s)
+    rounded_q = numpy.where(fix_q, -rounded_r - rounded_s, rounded_q)
+    rounded_r = numpy.where(fix_r, -rounded_q - rounded_s, rounded_r)
+    return rounded_q, rounded_r
+
+
+def hex_centers(q, r, cell_size):
+    radius = cell_size / SQRT3
+    return radius * (SQRT3 * q + SQRT3 / 2 * r), radius * 1.5 * r
+
+
+GRIDS = {
+    "hex": (hex_cells, hex_centers),
+    "square": (square_cells, square_centers),
+}
+
+
+def _columns(occurrences):
+    """Longitudes, latitudes, number of victims and dates of occurrences
+    given as a list of dictionaries or records, or as a DataFrame."""
+    if not (HAS_PANDAS and isinstance(occurrences, DataFrame)):
+        if occurrences and is_record(occurrences[0]):
+            occurrences = to_dicts(occurrences)
+        occurrences = {
+            key: [occurrence.get(key) for occurrence in occurrences]
+            for key in ("longitude", "latitude", "victims", "date")
+        }
+
+    count = len(occurrences["longitude"])
+    victims = occurrences.get("victims")
+    if victims is None:
+        victims = (None,) * count
+    dates = occurrences.get("date")
+    return (
+        coordinates(occurrences["longitude"]),
+        coordinates(occurrences["latitude"]),
+        numpy.fromiter(
+            (len(value) if isinstance(value, list) else 0 for value in victims),
+            "int64",
+            count,
+        ),
+        (None,) * count if dates is None else dates,
+    )
+
+
+def bin(occurrences, cell_size, kind="hex", by=None, format=None):
+    """Counts occurrences and victims per grid cell, with vectorized NumPy
+    arithmetic instead of spatial joins.
+
+    Coordinates are projected to Web Mercator, as most web maps are, and
+    `cell_size` is in its meters: the side of square cells or the distance
+    between the centers of neighboring hexagons (Web Mercator stretches
+    distances by 1 / cos(latitude), about 9% in Rio de Janeiro and Recife).
+    With `by` (`day`, `month` or `year`), cells are counted per period.
+
+    Returns one dictionary per cell (or a DataFrame if `format` is `"df"`),
+    with the cell coordinates in the grid (`column` and `row`), the longitude
+    and latitude of its center, the number of occurrences and of victims.
+    Occurrences without coordinates are ignored."""
+    if not HAS_NUMPY:
+        raise MissingNumPyError()
+    if kind not in GRIDS:
+        raise UnknownGridKindError(kind)
+    if by is not None and by not in PERIODS:
+        raise CrossfireError(f"`by` must be one of: {', '.join(PERIODS)}")
+
+    longitude, latitude, victims, dates = _columns(occurrences)
+    if not len(longitude):
+        return DataFrame() if HAS_PANDAS and format == "df" else []
+
+    valid = ~(numpy.isnan(longitude) | numpy.isnan(latitude))
+    cells, centers = GRIDS[kind]
+    x, y = to_mercator(longitude[valid], latitude[valid])
+    column, row = cells(x, y, cell_size)
+
+    keys = [column.astype("int64"), row.astype("int64")]
+    if by:
+        size = PERIODS[by]
+        periods = numpy.array([date[:size] if date else "" for date in dates])
+        labels, period = numpy.unique(periods[valid], return_inverse=True)
+        keys.append(period)
+
+    groups, inverse = numpy.unique(
+        numpy.stack(keys, axis=1), axis=0, return_inverse=True
+    )
+    inverse = inverse.reshape(-1)
+    counts = numpy.bincount(inverse, minlength=len(groups))
+    totals = numpy.bincount(
+        inverse, weights=victims[valid], minlength=len(groups)
+    )
+    center_lon, center_lat = from_mercator(
+        *centers(groups[:, 0], groups[:, 1], cell_size)
+    )
+
+    rows = []
+    for index, group in enumerate(groups):
+        cell = {
+            "column": int(group[0]),
+            "row": int(group[1]),
+            "longitude": float(center_lon[index]),
+            "latitude": float(center_lat[index]),
+        }
+        if by:
+            cell[by] = str(labels[group[2]]) or None
+        cell["count"] = int(counts[index])
+        cell["victims"] = int(totals[index])
+        rows.append(cell)
+
+    if HAS_PANDAS and format == "df":
+        return DataFrame(rows)
+    return rows
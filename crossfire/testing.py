@@ -0,0 +1,398 @@
+"""Helpers to exercise `crossfire` without access to the Fogo Cruzado API."""
+
+from asyncio import sleep
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from json import dumps, loads
+from math import ceil
+from random import Random
+from time import monotonic
+from urllib.parse import parse_qs
+from uuid import UUID, uuid4
+
+import httpx
+
+STATES = (
+    ("813ca36b-91e3-4a18-b408-60b27a1942ef", "Rio de Janeiro"),
+    ("b112ffbe-17b3-4ad0-8f2a-2038745d1d14", "Pernambuco"),
+)
+CITIES = (
+    ("Rio de Janeiro", -22.9068, -43.1729),
+    ("São Gonçalo", -22.8268, -43.0634),
+    ("Duque de Caxias", -22.7856, -43.3117),
+    ("Niterói", -22.8832, -43.1034),
+    ("Recife", -8.0476, -34.8770),
+    ("Jaboatão dos Guararapes", -8.1130, -35.0150),
+)
+NEIGHBORHOODS = (
+    "Centro",
+    "Maré",
+    "Penha",
+    "Copacabana",
+    "Boa Viagem",
+    "Jardim Catarina",
+)
+LOCALITIES = (
+    "Complexo da Maré",
+    "Complexo do Alemão",
+    "Cidade de Deus",
+    "Rocinha",
+)
+REASONS = ("Ação policial", "Assalto/tentativa", "Briga", "Não identificado")
+SITUATIONS = ("Dead", "Wounded")
+
+
+class SyntheticData:
+    """Deterministic generator of occurrences with the same shape as the ones
+    served by the API (nested `state`, `city`, `contextInfo`, `victims`…)."""
+
+    def __init__(self, seed=42, start=datetime(2016, 7, 1)):
+        self.seed = seed
+        self.start = start
+
+    def uuid(self, random):
+        return str(UUID(int=random.getrandbits(128), version=4))
+
+    def victim(self, random, occurrence_id):
+        return {
+            "id": self.uuid(random),
+            "occurrenceId": occurrence_id,
+            "type": "People",
+            "situation": random.choice(SITUATIONS),
+            "circumstances": [],
+            "deathDate": None,
+            "personType": "Civilian",
+            "age": random.randint(12, 80),
+            "ageGroup": {"id": "1", "name": "Adulto"},
+            "genre": {"id": "1", "name": random.choice(("Homem", "Mulher"))},
+            "race": None,
+            "place": {"id": "1", "name": "Via pública"},
+            "serviceStatus": None,
+            "qualifications": [],
+            "politicalPosition": None,
+            "politicalStatus": None,
+            "partie": None,
+            "coorporation": None,
+            "agentPosition": None,
+            "agentStatus": None,
+            "unit": None,
+        }
+
+    def occurrence(self, number):
+        random = Random(self.seed * 1_000_003 + number)
+        state_index = random.randrange(len(STATES))
+        state_id, state_name = STATES[state_index]
+        city_name, latitude, longitude = random.choice(
+            CITIES[:4] if state_index == 0 else CITIES[4:]
+        )
+        occurrence_id = self.uuid(random)
+        moment = self.start + timedelta(minutes=number * 7)
+        victims = random.choices((0, 1, 2), weights=(6, 3, 1))[0]
+        neighborhood = random.randrange(len(NEIGHBORHOODS))
+        reason = random.randrange(len(REASONS))
+        locality = random.randrange(len(LOCALITIES))
+        return {
+            "id": occurrence_id,
+            "documentNumber": number,
+            "address": f"Rua {random.randint(1, 999)}, {city_name}",
+            "state": {"id": state_id, "name": state_name},
+            "region": {
+                "id": state_id,
+                "region": f"Grande {state_name}",
+                "state": state_name,
+                "enabled": True,
+            },
+            "city": {"id": f"{state_index}-{city_name}", "name": city_name},
+            "neighborhood": {
+                "id": str(neighborhood),
+                "name": NEIGHBORHOODS[neighborhood],
+            },
+            "subNeighborhood": None,
+            "locality": {"id": str(locality), "name": LOCALITIES[locality]},
+            "latitude": f"{latitude + random.uniform(-0.1, 0.1):.10f}",
+            "longitude": f"{longitude + random.uniform(-0.1, 0.1):.10f}",
+            "date": moment.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "policeAction": random.random() < 0.3,
+            "agentPresence": random.random() < 0.3,
+            "relatedRecord": None,
+            "contextInfo": {
+                "mainReason": {"id": str(reason), "name": REASONS[reason]},
+                "complementaryReasons": [],
+                "clippings": [],
+                "massacre": False,
+                "policeUnit": None,
+            },
+            "transports": [],
+            "victims": [
+                self.victim(random, occurrence_id) for _ in range(victims)
+            ],
+            "animalVictims": [],
+        }
+
+    def occurrences(self, total, offset=0):
+        return [self.occurrence(offset + n) for n in range(total)]
+
+    def page(self, total, number, take=20):
+        """Returns the body of the API response for page `number` (starting at
+        1) of a query matching `total` occurrences."""
+        page_count = max(1, -(-total // take))
+        offset = (number - 1) * take
+        return {
+            "pageMeta": {
+                "page": number,
+                "take": take,
+                "itemCount": total,
+                "pageCount": page_count,
+                "hasPreviousPage": number > 1,
+                "hasNextPage": number < page_count,
+            },
+            "data": self.occurrences(max(0, min(take, total - offset)), offset),
+        }
+
+    def pages(self, total, take=20):
+        page_count = max(1, -(-total // take))
+        for number in range(1, page_count + 1):
+            yield self.page(total, number, take)
+
+    def raw_pages(self, total, take=20):
+        for page in self.pages(total, take):
+            yield dumps(page).encode("utf-8")
+
+
+class FakeAPI(httpx.AsyncBaseTransport):
+    """In-process stand-in for the Fogo Cruzado API, to be used as the transport
+    of an `AsyncClient`:
+
+        api = FakeAPI(total=10_000, latency=(0.05, 0.2), rate_limit=(60, 1))
+        client = AsyncClient("fake@crossfire", "secret", transport=api)
+
+    It serves `/auth/login`, `/states`, `/cities` and paginated `/occurrences`
+    (honoring `idState`, `idCities`, `typeOccurrence`, `initialdate`,
+    `finaldate`, `page` and `take`) from `occurrences` (e.g. a recorded
+    dataset) or from `total` synthetic occurrences.
+
+    Responses are delayed by `latency`: seconds, a `(minimum, maximum)` tuple
+    for an uniform distribution, or a function receiving a `random.Random` and
+    returning seconds. Delays use `asyncio.sleep`, so concurrency behaves as it
+    does against the real API. Other knobs:
+
+    * `rate_limit`: `(requests, seconds)` allowed per sliding window, after
+      that responds with HTTP 429 and a `retry-after` header
+    * `error_rate`: share of requests answered with an HTTP 5xx
+    * `timeout_rate`: share of requests that raise `httpx.ReadTimeout` after
+      `timeout` seconds
+    * `token_ttl`: seconds until an access token expires (expired tokens get
+      HTTP 401)
+    * `last_update`: `datetime` used in the `X-Last-Update-*` headers
+
+    `requests` counts the requests per path and `max_in_flight` records the
+    highest number of concurrent requests seen."""
+
+    def __init__(
+        self,
+        occurrences=None,
+        total=1_000,
+        take=20,
+        max_take=100,
+        latency=0,
+        rate_limit=None,
+        error_rate=0,
+        timeout_rate=0,
+        timeout=5,
+        token_ttl=3600,
+        credentials=None,
+        last_update=None,
+        seed=42,
+    ):
+        if occurrences is None:
+            occurrences = SyntheticData(seed=seed).occurrences(total)
+        self.occurrences = occurrences
+        self.take = take
+        self.max_take = max_take
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        self.token_ttl = token_ttl
+        self.credentials = credentials
+        self.last_update = last_update or datetime(2023, 10, 20, 14, 30)
+        self.random = Random(seed)
+
+        self.tokens = {}
+        self.matches = {}
+        self.history = deque()
+        self.requests = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def delay(self):
+        if callable(self.latency):
+            return self.latency(self.random)
+        if isinstance(self.latency, tuple):
+            return self.random.uniform(*self.latency)
+        return self.latency
+
+    def retry_after(self):
+        """Registers a request in the rate limit window and returns how many
+        seconds the client has to wait if the limit was exceeded."""
+        if not self.rate_limit:
+            return None
+
+        limit, seconds = self.rate_limit
+        now = monotonic()
+        while self.history and self.history[0] <= now - seconds:
+            self.history.popleft()
+        if len(self.history) >= limit:
+            return max(1, ceil(self.history[0] + seconds - now))
+        self.history.append(now)
+        return None
+
+    async def handle_async_request(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await request.aread()
+            await sleep(self.delay())
+            if self.random.random() < self.timeout_rate:
+                await sleep(self.timeout)
+                raise httpx.ReadTimeout("Fake timeout", request=request)
+            return self.respond(request)
+        finally:
+            self.in_flight -= 1
+
+    def respond(self, request):
+        path = request.url.path.rstrip("/").rsplit("/", 1)[-1]
+        self.requests[path] += 1
+
+        if wait := self.retry_after():
+            return self.json(
+                request,
+                {"msg": "Too Many Requests"},
+                status_code=429,
+                headers={"retry-after": str(wait)},
+            )
+
+        if self.random.random() < self.error_rate:
+            status_code = self.random.choice((500, 502, 503))
+            return self.json(request, {"msg": "Boom!"}, status_code)
+
+        if path == "login" and request.method == "POST":
+            return self.login(request)
+
+        if not self.is_authorized(request):
+            return self.json(request, {"msg": "Unauthorized"}, 401)
+
+        query = parse_qs(request.url.query.decode())
+        if path == "states":
+            return self.json(request, {"data": self.states()})
+        if path == "cities":
+            return self.json(request, {"data": self.cities(query)})
+        if path == "occurrences":
+            return self.occurrences_page(request, query)
+        return self.json(request, {"msg": "Not Found"}, 404)
+
+    def json(self, request, data, status_code=200, headers=None):
+        return httpx.Response(
+            status_code, json=data, headers=headers, request=request
+        )
+
+    def login(self, request):
+        credentials = loads(request.content)
+        if self.credentials and credentials != self.credentials:
+            return self.json(request, {"msg": "Invalid credentials"}, 401)
+
+        token = uuid4().hex
+        self.tokens[token] = monotonic() + self.token_ttl
+        data = {"accessToken": token, "expiresIn": self.token_ttl}
+        return self.json(request, {"data": data}, 201)
+
+    def is_authorized(self, request):
+        authorization = request.headers.get("authorization", "")
+        token = authorization.removeprefix("Bearer ")
+        return monotonic() < self.tokens.get(token, 0)
+
+    def states(self):
+        states = {}
+        for occurrence in self.occurrences:
+            state = occurrence["state"]
+            states[state["id"]] = state
+        return list(states.values())
+
+    def cities(self, query):
+        cities = {}
+        for occurrence in self.occurrences:
+            city = dict(occurrence["city"], state=occurrence["state"])
+            cities[city["id"]] = city
+
+        filters = (
+            ("cityId", lambda city, value: city["id"] == value),
+            (
+                "cityName",
+                lambda city, value: value.casefold() in city["name"].casefold(),
+            ),
+            ("stateId", lambda city, value: city["state"]["id"] == value),
+        )
+        cities = list(cities.values())
+        for key, test in filters:
+            if key in query:
+                value, *_ = query[key]
+                cities = [city for city in cities if test(city, value)]
+        return cities
+
+    def match(self, occurrence, query):
+        if occurrence["state"]["id"] not in query.get("idState", ()):
+            return False
+        if "idCities" in query and occurrence["city"]["id"] not in query.get(
+            "idCities"
+        ):
+            return False
+
+        type_occurrence, *_ = query.get("typeOccurrence", ("all",))
+        if type_occurrence == "withVictim" and not occurrence["victims"]:
+            return False
+        if type_occurrence == "withoutVictim" and occurrence["victims"]:
+            return False
+
+        day = occurrence["date"][:10]
+        if "initialdate" in query and day < query["initialdate"][0]:
+            return False
+        if "finaldate" in query and day > query["finaldate"][0]:
+            return False
+        return True
+
+    def headers(self, query):
+        timestamp = int(self.last_update.timestamp())
+        headers = {
+            "X-Last-Update": f"{self.last_update.isoformat()}-03:00",
+            "X-Last-Update-Timestamp": str(timestamp),
+        }
+        if state_id := query.get("idState"):
+            headers["X-Last-Update-State-Id"] = state_id[0]
+            headers["X-Last-Update-State"] = headers["X-Last-Update"]
+            headers["X-Last-Update-State-Timestamp"] = str(timestamp)
+        return headers
+
+    def occurrences_page(self, request, query):
+        number = int(query.pop("page", (1,))[0])
+        take = min(int(query.pop("take", (self.take,))[0]), self.max_take)
+
+        # filtered occurrences are cached, so paginating is cheap
+        key = tuple(sorted((key, tuple(value)) for key, value in query.items()))
+        if key not in self.matches:
+            self.matches[key] = [
+                item for item in self.occurrences if self.match(item, query)
+            ]
+        data = self.matches[key]
+        page_count = max(1, ceil(len(data) / take))
+        meta = {
+            "page": number,
+            "take": take,
+            "itemCount": len(data),
+            "pageCount": page_count,
+            "hasPreviousPage": number > 1,
+            "hasNextPage": number < page_count,
+        }
+        offset = (number - 1) * take
+        body = {"pageMeta": meta, "data": data[offset : offset + take]}
+        return self.json(request, body, headers=self.headers(query))
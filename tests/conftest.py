@@ -5,6 +5,7 @@ import httpx
 from pytest import fixture
 
 from crossfire.clients import AsyncClient, Token
+from crossfire.testing import FakeAPI
 
 DEFAULT_TOKEN_EXPIRES_IN = 3600
 TOKEN = Token("42", DEFAULT_TOKEN_EXPIRES_IN)
@@ -18,6 +19,7 @@ def async_respond_with(method_name, data):
     mock = Mock()
     mock.json.return_value = data
     mock.headers = {}
+    mock.content = b""
     with patch.object(
         httpx.AsyncClient, method_name, new_callable=AsyncMock
     ) as method:
@@ -34,6 +36,24 @@ def client():
         yield client
 
 
+@fixture
+def fake_api_client():
+    """Creates clients talking to `api` (a `FakeAPI` by default), without
+    progress bars. Other arguments are passed to `AsyncClient`."""
+
+    def create(api=None, **kwargs):
+        client = AsyncClient(
+            email="email",
+            password="password",
+            transport=api or FakeAPI(),
+            **{"progress": False, **kwargs},
+        )
+        client.URL = "http://fake.api/api/v2"
+        return client
+
+    return create
+
+
 @fixture
 def token_client_and_post_mock(client):
     data = {
@@ -0,0 +1,177 @@
+from collections import Counter
+
+from httpx import HTTPStatusError
+from pytest import mark, raises
+
+from crossfire.aggregate import (
+    Aggregation,
+    ListValueError,
+    UnknownMetricError,
+    value,
+)
+from crossfire.clients.occurrences import Occurrences, UnsupportedOptionError
+from crossfire.errors import DeadlineExceededError
+from crossfire.records import to_records
+from crossfire.testing import STATES, FakeAPI, SyntheticData
+
+try:
+    from pandas import DataFrame
+
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+skip_if_pandas_not_installed = mark.skipif(
+    not HAS_PANDAS, reason="pandas is not installed"
+)
+
+OCCURRENCES = SyntheticData().occurrences(50)
+
+
+def test_value_of_paths():
+    occurrence = {
+        "date": "2023-10-20T14:30:00.000Z",
+        "policeAction": True,
+        "city": {"id": "1", "name": "Rio de Janeiro"},
+        "contextInfo": {"mainReason": {"id": "1", "name": "Briga"}},
+        "neighborhood": None,
+    }
+    assert value(occurrence, "day") == "2023-10-20"
+    assert value(occurrence, "month") == "2023-10"
+    assert value(occurrence, "year") == "2023"
+    assert value(occurrence, "policeAction") is True
+    assert value(occurrence, "city") == "Rio de Janeiro"
+    assert value(occurrence, "city.id") == "1"
+    assert value(occurrence, "contextInfo.mainReason") == "Briga"
+    assert value(occurrence, "neighborhood.name") is None
+
+
+def test_aggregation_counts_and_sums_victims():
+    aggregation = Aggregation(["city", "policeAction"], ["count", "victims"])
+    aggregation.add(OCCURRENCES[:20]).add(OCCURRENCES[20:])
+
+    rows = aggregation()
+    counts = Counter(
+        (item["city"]["name"], item["policeAction"]) for item in OCCURRENCES
+    )
+    assert {
+        (row["city"], row["policeAction"]): row["count"] for row in rows
+    } == (dict(counts))
+    assert sum(row["victims"] for row in rows) == sum(
+        len(item["victims"]) for item in OCCURRENCES
+    )
+    assert rows == sorted(
+        rows, key=lambda row: (row["city"], row["policeAction"])
+    )
+
+
+def test_aggregation_groups_objects_by_id():
+    occurrences = [
+        {"neighborhood": {"id": "1", "name": "Centro"}},
+        {"neighborhood": {"id": "2", "name": "Centro"}},
+        {"neighborhood": {"id": "1", "name": "Centro"}},
+    ]
+    rows = Aggregation("neighborhood").add(occurrences)()
+    assert rows == [
+        {"neighborhood": "Centro", "count": 2},
+        {"neighborhood": "Centro", "count": 1},
+    ]
+
+
+def test_aggregation_raises_error_for_lists():
+    with raises(ListValueError):
+        Aggregation("victims").add(OCCURRENCES)
+    with raises(ListValueError):
+        Aggregation("victims.situation").add(OCCURRENCES)
+
+
+def test_aggregation_killed_and_wounded():
+    rows = Aggregation("year", ["victims", "killed", "wounded"]).add(
+        OCCURRENCES
+    )()
+    for row in rows:
+        assert row["killed"] + row["wounded"] == row["victims"]
+
+
+def test_aggregation_accepts_records_and_custom_metrics():
+    metric = ("with_address", lambda occurrence: bool(occurrence["address"]))
+    by_dict = Aggregation("month", ["count", metric]).add(OCCURRENCES)()
+    by_record = Aggregation("month", ["count", metric]).add(
+        to_records(OCCURRENCES)
+    )()
+    assert by_dict == by_record
+    assert by_dict[0].keys() == {"month", "count", "with_address"}
+
+
+def test_aggregation_raises_error_for_unknown_metric():
+    with raises(UnknownMetricError):
+        Aggregation("day", ["median"])
+
+
+@skip_if_pandas_not_installed
+def test_aggregation_as_df():
+    df = Aggregation("day").add(OCCURRENCES)(format="df")
+    assert isinstance(df, DataFrame)
+    assert list(df.columns) == ["day", "count"]
+    assert df["count"].sum() == len(OCCURRENCES)
+
+
+@mark.asyncio
+async def test_client_aggregate(fake_api_client):
+    api = FakeAPI(total=300, take=10)
+    client = fake_api_client(api)
+    query = {"id_state": STATES[0][0], "format": "df"}
+
+    rows = await client.aggregate(query, by="contextInfo.mainReason")
+    occurrences = await Occurrences(client, STATES[0][0])()
+    counts = Counter(
+        item["contextInfo"]["mainReason"]["name"] for item in occurrences
+    )
+    assert {row["contextInfo.mainReason"]: row["count"] for row in rows} == (
+        dict(counts)
+    )
+
+
+class FailingPageAPI(FakeAPI):
+    """Fails page 2 of occurrences queries."""
+
+    async def handle_async_request(self, request):
+        if b"page=2&" in request.url.query + b"&":
+            return self.json(request, {"msg": "Boom!"}, 500)
+        return await super().handle_async_request(request)
+
+
+@mark.asyncio
+async def test_client_aggregate_with_timeout(fake_api_client):
+    client = fake_api_client(FakeAPI(total=300, take=10, latency=5))
+    query = {"id_state": STATES[0][0], "timeout": 0.05}
+    with raises(DeadlineExceededError):
+        await client.aggregate(query, by="year")
+
+
+@mark.asyncio
+async def test_client_aggregate_with_partial_results(fake_api_client):
+    client = fake_api_client(FailingPageAPI(total=300, take=10))
+    query = {"id_state": STATES[0][0], "on_error": "partial"}
+    rows, report = await client.aggregate(query, by="year")
+    assert report.pages == [2]
+    total = sum(row["count"] for row in rows)
+    assert (
+        total
+        == client.item_counts[f"idState={STATES[0][0]}&typeOccurrence=all"] - 10
+    )
+
+    with raises(HTTPStatusError):
+        await client.aggregate({"id_state": STATES[0][0]}, by="year")
+
+
+@mark.asyncio
+@mark.parametrize(
+    "option", ({"prefetch": 4}, {"snapshot": "."}, {"max_memory": "1GB"})
+)
+async def test_client_aggregate_rejects_unsupported_options(
+    option, fake_api_client
+):
+    client = fake_api_client(FakeAPI(total=10))
+    with raises(UnsupportedOptionError):
+        await client.aggregate({"id_state": STATES[0][0], **option}, by="year")
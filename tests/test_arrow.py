@@ -0,0 +1,156 @@
+import os
+
+from pytest import importorskip, mark, raises
+
+pyarrow = importorskip("pyarrow")
+
+from crossfire.arrow import (  # noqa: E402
+    SizeError,
+    Spill,
+    concat,
+    parse_size,
+    points,
+    read_snapshot,
+    spill,
+    to_table,
+    write_geoparquet,
+    write_snapshot,
+)
+from crossfire.testing import SyntheticData  # noqa: E402
+
+
+@mark.parametrize(
+    "size,expected",
+    (
+        (1024, 1024),
+        ("1024", 1024),
+        ("1KB", 1024),
+        ("500MB", 500 * 1024**2),
+        ("2 GiB", 2 * 1024**3),
+        ("1.5g", int(1.5 * 1024**3)),
+    ),
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+@mark.parametrize("size", (0, -1, True, "", "lots", "0MB", "5 PB"))
+def test_parse_size_raises_error_for_invalid_sizes(size):
+    with raises(SizeError):
+        parse_size(size)
+
+
+def test_concat_merges_nested_objects_with_different_keys():
+    first = to_table([{"id": 1, "city": {"id": "a"}, "victims": []}])
+    second = to_table(
+        [
+            {
+                "id": 2,
+                "city": {"id": "b", "name": "B"},
+                "victims": [{"age": 7}],
+                "extra": "x",
+            }
+        ]
+    )
+    table = concat([first, second])
+    assert table.to_pylist() == [
+        {
+            "id": 1,
+            "city": {"id": "a", "name": None},
+            "victims": [],
+            "extra": None,
+        },
+        {
+            "id": 2,
+            "city": {"id": "b", "name": "B"},
+            "victims": [{"age": 7}],
+            "extra": "x",
+        },
+    ]
+
+
+def test_concat_falls_back_to_strings_for_incompatible_types():
+    first = to_table([{"value": {"a": 1}}])
+    second = to_table([{"value": "text"}])
+    assert concat([first, second]).column("value").to_pylist() == [
+        '{"a": 1}',
+        "text",
+    ]
+
+
+def test_spill_memory_maps_a_temporary_file(tmp_path):
+    table = to_table([{"id": n} for n in range(10)])
+    mapped = spill(table, directory=tmp_path)
+    assert mapped.equals(table)
+    assert not os.listdir(tmp_path)
+
+
+def test_spill_keeps_pages_in_memory_up_to_the_budget(tmp_path):
+    pages = [[{"id": n, "name": f"name {n}"}] * 100 for n in range(5)]
+    budget = to_table(pages[0]).nbytes * 2
+    data = Spill(budget, directory=tmp_path)
+    for page in pages:
+        data.append(page)
+
+    assert len(data.spilled) == 1
+    assert len(data.buffered) == 2
+    assert data().to_pylist() == [item for page in pages for item in page]
+
+
+def test_spill_counts_pages_waiting_for_earlier_ones(tmp_path):
+    pages = [[{"id": n, "name": f"name {n}"}] * 100 for n in range(6)]
+    budget = to_table(pages[0]).nbytes * 2
+    data = Spill(budget, directory=tmp_path)
+    for number in (3, 4, 5, 6):
+        data.add(number, pages[number - 1])
+        assert data.held_bytes <= budget
+
+    # pages 3 to 5 were written to disk, only page 6 is in memory
+    assert data.held_bytes == to_table(pages[5]).nbytes
+    data.add(2, pages[1])
+    data.add(1, pages[0])
+    assert not data.held
+    assert data().to_pylist() == [item for page in pages for item in page]
+
+
+def test_spill_skips_failed_pages(tmp_path):
+    pages = [[{"id": n}] * 10 for n in range(3)]
+    data = Spill("1MB", directory=tmp_path)
+    data.add(3, pages[2])
+    data.add(2, None)
+    data.add(1, pages[0])
+    data.add(2, None)  # already skipped
+    assert data().to_pylist() == pages[0] + pages[2]
+
+
+def test_points_are_wkb_built_from_coordinates():
+    from struct import pack
+
+    array = points([1.5, None, "-43.2"], [2.5, -22.9, "-22.9"])
+    assert array.to_pylist() == [
+        pack("<BIdd", 1, 1, 1.5, 2.5),
+        None,
+        pack("<BIdd", 1, 1, -43.2, -22.9),
+    ]
+
+
+def test_write_geoparquet(tmp_path):
+    geopandas = importorskip("geopandas")
+    occurrences = SyntheticData().occurrences(10)
+    path = tmp_path / "occurrences.parquet"
+    write_geoparquet(occurrences, path)
+
+    gdf = geopandas.read_parquet(path)
+    assert len(gdf) == 10
+    assert gdf.crs.to_epsg() in (4326, None)  # OGC:CRS84 has no EPSG code
+    assert gdf.geometry.x.tolist() == [
+        float(item["longitude"]) for item in occurrences
+    ]
+
+
+def test_write_snapshot_leaves_no_temporary_files(tmp_path):
+    path = tmp_path / "snapshot.arrow"
+    write_snapshot(pyarrow.table({"id": [1, 2]}), path)
+    write_snapshot(pyarrow.table({"id": [3]}), path)
+    assert [p.name for p in tmp_path.iterdir()] == ["snapshot.arrow"]
+    assert read_snapshot(path).column("id").to_pylist() == [3]
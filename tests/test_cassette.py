@@ -0,0 +1,109 @@
+import gzip
+from unittest.mock import patch
+
+from pytest import mark, raises
+
+from crossfire.cassette import (
+    REDACTED,
+    RecordingTransport,
+    ReplayTransport,
+    UnrecordedRequestError,
+    load,
+)
+from crossfire.clients import AsyncClient
+from crossfire.testing import FakeAPI
+
+STATE = "b112ffbe-17b3-4ad0-8f2a-2038745d1d14"
+
+
+async def record(path, latency=0):
+    api = FakeAPI(total=45, latency=latency)
+    client = AsyncClient(
+        "fake@crossfire",
+        "secret",
+        transport=RecordingTransport(path, transport=api),
+        progress=False,
+    )
+    states, _ = await client.states()
+    cities, _ = await client.cities(state_id=STATE)
+    occurrences = await client.occurrences(STATE)
+    return states, cities, occurrences
+
+
+def replay(path, latency=False):
+    return AsyncClient(
+        "someone@crossfire",
+        "other",
+        transport=ReplayTransport(path, latency=latency),
+        progress=False,
+    )
+
+
+@mark.asyncio
+async def test_recorded_cassette_has_the_exchanges(tmp_path):
+    path = tmp_path / "cassette.jsonl.gz"
+    await record(path)
+    interactions = load(path)
+    urls = [interaction["url"] for interaction in interactions]
+    assert urls[0].endswith("/auth/login")
+    assert any("/states" in url for url in urls)
+    assert any("/cities" in url for url in urls)
+    assert any("/occurrences" in url for url in urls)
+    for interaction in interactions:
+        assert interaction["elapsed"] >= 0
+        assert interaction["offset"] >= 0
+        assert interaction["headers"]
+
+
+@mark.asyncio
+async def test_recorded_cassette_has_no_credentials(tmp_path):
+    path = tmp_path / "cassette.jsonl.gz"
+    await record(path)
+    with gzip.open(path, "rt") as cassette:
+        contents = cassette.read()
+    assert "fake@crossfire" not in contents
+    assert "secret" not in contents
+
+    login, *others = load(path)
+    assert REDACTED in login["body"]
+    for interaction in others:
+        headers = dict(interaction["request_headers"])
+        assert headers["authorization"] == REDACTED
+
+
+@mark.asyncio
+async def test_replay_returns_the_recorded_data(tmp_path):
+    path = tmp_path / "cassette.jsonl.gz"
+    states, cities, occurrences = await record(path)
+    client = replay(path)
+    assert (await client.states())[0] == states
+    assert (await client.cities(state_id=STATE))[0] == cities
+    assert await client.occurrences(STATE) == occurrences
+
+
+@mark.asyncio
+async def test_replay_with_recorded_latency(tmp_path):
+    path = tmp_path / "cassette.jsonl.gz"
+    await record(path, latency=0.1)
+
+    with patch("crossfire.cassette.sleep") as sleep:
+        await replay(path).states()
+        sleep.assert_not_called()
+
+        await replay(path, latency=True).states()
+        recorded = [call.args[0] for call in sleep.call_args_list]
+        assert len(recorded) == 2  # login and states
+        assert all(seconds >= 0.1 for seconds in recorded)
+
+        sleep.reset_mock()
+        await replay(path, latency=0.5).states()
+        halved = [call.args[0] for call in sleep.call_args_list]
+        assert halved == [seconds * 0.5 for seconds in recorded]
+
+
+@mark.asyncio
+async def test_replay_raises_for_unrecorded_requests(tmp_path):
+    path = tmp_path / "cassette.jsonl.gz"
+    await record(path)
+    with raises(UnrecordedRequestError):
+        await replay(path).occurrences(STATE, type_occurrence="withVictim")
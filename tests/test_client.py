@@ -1,4 +1,5 @@
 import importlib
+from asyncio import gather
 from datetime import datetime, timedelta
 from time import sleep
 from unittest.mock import patch
@@ -15,6 +16,7 @@ from crossfire.clients import (
     Token,
 )
 from crossfire.parser import UnknownFormatError
+from crossfire.testing import FakeAPI
 
 if importlib.util.find_spec("pandas"):
     HAS_PANDAS = True
@@ -146,6 +148,48 @@ async def test_async_client_raises_error_for_too_many_requests(
         await client.get()
 
 
+@mark.asyncio
+async def test_async_client_coalesces_identical_concurrent_requests(
+    state_client_and_get_mock,
+):
+    client, mock = state_client_and_get_mock
+    (first, _), (second, _) = await gather(client.states(), client.states())
+    mock.assert_called_once()
+    assert first == second
+    assert client.metrics.coalesced["/states"] == 1
+    assert not client.requests_in_flight
+
+    await client.states()
+    assert mock.call_count == 2
+
+
+@mark.asyncio
+async def test_async_client_does_not_coalesce_different_requests(
+    client_and_get_mock,
+):
+    client, mock = client_and_get_mock
+    await gather(
+        client.get("my-url"),
+        client.get("my-url", headers={"answer": "forty-two"}),
+        client.get("other-url"),
+    )
+    assert mock.call_count == 3
+
+
+@mark.asyncio
+async def test_async_client_shares_errors_of_coalesced_requests(
+    client_and_get_mock,
+):
+    client, mock = client_and_get_mock
+    mock.return_value.status_code = 429
+    mock.return_value.headers = {"Retry-After": "42"}
+    results = await gather(
+        client.get("my-url"), client.get("my-url"), return_exceptions=True
+    )
+    assert all(isinstance(result, RetryAfterError) for result in results)
+    mock.assert_called_once()
+
+
 @mark.asyncio
 async def test_async_client_load_states(state_client_and_get_mock):
     client, mock = state_client_and_get_mock
@@ -295,6 +339,15 @@ async def test_client_runs_when_async_loop_is_running():
     await task
 
 
+def test_client_closes_connections_and_worker_processes():
+    with Client("email", "password", parse_workers=1) as client:
+        pool = client.executor()
+    assert client.client.is_closed
+    assert client.pool is None
+    with raises(RuntimeError):
+        pool.submit(print)
+
+
 def test_client_load_states():
     with patch("crossfire.clients.config") as config_mock:
         with patch.object(AsyncClient, "states") as async_states_mock:
@@ -348,4 +401,25 @@ def test_client_load_occurrences():
                 max_parallel_requests=None,
                 format=None,
                 flat=False,
+                prefetch=None,
+                page_size=None,
+                max_memory=None,
+                snapshot=None,
+                timeout=None,
+                max_retries=None,
+                on_error="raise",
+                priority=1,
             )
+
+
+@mark.asyncio
+async def test_async_client_coalesced_requests_are_parsed_for_each_caller(
+    fake_api_client,
+):
+    api = FakeAPI(total=10, latency=0.01)
+    client = fake_api_client(api)
+    await client.token()
+    (first, _), (second, _) = await gather(client.states(), client.states())
+    assert first == second
+    assert first is not second
+    assert api.requests["states"] == 1
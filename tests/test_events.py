@@ -0,0 +1,98 @@
+from unittest.mock import AsyncMock, Mock, patch
+
+from httpx import ReadTimeout
+from pytest import mark
+
+from crossfire.clients import AsyncClient
+from crossfire.clients.occurrences import Occurrences
+from crossfire.events import Events, Subscriber, TqdmProgress
+from crossfire.testing import STATES, FakeAPI
+
+
+class Recorder(Subscriber):
+    def __init__(self):
+        self.events = []
+
+    def on_page_started(self, query, page):
+        self.events.append(("page_started", page))
+
+    def on_page_finished(self, query, page):
+        self.events.append(("page_finished", page))
+
+    def on_page_retried(self, query, page, wait, error):
+        self.events.append(("page_retried", page, wait))
+
+    def on_query_planned(self, query, total_pages):
+        self.events.append(("query_planned", total_pages))
+
+    def on_query_done(self, query):
+        self.events.append(("query_done",))
+
+
+def test_events_dispatches_to_subscribers_implementing_handlers():
+    only_done = Mock(spec=["on_query_done"])
+    recorder = Recorder()
+    events = Events(only_done, recorder)
+    events.emit("page_started", query=None, page=1)
+    events.emit("query_done", query=None)
+    assert recorder.events == [("page_started", 1), ("query_done",)]
+    only_done.on_query_done.assert_called_once_with(query=None)
+
+
+def test_events_unsubscribe():
+    recorder = Recorder()
+    events = Events(recorder)
+    events.unsubscribe(recorder)
+    events.emit("query_done", query=None)
+    assert not recorder.events
+
+
+def test_tqdm_progress_creates_a_bar_per_query():
+    with patch("crossfire.events.tqdm") as tqdm:
+        progress = TqdmProgress()
+        progress.on_page_finished(query="q", page=1)
+        progress.on_query_planned(query="q", total_pages=3)
+        progress.on_page_finished(query="q", page=2)
+        progress.on_query_done(query="q")
+
+    tqdm.assert_called_once_with(
+        total=3, initial=1, desc="Loading pages", unit="page"
+    )
+    tqdm.return_value.update.assert_called_once_with(1)
+    tqdm.return_value.close.assert_called_once_with()
+
+
+def test_client_without_progress_has_no_subscribers():
+    client = AsyncClient(email="email", password="password", progress=False)
+    assert not client.events.subscribers
+    client = AsyncClient(email="email", password="password")
+    assert isinstance(client.events.subscribers[0], TqdmProgress)
+
+
+@mark.asyncio
+async def test_occurrences_emits_events(fake_api_client):
+    client = fake_api_client(FakeAPI(total=10, take=5))
+    recorder = client.events.subscribe(Recorder())
+    occurrences = await client.occurrences(STATES[0][0])
+    pages = -(-len(occurrences) // 5)
+
+    assert recorder.events[:3] == [
+        ("page_started", 1),
+        ("page_finished", 1),
+        ("query_planned", pages),
+    ]
+    assert recorder.events[-1] == ("query_done",)
+    finished = [
+        event for event in recorder.events if event[0] == "page_finished"
+    ]
+    assert len(finished) == pages
+
+
+@mark.asyncio
+async def test_occurrences_emits_retries(occurrences_client_and_get_mock):
+    client, mock = occurrences_client_and_get_mock
+    mock.side_effect = (ReadTimeout("Boom!"), mock.return_value)
+    recorder = client.events.subscribe(Recorder())
+    with patch("crossfire.clients.occurrences.sleep", new_callable=AsyncMock):
+        await Occurrences(client, id_state=42)()
+    assert ("page_retried", 1, 1) in recorder.events
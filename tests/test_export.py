@@ -0,0 +1,270 @@
+import csv
+import json
+
+from pytest import fixture, importorskip, mark, raises
+
+from crossfire import cli
+from crossfire.clients.occurrences import Occurrences, UnsupportedOptionError
+from crossfire.errors import DeadlineExceededError
+from crossfire.export import (
+    HAS_PYARROW,
+    WRITERS,
+    ResumeError,
+    UnknownExportFormatError,
+    export,
+)
+from crossfire.testing import STATES, FakeAPI
+
+STATE_ID, STATE_NAME = STATES[0]
+
+skip_if_pyarrow_not_installed = mark.skipif(
+    not HAS_PYARROW, reason="pyarrow is not installed"
+)
+
+
+@fixture
+def fake_client(fake_api_client):
+    """Same as `fake_api_client`, with the API used by these tests. Accepts
+    the arguments of `AsyncClient`, so it can replace it in the CLI."""
+
+    def create(**kwargs):
+        return fake_api_client(FakeAPI(total=200, take=10), **kwargs)
+
+    return create
+
+
+@fixture
+def client(fake_client):
+    return fake_client()
+
+
+def read_ndjson(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@mark.asyncio
+async def test_export_to_ndjson(client, tmp_path):
+    expected = await Occurrences(client, STATE_ID)()
+    output = tmp_path / "occurrences.ndjson"
+    pages = await export(client, output, id_state=STATE_ID)
+    assert pages > 1
+    occurrences = read_ndjson(output)
+    assert sorted(occurrences, key=lambda item: item["id"]) == sorted(
+        expected, key=lambda item: item["id"]
+    )
+    assert not (tmp_path / "occurrences.ndjson.progress.json").exists()
+
+
+@mark.asyncio
+async def test_export_to_csv(client, tmp_path):
+    expected = await Occurrences(client, STATE_ID)()
+    output = tmp_path / "occurrences.csv"
+    await export(client, output, format="csv", id_state=STATE_ID)
+    with output.open() as handler:
+        rows = list(csv.DictReader(handler))
+    assert len(rows) == len(expected)
+    assert {row["id"] for row in rows} == {item["id"] for item in expected}
+    assert json.loads(rows[0]["state"])["id"] == STATE_ID
+
+
+@skip_if_pyarrow_not_installed
+@mark.asyncio
+async def test_export_to_parquet(client, tmp_path):
+    expected = await Occurrences(client, STATE_ID)()
+    from pyarrow import parquet
+
+    output = tmp_path / "occurrences.parquet"
+    await export(client, output, format="parquet", id_state=STATE_ID)
+    table = parquet.read_table(output)
+    assert table.num_rows == len(expected)
+    assert set(table.column("id").to_pylist()) == {
+        item["id"] for item in expected
+    }
+
+    types = {field.name: str(field.type) for field in table.schema}
+    assert types["documentNumber"] == "int64"
+    assert types["latitude"] == types["longitude"] == "double"
+    assert types["date"] == "timestamp[ms, tz=UTC]"
+    assert types["policeAction"] == "bool"
+    assert types["state"] == "string"
+    rows = {row["id"]: row for row in table.to_pylist()}
+    for item in expected:
+        row = rows[item["id"]]
+        assert row["latitude"] == float(item["latitude"])
+        assert row["date"].isoformat()[:19] == item["date"][:19]
+        assert json.loads(row["state"]) == item["state"]
+
+
+@mark.asyncio
+async def test_export_raises_error_for_unknown_format(client, tmp_path):
+    with raises(UnknownExportFormatError):
+        await export(client, tmp_path / "out", format="xml", id_state=STATE_ID)
+
+
+@mark.asyncio
+@mark.parametrize(
+    "option",
+    (
+        {"on_error": "partial"},
+        {"prefetch": 4},
+        {"snapshot": "."},
+        {"max_memory": "1GB"},
+    ),
+)
+async def test_export_rejects_unsupported_options(client, tmp_path, option):
+    with raises(UnsupportedOptionError):
+        await export(client, tmp_path / "out", id_state=STATE_ID, **option)
+
+
+@mark.asyncio
+async def test_export_with_timeout(tmp_path, fake_api_client):
+    client = fake_api_client(FakeAPI(total=200, take=10, latency=5))
+    with raises(DeadlineExceededError):
+        await export(client, tmp_path / "out", id_state=STATE_ID, timeout=0.05)
+
+
+@mark.asyncio
+async def test_export_cannot_resume_parquet(client, tmp_path):
+    with raises(ResumeError):
+        await export(
+            client,
+            tmp_path / "out.parquet",
+            format="parquet",
+            resume=True,
+            id_state=STATE_ID,
+        )
+
+
+class Interrupted(Exception):
+    pass
+
+
+@mark.asyncio
+@mark.parametrize("format", ("ndjson", "csv"))
+async def test_export_resumes_interrupted_export(
+    client, tmp_path, monkeypatch, format
+):
+    expected = await Occurrences(client, STATE_ID)()
+    output = tmp_path / f"occurrences.{format}"
+    writer = WRITERS[format]
+    write = writer.write
+    calls = []
+
+    def interrupt_after_three_pages(self, page):
+        if len(calls) == 3:
+            self.file.write(b"partial page")
+            raise Interrupted()
+        calls.append(page)
+        write(self, page)
+
+    monkeypatch.setattr(writer, "write", interrupt_after_three_pages)
+    with raises(Interrupted):
+        await export(client, output, format=format, id_state=STATE_ID)
+    assert (tmp_path / f"occurrences.{format}.progress.json").exists()
+
+    monkeypatch.setattr(writer, "write", write)
+    pages = await export(
+        client, output, format=format, resume=True, id_state=STATE_ID
+    )
+    assert (
+        pages
+        == client.page_counts[f"idState={STATE_ID}&typeOccurrence=all"] - 3
+    )
+
+    if format == "ndjson":
+        ids = [item["id"] for item in read_ndjson(output)]
+    else:
+        with output.open() as handler:
+            ids = [row["id"] for row in csv.DictReader(handler)]
+    assert sorted(ids) == sorted(item["id"] for item in expected)
+
+
+@mark.asyncio
+async def test_export_refuses_to_resume_a_different_query(client, tmp_path):
+    output = tmp_path / "occurrences.ndjson"
+    checkpoint = tmp_path / "occurrences.ndjson.progress.json"
+    output.write_text("")
+    checkpoint.write_text(
+        json.dumps(
+            {
+                "query": {"id_state": "other"},
+                "format": "ndjson",
+                "take": None,
+                "pages": [1],
+                "offset": 0,
+            }
+        )
+    )
+    with raises(ResumeError):
+        await export(client, output, resume=True, id_state=STATE_ID)
+
+
+def test_cli_exports_occurrences(tmp_path, monkeypatch, fake_client):
+    monkeypatch.setattr(cli, "AsyncClient", fake_client)
+    output = tmp_path / "occurrences.ndjson"
+    code = cli.main(
+        [
+            "export",
+            "--state",
+            STATE_NAME,
+            "--page-size",
+            "50",
+            "--concurrency",
+            "2",
+            "--quiet",
+            "-o",
+            str(output),
+        ]
+    )
+    assert code == 0
+    occurrences = read_ndjson(output)
+    assert occurrences
+    assert {item["state"]["id"] for item in occurrences} == {STATE_ID}
+
+
+def test_cli_closes_the_client(tmp_path, monkeypatch, fake_client):
+    clients = []
+
+    def client(**kwargs):
+        clients.append(fake_client(**kwargs))
+        return clients[-1]
+
+    monkeypatch.setattr(cli, "AsyncClient", client)
+    output = tmp_path / "occurrences.ndjson"
+    args = ["export", "--state", STATE_ID, "--quiet", "-o", str(output)]
+    assert cli.main(args) == 0
+    assert clients[0].client.is_closed
+
+
+def test_cli_reports_unknown_places(tmp_path, monkeypatch, capsys, fake_client):
+    monkeypatch.setattr(cli, "AsyncClient", fake_client)
+    output = tmp_path / "occurrences.ndjson"
+    code = cli.main(["export", "--state", "Atlantis", "-o", str(output)])
+    assert code == 1
+    assert "Atlantis" in capsys.readouterr().err
+
+
+@mark.parametrize("value", ("0", "-5", "big"))
+def test_cli_rejects_invalid_page_size(value):
+    with raises(SystemExit):
+        cli.parser().parse_args(
+            ["export", "--state", "x", "-o", "out", "--page-size", value]
+        )
+
+
+@skip_if_pyarrow_not_installed
+@mark.asyncio
+async def test_export_to_geoparquet(client, tmp_path):
+    geopandas = importorskip("geopandas")
+    expected = await Occurrences(client, STATE_ID)()
+    output = tmp_path / "occurrences.parquet"
+    await export(client, output, format="geoparquet", id_state=STATE_ID)
+
+    gdf = geopandas.read_parquet(output)
+    assert len(gdf) == len(expected)
+    coordinates = {
+        item["id"]: (float(item["longitude"]), float(item["latitude"]))
+        for item in expected
+    }
+    for id, point in zip(gdf["id"], gdf.geometry):
+        assert (point.x, point.y) == coordinates[id]
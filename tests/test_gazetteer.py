@@ -0,0 +1,113 @@
+from pytest import mark, raises
+
+from crossfire.gazetteer import Gazetteer, UnknownPlaceKindError, normalize
+from crossfire.records import Occurrence
+from crossfire.testing import STATES, FakeAPI, SyntheticData
+
+STATES_DATA = [{"id": "rj", "name": "Rio de Janeiro"}]
+CITIES_DATA = [
+    {"id": "1", "name": "Rio de Janeiro", "state": {"id": "rj"}},
+    {"id": "2", "name": "São Gonçalo", "state": {"id": "rj"}},
+    {"id": "3", "name": "São João de Meriti", "state": {"id": "rj"}},
+    {"id": "4", "name": "Jaboatão dos Guararapes", "state": {"id": "pe"}},
+]
+OCCURRENCES = [
+    {
+        "state": {"id": "rj", "name": "Rio de Janeiro"},
+        "city": {"id": "1", "name": "Rio de Janeiro"},
+        "neighborhood": {"id": "n1", "name": "Centro"},
+        "locality": {"id": "l1", "name": "Complexo da Maré"},
+    },
+    {
+        "state": {"id": "rj", "name": "Rio de Janeiro"},
+        "city": {"id": "2", "name": "São Gonçalo"},
+        "neighborhood": {"id": "n2", "name": "Centro"},
+        "subNeighborhood": None,
+    },
+]
+
+
+@mark.parametrize(
+    "name",
+    ("São Gonçalo", "SAO GONCALO", " sao-goncalo ", "São  Gonçalo"),
+)
+def test_normalize(name):
+    assert normalize(name) == "sao goncalo"
+
+
+def test_gazetteer_resolves_names_ignoring_case_and_accents():
+    gazetteer = Gazetteer.from_reference(STATES_DATA, CITIES_DATA)
+    assert len(gazetteer) == 5
+    assert gazetteer.resolve("Sao Goncalo") == "2"
+    assert gazetteer.resolve("jaboatão dos guararapes") == "4"
+    assert gazetteer.resolve("RIO DE JANEIRO") == "1"
+    assert gazetteer.resolve("RIO DE JANEIRO", kind="state") == "rj"
+    assert gazetteer.resolve("Niterói") is None
+
+
+def test_gazetteer_resolves_unique_prefixes():
+    gazetteer = Gazetteer.from_reference(STATES_DATA, CITIES_DATA)
+    assert gazetteer.resolve("jaboatao") == "4"
+    assert gazetteer.resolve("jaboatao", prefix=False) is None
+    assert gazetteer.resolve("Sao") is None  # ambiguous
+
+
+def test_gazetteer_resolves_many_names():
+    gazetteer = Gazetteer.from_reference(STATES_DATA, CITIES_DATA)
+    names = ["Sao Goncalo", "RIO DE JANEIRO", None, "Sao Goncalo", "?"]
+    assert gazetteer.resolve_many(names) == ["2", "1", None, "2", None]
+
+
+def test_gazetteer_resolves_many_names_from_a_generator():
+    gazetteer = Gazetteer.from_reference(STATES_DATA, CITIES_DATA)
+    names = (name for name in ("Sao Goncalo", "?", "Sao Goncalo"))
+    assert gazetteer.resolve_many(names) == ["2", None, "2"]
+
+
+def test_gazetteer_adds_places_from_occurrences():
+    gazetteer = Gazetteer()
+    gazetteer.add_occurrences(OCCURRENCES)
+    assert gazetteer.resolve("centro", kind="neighborhood") is None
+    assert gazetteer.resolve("centro", kind="neighborhood", parent="2") == "n2"
+    assert gazetteer.resolve("complexo da mare", kind="locality") == "l1"
+    assert gazetteer.resolve("Sao Goncalo") == "2"
+
+
+def test_gazetteer_adds_places_from_records():
+    gazetteer = Gazetteer()
+    gazetteer.add_occurrences(
+        Occurrence.from_dict(occ) for occ in SyntheticData().occurrences(10)
+    )
+    assert gazetteer.resolve("rio de janeiro", kind="state") == STATES[0][0]
+
+
+def test_gazetteer_completes_prefixes():
+    gazetteer = Gazetteer.from_reference(STATES_DATA, CITIES_DATA)
+    places = gazetteer.complete("sao")
+    assert [place.name for place in places] == [
+        "São Gonçalo",
+        "São João de Meriti",
+    ]
+    assert gazetteer.complete("rio", kind="state")[0].id == "rj"
+
+
+def test_gazetteer_keeps_places_from_occurrences_when_rebuilt():
+    gazetteer = Gazetteer()
+    gazetteer.add_occurrences(OCCURRENCES)
+    gazetteer = Gazetteer.from_reference([], CITIES_DATA, previous=gazetteer)
+    assert gazetteer.resolve("complexo da mare", kind="locality") == "l1"
+
+
+def test_gazetteer_raises_error_for_unknown_kind():
+    with raises(UnknownPlaceKindError):
+        Gazetteer().add("country", "br", "Brasil")
+
+
+@mark.asyncio
+async def test_client_gazetteer_is_built_once(fake_api_client):
+    api = FakeAPI(total=100)
+    client = fake_api_client(api)
+    gazetteer = await client.gazetteer()
+    assert gazetteer.resolve("sao goncalo") is not None
+    assert await client.gazetteer() is gazetteer
+    assert api.requests["states"] == 1
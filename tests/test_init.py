@@ -52,6 +52,14 @@ def test_occurrences_with_default_args():
             final_date=None,
             format=None,
             flat=False,
+            prefetch=None,
+            page_size=None,
+            max_memory=None,
+            snapshot=None,
+            timeout=None,
+            max_retries=None,
+            on_error="raise",
+            priority=1,
         )
 
 
@@ -66,6 +74,14 @@ def test_occurrences_with_custom_args():
             max_parallel_requests=10,
             format="df",
             flat=True,
+            prefetch=4,
+            page_size="auto",
+            max_memory="500MB",
+            snapshot="~/snapshots",
+            timeout=60,
+            max_retries=3,
+            on_error="partial",
+            priority=5,
         )
         mock.return_value.occurrences.assert_called_once_with(
             "42",
@@ -76,4 +92,12 @@ def test_occurrences_with_custom_args():
             max_parallel_requests=10,
             format="df",
             flat=True,
+            prefetch=4,
+            page_size="auto",
+            max_memory="500MB",
+            snapshot="~/snapshots",
+            timeout=60,
+            max_retries=3,
+            on_error="partial",
+            priority=5,
         )
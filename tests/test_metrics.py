@@ -0,0 +1,89 @@
+from unittest.mock import AsyncMock, patch
+
+from httpx import ReadTimeout
+from pytest import mark, raises
+
+from crossfire.errors import RetryAfterError
+from crossfire.metrics import Histogram, Metrics
+from crossfire.testing import STATES, FakeAPI
+
+
+def test_histogram_counts_observations_in_buckets():
+    histogram = Histogram((1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1]
+    assert histogram.count == 4
+    assert histogram.sum == 6
+    assert list(histogram.cumulative()) == [(1, 2), (2, 3), ("+Inf", 4)]
+
+
+@mark.asyncio
+async def test_metrics_count_requests_bytes_and_tokens(fake_api_client):
+    client = fake_api_client(FakeAPI(total=100, take=10))
+    await client.states()
+    occurrences = await client.occurrences(STATES[0][0])
+    pages = -(-len(occurrences) // 10)
+
+    metrics = client.metrics
+    assert metrics.token_refreshes == 1
+    assert metrics.requests[("/auth/login", 201)] == 1
+    assert metrics.requests[("/states", 200)] == 1
+    assert metrics.requests[("/occurrences", 200)] == pages
+    assert metrics.latency["/occurrences"].count == pages
+    assert metrics.bytes_received["/occurrences"] > 0
+    assert metrics.in_flight == 0
+
+
+@mark.asyncio
+async def test_metrics_count_rate_limits_and_timeouts(fake_api_client):
+    client = fake_api_client(FakeAPI(total=10, rate_limit=(2, 60)))
+    await client.states()
+    with raises(RetryAfterError):
+        await client.states()
+    assert client.metrics.rate_limited["/states"] == 1
+
+    client = fake_api_client(FakeAPI(total=10, timeout_rate=1, timeout=0))
+    with raises(ReadTimeout):
+        await client.states()
+    assert client.metrics.timeouts["/auth/login"] == 1
+    assert client.metrics.in_flight == 0
+
+
+@mark.asyncio
+async def test_metrics_count_retries(occurrences_client_and_get_mock):
+    client, mock = occurrences_client_and_get_mock
+    ok = mock.return_value
+    mock.side_effect = (ReadTimeout("Boom!"), ok)
+    with patch("crossfire.clients.occurrences.sleep", new_callable=AsyncMock):
+        await client.occurrences(42)
+    assert client.metrics.retries["/occurrences"] == 1
+    assert client.metrics.timeouts["/occurrences"] == 1
+
+
+def test_metrics_render_prometheus_text_format():
+    metrics = Metrics(buckets=(0.5,))
+    metrics.requests[("/states", 200)] = 2
+    metrics.latency["/states"].observe(0.25)
+    metrics.bytes_received["/states"] = 42
+    metrics.token_refresh()
+    text = metrics.render()
+
+    assert text.endswith("\n")
+    assert "# TYPE crossfire_requests_total counter" in text
+    assert 'crossfire_requests_total{endpoint="/states",status="200"} 2' in text
+    assert "# TYPE crossfire_request_duration_seconds histogram" in text
+    assert (
+        'crossfire_request_duration_seconds_bucket{endpoint="/states",le="0.5"} 1'
+        in text
+    )
+    assert (
+        'crossfire_request_duration_seconds_bucket{endpoint="/states",le="+Inf"} 1'
+        in text
+    )
+    assert (
+        'crossfire_request_duration_seconds_count{endpoint="/states"} 1' in text
+    )
+    assert 'crossfire_response_bytes_total{endpoint="/states"} 42' in text
+    assert "crossfire_token_refreshes_total 1" in text
+    assert "crossfire_in_flight_requests 0" in text
@@ -1,7 +1,9 @@
 import datetime
+from asyncio import CancelledError, create_task, sleep
+from time import monotonic
 
 try:
-    from geopandas import GeoDataFrame
+    from geopandas import GeoDataFrame, points_from_xy
 
     HAS_GEOPANDAS = True
 except ImportError:
@@ -19,15 +21,27 @@ try:
 except ImportError:
     pass
 
-from pytest import mark, raises
+from urllib.parse import parse_qs
+
+from httpx import HTTPStatusError, ReadTimeout
+from pytest import importorskip, mark, raises
 
 from crossfire.clients.occurrences import (
     Accumulator,
     Occurrences,
+    PageSizeError,
+    UnknownOnErrorError,
     UnknownTypeOccurrenceError,
     date_formatter,
 )
-from crossfire.errors import DateFormatError, DateIntervalError
+from crossfire.errors import (
+    CrossfireError,
+    DateFormatError,
+    DateIntervalError,
+    DeadlineExceededError,
+)
+from crossfire.records import Occurrence
+from crossfire.testing import STATES, FakeAPI
 
 skip_if_pandas_not_installed = mark.skipif(
     not HAS_PANDAS, reason="pandas is not installed"
@@ -75,12 +89,16 @@ def test_occurrences_accumulator_for_df():
 
 @skip_if_geopandas_not_installed
 def test_occurrences_accumulator_for_geodf():
+    def gdf(*values):
+        return GeoDataFrame(
+            {"a": values}, geometry=points_from_xy(values, values)
+        )
+
     accumulator = Accumulator()
-    accumulator.merge(GeoDataFrame([{"a": 1}]))
-    accumulator.merge(GeoDataFrame([{"a": 2}]), GeoDataFrame([{"a": 3}]))
-    assert_frame_equal(
-        accumulator(), GeoDataFrame([{"a": 1}, {"a": 2}, {"a": 3}])
-    )
+    accumulator.merge(gdf(1))
+    accumulator.merge(gdf(2), gdf(3))
+    assert isinstance(accumulator(), GeoDataFrame)
+    assert_frame_equal(accumulator(), gdf(1, 2, 3))
 
 
 @mark.asyncio
@@ -283,6 +301,33 @@ async def test_occurrences_as_list_dicts_with_flat_parameter(
     ]
 
 
+@mark.asyncio
+async def test_occurrences_as_records(occurrences_client_and_get_mock):
+    client_mock, mock = occurrences_client_and_get_mock
+    mock.return_value.json.side_effect = (
+        dummy_response(2, False),
+        dummy_response(2, True),
+    )
+    occurrences = Occurrences(client_mock, id_state=42, format="records")
+    occs = await occurrences()
+    assert len(occs) == 4
+    assert all(isinstance(occ, Occurrence) for occ in occs)
+    assert occs[0].latitude == "-8.1576367000"
+
+
+@mark.asyncio
+async def test_occurrences_as_records_with_flat_parameter(
+    occurrences_client_and_get_mock,
+):
+    client_mock, _ = occurrences_client_and_get_mock
+    occurrences = Occurrences(
+        client_mock, id_state=42, format="records", flat=True
+    )
+    occ, *_ = await occurrences()
+    assert occ["contextInfo_context1"] == "info1"
+    assert occ["contextInfo_context2"] == "info2"
+
+
 @skip_if_pandas_not_installed
 @mark.asyncio
 async def test_occurrences_as_df_with_flat_parameter(
@@ -306,3 +351,378 @@ async def test_occurrences_as_df_with_flat_parameter(
             ]
         ),
     )
+
+
+@mark.asyncio
+async def test_occurrences_prefetches_pages_with_a_hint(fake_api_client):
+    api = FakeAPI(total=100, take=10, latency=0.05)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id)()
+    pages = api.requests["occurrences"]
+
+    api.requests.clear()
+    api.max_in_flight = 0
+    occurrences = await Occurrences(client, state_id, prefetch=pages)()
+    assert api.max_in_flight == pages  # all pages in a single round trip
+    assert occurrences == expected
+    assert api.requests["occurrences"] == pages
+
+
+@mark.asyncio
+async def test_occurrences_prefetch_remembers_page_count_of_query_shape(
+    fake_api_client,
+):
+    api = FakeAPI(total=100, take=10, latency=0.05)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id, prefetch=True)()
+    pages = client.page_counts[f"idState={state_id}&typeOccurrence=all"]
+    assert pages > 1
+    assert api.max_in_flight < pages  # page 1 came before the others
+
+    api.max_in_flight = 0
+    assert await Occurrences(client, state_id, prefetch=True)() == expected
+    assert api.max_in_flight == pages
+
+
+@mark.asyncio
+async def test_occurrences_discards_speculative_pages_beyond_page_count(
+    fake_api_client,
+):
+    api = FakeAPI(total=100, take=10)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id)()
+    occurrences = await Occurrences(client, state_id, prefetch=100)()
+    assert occurrences == expected
+
+
+@mark.asyncio
+async def test_occurrences_sends_page_size_as_take(fake_api_client):
+    api = FakeAPI(total=100, take=10)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id)()
+    pages = api.requests["occurrences"]
+
+    api.requests.clear()
+    occurrences = await Occurrences(client, state_id, page_size=50)()
+    assert occurrences == expected
+    assert api.requests["occurrences"] < pages
+
+
+@mark.parametrize("page_size", (0, -1, 1.5, "big", True))
+def test_occurrences_raises_error_for_invalid_page_size(page_size):
+    with raises(PageSizeError):
+        Occurrences(None, 1, page_size=page_size)
+
+
+@mark.asyncio
+async def test_occurrences_auto_page_size_learns_largest_accepted(
+    fake_api_client,
+):
+    api = FakeAPI(total=1000, take=10, max_take=100)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id)()
+
+    occurrences = await Occurrences(client, state_id, page_size="auto")()
+    assert occurrences == expected
+    assert client.page_size_tuner.max_size == 100
+    assert client.item_counts[f"idState={state_id}&typeOccurrence=all"] == len(
+        expected
+    )
+
+
+@mark.asyncio
+async def test_occurrences_stream_yields_every_page(fake_api_client):
+    api = FakeAPI(total=100, take=10)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id)()
+
+    pages = [
+        (number, page)
+        async for number, page in Occurrences(client, state_id).stream()
+    ]
+    numbers = sorted(number for number, _ in pages)
+    assert numbers == list(range(1, len(pages) + 1))
+    occurrences = [item for _, page in sorted(pages) for item in page]
+    assert occurrences == expected
+
+
+@mark.asyncio
+async def test_occurrences_stream_skips_pages(fake_api_client):
+    api = FakeAPI(total=100, take=10)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    query = Occurrences(client, state_id)
+    numbers = [number async for number, _ in query.stream(skip={1, 2})]
+    assert sorted(numbers) == list(range(3, query.total_pages + 1))
+
+
+@mark.asyncio
+async def test_occurrences_with_max_memory_returns_an_arrow_table(
+    fake_api_client,
+):
+    importorskip("pyarrow")
+    api = FakeAPI(total=200, take=10)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id)()
+
+    table = await Occurrences(client, state_id, max_memory="8KB")()
+    assert table.num_rows == len(expected)
+    assert table.column("id").to_pylist() == [item["id"] for item in expected]
+
+
+class SlowPageAPI(FakeAPI):
+    """Delays page `slow`, so the pages after it arrive first."""
+
+    def __init__(self, slow, **kwargs):
+        super().__init__(**kwargs)
+        self.slow = slow
+
+    async def handle_async_request(self, request):
+        query = parse_qs(request.url.query.decode())
+        if int(query.get("page", ("0",))[0]) == self.slow:
+            await sleep(0.1)
+        return await super().handle_async_request(request)
+
+
+@mark.asyncio
+async def test_occurrences_with_max_memory_keeps_order_of_late_pages(
+    fake_api_client,
+):
+    importorskip("pyarrow")
+    api = SlowPageAPI(2, total=200, take=10)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id)()
+
+    table = await Occurrences(client, state_id, max_memory="2KB")()
+    assert table.column("id").to_pylist() == [item["id"] for item in expected]
+
+
+def test_occurrences_max_memory_does_not_support_geodf():
+    with raises(CrossfireError):
+        Occurrences(None, 1, format="geodf", max_memory="1GB")
+
+
+@mark.asyncio
+async def test_occurrences_snapshot_is_reused_until_data_is_updated(
+    tmp_path, fake_api_client
+):
+    importorskip("pyarrow")
+    api = FakeAPI(total=200, take=10)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id, snapshot=tmp_path)()
+    assert len(list(tmp_path.glob("*.arrow"))) == 1
+
+    api.requests.clear()
+    occurrences = await Occurrences(client, state_id, snapshot=tmp_path)()
+    assert api.requests["occurrences"] == 1  # only checks the last update
+    assert [item["id"] for item in occurrences] == [
+        item["id"] for item in expected
+    ]
+    assert occurrences[0]["state"] == expected[0]["state"]
+
+    api.last_update = datetime.datetime(2024, 1, 1)
+    api.requests.clear()
+    await Occurrences(client, state_id, snapshot=tmp_path)()
+    assert api.requests["occurrences"] > 1
+    assert len(list(tmp_path.glob("*.arrow"))) == 1
+
+
+class RateLimitedAPI(FakeAPI):
+    """Answers the first `limited` occurrences requests with HTTP 429."""
+
+    def __init__(self, limited, **kwargs):
+        super().__init__(**kwargs)
+        self.limited = limited
+
+    async def handle_async_request(self, request):
+        if request.url.path.endswith("/occurrences") and self.limited:
+            self.limited -= 1
+            headers = {"retry-after": "0"}
+            return self.json(request, {"msg": "Slow down"}, 429, headers)
+        return await super().handle_async_request(request)
+
+
+@mark.asyncio
+async def test_occurrences_snapshot_retries_the_last_update_check(
+    tmp_path, fake_api_client
+):
+    importorskip("pyarrow")
+    api = RateLimitedAPI(1, total=50, take=10)
+    client = fake_api_client(api)
+    occurrences = await Occurrences(client, STATES[0][0], snapshot=tmp_path)()
+    assert occurrences
+    assert client.metrics.retries["/occurrences"] == 1
+    assert len(list(tmp_path.glob("*.arrow"))) == 1
+
+
+@skip_if_pandas_not_installed
+@mark.asyncio
+async def test_occurrences_snapshot_as_df(tmp_path, fake_api_client):
+    importorskip("pyarrow")
+    api = FakeAPI(total=50, take=10)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    query = {"format": "df", "snapshot": tmp_path}
+    expected = await Occurrences(client, state_id, **query)()
+    occurrences = await Occurrences(client, state_id, **query)()
+    assert isinstance(occurrences, DataFrame)
+    assert occurrences["id"].tolist() == expected["id"].tolist()
+
+
+@skip_if_pandas_not_installed
+@mark.asyncio
+@mark.parametrize("flat", (False, True))
+async def test_occurrences_parsed_in_worker_processes(flat, fake_api_client):
+    client = fake_api_client(FakeAPI(total=100, take=10))
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id, format="df", flat=flat)()
+
+    client.parse_workers = 2
+    async with client:
+        occurrences = await Occurrences(
+            client, state_id, format="df", flat=flat
+        )()
+        assert client.pool is not None
+    assert client.pool is None
+    assert occurrences.equals(expected)
+
+
+@mark.asyncio
+@mark.parametrize("format", (None, "records"))
+async def test_occurrences_lists_are_parsed_in_the_main_process(
+    format, fake_api_client
+):
+    client = fake_api_client(FakeAPI(total=100, take=10))
+    state_id = STATES[0][0]
+    expected = await Occurrences(client, state_id, format=format, flat=True)()
+
+    client.parse_workers = 2
+    async with client:
+        occurrences = await Occurrences(
+            client, state_id, format=format, flat=True
+        )()
+        assert client.pool is None
+    assert occurrences == expected
+
+
+class FailingPageAPI(FakeAPI):
+    """Fails page 2 right away, while other pages are slow."""
+
+    async def handle_async_request(self, request):
+        if b"page=2&" in request.url.query + b"&":
+            return self.json(request, {"msg": "Boom!"}, 500)
+        return await super().handle_async_request(request)
+
+
+@mark.asyncio
+async def test_occurrences_cancels_pending_pages_on_first_error(
+    fake_api_client,
+):
+    api = FailingPageAPI(total=200, take=10, latency=0.1)
+    client = fake_api_client(api)
+
+    with raises(HTTPStatusError):
+        await Occurrences(client, STATES[0][0])()
+    assert api.requests["occurrences"] == 1  # other pages never completed
+    assert api.in_flight == 0
+
+
+@mark.asyncio
+async def test_occurrences_raises_error_after_timeout(fake_api_client):
+    api = FakeAPI(total=200, take=10, latency=5)
+    client = fake_api_client(api)
+    start = monotonic()
+    with raises(DeadlineExceededError):
+        await Occurrences(client, STATES[0][0], timeout=0.05)()
+    assert monotonic() - start < 1  # did not wait for the slow response
+    assert not api.requests["occurrences"]
+    assert api.in_flight == 0
+
+
+@mark.asyncio
+async def test_occurrences_cancellation_stops_pending_pages(fake_api_client):
+    api = FakeAPI(total=200, take=10, latency=0.2)
+    client = fake_api_client(api)
+    task = create_task(Occurrences(client, STATES[0][0], prefetch=10)())
+    await sleep(0.05)
+    task.cancel()
+    with raises(CancelledError):
+        await task
+    assert api.in_flight == 0
+
+
+class FlakyPagesAPI(FakeAPI):
+    """Fails the pages in `failing` until they are removed from it."""
+
+    def __init__(self, failing, **kwargs):
+        super().__init__(**kwargs)
+        self.failing = set(failing)
+
+    async def handle_async_request(self, request):
+        query = parse_qs(request.url.query.decode())
+        if int(query.get("page", ("0",))[0]) in self.failing:
+            return self.json(request, {"msg": "Boom!"}, 500)
+        return await super().handle_async_request(request)
+
+
+@mark.asyncio
+async def test_occurrences_partial_results_and_refetch(fake_api_client):
+    api = FlakyPagesAPI({3, 5}, total=200, take=10)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+
+    data, report = await Occurrences(client, state_id, on_error="partial")()
+    assert report.pages == [3, 5]
+    assert all(isinstance(e, HTTPStatusError) for e in report.errors.values())
+
+    api.failing.clear()
+    expected = await Occurrences(client, state_id)()
+    assert [item for item in expected if item not in data] == (
+        expected[20:30] + expected[40:50]
+    )
+
+    missing, report = await client.refetch(report)
+    assert not report
+    assert missing == expected[20:30] + expected[40:50]
+
+
+@mark.asyncio
+async def test_occurrences_max_retries(fake_api_client):
+    api = FakeAPI(total=200, take=10, timeout_rate=1, timeout=0)
+    client = fake_api_client(api)
+    query = Occurrences(client, STATES[0][0], max_retries=0)
+    with raises(ReadTimeout):
+        await query.page(1)
+
+
+def test_occurrences_raises_error_for_unknown_on_error():
+    with raises(UnknownOnErrorError):
+        Occurrences(None, 1, on_error="ignore")
+
+
+def test_accumulator_merges_many_pages_at_once():
+    accumulator = Accumulator()
+    accumulator.merge([1, 2], None, [3], [4, 5])
+    assert accumulator() == [1, 2, 3, 4, 5]
+
+
+@skip_if_geopandas_not_installed
+@mark.asyncio
+async def test_occurrences_geodf_creates_geometry_once(fake_api_client):
+    api = FakeAPI(total=100, take=10)
+    client = fake_api_client(api)
+    occurrences = await Occurrences(client, STATES[0][0], format="geodf")()
+    assert isinstance(occurrences, GeoDataFrame)
+    assert occurrences.crs == "EPSG:4326"
+    assert occurrences.geometry.x.tolist() == [
+        float(value) for value in occurrences.longitude
+    ]
@@ -22,6 +22,7 @@ from crossfire.parser import (
     UnknownFormatError,
     parse_response,
 )
+from crossfire.records import Occurrence, State
 
 DATA = [{"answer": 42}]
 GEODATA = [{"answer": 42, "latitude": 4, "longitude": 2}]
@@ -96,6 +97,20 @@ def test_parse_response_uses_dataframe_when_specified():
     assert isinstance(data, DataFrame)
 
 
+def test_parse_response_uses_records_when_specified():
+    data, _ = parse_response(create_response(True), format="records")
+    assert isinstance(data, list)
+    for obj in data:
+        assert isinstance(obj, Occurrence)
+        assert obj.latitude == 4
+        assert obj.extra == {"answer": 42}
+
+
+def test_parse_response_uses_custom_record_class():
+    data, _ = parse_response(create_response(), format="records", record=State)
+    assert isinstance(data[0], State)
+
+
 @skip_if_geopandas_not_installed
 def test_parse_response_uses_geodataframe_when_specified():
     data, _ = parse_response(create_response(True), format="geodf")
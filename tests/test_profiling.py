@@ -0,0 +1,98 @@
+from asyncio import gather
+from time import sleep
+
+from pytest import fixture, importorskip, mark
+
+from crossfire import profile
+from crossfire.profiling import active, stage
+from crossfire.testing import FakeAPI
+
+STATE = "b112ffbe-17b3-4ad0-8f2a-2038745d1d14"
+
+
+@fixture
+def client(fake_api_client):
+    def create(**kwargs):
+        return fake_api_client(FakeAPI(total=45, latency=0.01), **kwargs)
+
+    return create
+
+
+def test_stage_without_profile_does_nothing():
+    with stage("decode"):
+        pass
+    assert active.get() is None
+
+
+def test_profile_measures_stages():
+    with profile() as result:
+        with stage("decode"):
+            sleep(0.01)
+        with stage("network", cpu=False):
+            sleep(0.01)
+        with stage("decode"):
+            pass
+
+    assert active.get() is None
+    network, decode = result.rows()
+    assert decode["stage"] == "decode"
+    assert decode["calls"] == 2
+    assert decode["wall"] >= 0.01
+    assert decode["cpu"] is not None
+    assert network["cpu"] is None
+    assert result.wall >= decode["wall"] + network["wall"]
+    assert 0 < decode["share"] < 1
+
+
+def test_profile_report_and_export():
+    with profile() as result:
+        with stage("flatten"):
+            pass
+    report = result.report()
+    assert "flatten" in report
+    assert "total" in report
+    assert result.to_dict()["stages"][0]["stage"] == "flatten"
+
+
+def test_profile_as_dataframe():
+    importorskip("pandas")
+    with profile() as result:
+        with stage("merge"):
+            pass
+    assert list(result.rows(format="df").stage) == ["merge"]
+
+
+@mark.asyncio
+async def test_profile_follows_tasks_created_by_occurrences(client):
+    importorskip("pandas")
+    with profile() as result:
+        await client().occurrences(STATE, format="df", flat=True)
+    stages = {row["stage"]: row for row in result.rows()}
+    assert {"token", "queue", "network", "decode", "dataframe"} <= set(stages)
+    assert {"merge", "flatten"} <= set(stages)
+    assert stages["network"]["calls"] == stages["decode"]["calls"]
+
+
+@mark.asyncio
+async def test_client_with_profile(client):
+    profiled = client(profile=True)
+    await profiled.occurrences(STATE)
+    assert profiled.profile.wall > 0
+    assert profiled.profile.stages["network"].calls >= 1
+    assert active.get() is None
+
+    assert client().profile is None
+
+
+@mark.asyncio
+async def test_client_with_profile_and_concurrent_queries(client):
+    profiled = client(profile=True)
+    first, second = await gather(
+        profiled.occurrences(STATE),
+        profiled.occurrences(STATE, type_occurrence="withVictim"),
+    )
+    assert first and second
+    assert active.get() is None
+    stages = profiled.profile.stages
+    assert stages["network"].calls == stages["decode"].calls
+    assert profiled.profile.wall >= stages["decode"].wall
@@ -0,0 +1,100 @@
+from time import time
+from unittest.mock import patch
+
+from pytest import approx, fixture, mark, raises
+
+from crossfire.clients.ratelimit import HostRateLimiter, RateLimitError
+from crossfire.errors import RetryAfterError
+from crossfire.testing import FakeAPI
+
+STATE = "b112ffbe-17b3-4ad0-8f2a-2038745d1d14"
+
+
+def test_rate_limiter_from_value(tmp_path):
+    limiter = HostRateLimiter(10, 2, tmp_path / "limit.json")
+    assert HostRateLimiter.from_value(limiter) is limiter
+    assert HostRateLimiter.from_value(None) is None
+    assert HostRateLimiter.from_value((10, 2)).rate == 5
+    with raises(RateLimitError):
+        HostRateLimiter.from_value(10)
+    with raises(RateLimitError):
+        HostRateLimiter(0, 1)
+
+
+class Clock:
+    """Replaces `time` and `sleep` in the rate limiter: sleeping moves the
+    clock forward right away and records how long the limiter waited."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.waits = []
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.waits.append(seconds)
+        self.now += seconds
+
+
+@fixture
+def clock():
+    clock = Clock()
+    with patch("crossfire.clients.ratelimit.time", clock.time):
+        with patch("crossfire.clients.ratelimit.sleep", clock.sleep):
+            yield clock
+
+
+@mark.asyncio
+async def test_rate_limiter_allows_a_burst_then_waits(tmp_path, clock):
+    limiter = HostRateLimiter(5, 0.5, tmp_path / "limit.json")
+    for _ in range(5):
+        await limiter.acquire()
+    assert not clock.waits
+
+    await limiter.acquire()
+    assert clock.waits == [approx(0.1)]  # one token every 0.1s
+
+
+@mark.asyncio
+async def test_rate_limiters_share_the_bucket(tmp_path, clock):
+    path = tmp_path / "limit.json"
+    first, second = (HostRateLimiter(2, 0.2, path) for _ in range(2))
+    await first.acquire()
+    await first.acquire()
+
+    await second.acquire()
+    assert clock.waits == [approx(0.1)]
+
+
+@mark.asyncio
+async def test_rate_limiters_share_pauses(tmp_path, clock):
+    path = tmp_path / "limit.json"
+    first, second = (HostRateLimiter(100, 1, path) for _ in range(2))
+    await first.pause(0.2)
+
+    await second.acquire()
+    assert sum(clock.waits) == approx(0.2)
+
+
+@mark.asyncio
+async def test_clients_with_rate_limit_avoid_429(tmp_path, fake_api_client):
+    api = FakeAPI(total=200, take=10, rate_limit=(10, 1))
+    limiter = HostRateLimiter(10, 1, tmp_path / "limit.json")
+    clients = [fake_api_client(api, rate_limit=limiter) for _ in range(2)]
+    for client in clients:
+        await client.occurrences(STATE, page_size=100)
+    assert not any(client.metrics.retries for client in clients)
+
+
+@mark.asyncio
+async def test_429_pauses_other_clients(tmp_path, fake_api_client):
+    api = FakeAPI(total=10, rate_limit=(1, 60))
+    path = tmp_path / "limit.json"
+    client = fake_api_client(api, rate_limit=HostRateLimiter(100, 1, path))
+    await client.token()  # uses the only request allowed by the API
+    with raises(RetryAfterError):
+        await client.states()
+
+    _, paused_until = HostRateLimiter(100, 1, path).read(time())
+    assert paused_until > time() + 30
@@ -0,0 +1,78 @@
+from pytest import raises
+
+from crossfire.records import City, Occurrence, State, Victim, to_dicts
+
+OCCURRENCE = {
+    "id": "a7bfebed-ce9c-469d-a656-924ed8248e95",
+    "documentNumber": 42,
+    "state": {"id": "21", "name": "Rio de Janeiro"},
+    "city": {"id": "12", "name": "Niterói"},
+    "latitude": "-8.1576367000",
+    "longitude": "-34.9696372000",
+    "policeAction": False,
+    "contextInfo": {"mainReason": {"id": "1", "name": "Assalto"}},
+    "victims": [{"id": "84", "situation": "Wounded", "age": 42}],
+    "somethingNew": "answer",
+}
+
+
+def test_occurrence_from_dict_has_attribute_access():
+    occurrence = Occurrence.from_dict(OCCURRENCE)
+    assert occurrence.id == "a7bfebed-ce9c-469d-a656-924ed8248e95"
+    assert occurrence.document_number == 42
+    assert occurrence.police_action is False
+    assert occurrence.address is None
+    assert occurrence.context_info == {
+        "mainReason": {"id": "1", "name": "Assalto"}
+    }
+
+
+def test_occurrence_from_dict_builds_nested_records():
+    occurrence = Occurrence.from_dict(OCCURRENCE)
+    assert isinstance(occurrence.state, State)
+    assert occurrence.state.name == "Rio de Janeiro"
+    assert isinstance(occurrence.city, City)
+    assert occurrence.city.name == "Niterói"
+    assert occurrence.city.state is None
+    victim, *_ = occurrence.victims
+    assert isinstance(victim, Victim)
+    assert victim.situation == "Wounded"
+    assert victim.age == 42
+
+
+def test_occurrence_keeps_unknown_keys_as_extra():
+    occurrence = Occurrence.from_dict(OCCURRENCE)
+    assert occurrence.extra == {"somethingNew": "answer"}
+    assert Occurrence.from_dict({"id": "42"}).extra is None
+
+
+def test_occurrence_round_trips_to_dict():
+    occurrence = Occurrence.from_dict(OCCURRENCE)
+    assert occurrence.to_dict(skip_none=True) == OCCURRENCE
+
+    data = occurrence.to_dict()
+    assert data["address"] is None
+    assert data["city"]["state"] is None
+    assert data["victims"][0]["deathDate"] is None
+
+
+def test_records_have_no_instance_dict():
+    occurrence = Occurrence.from_dict(OCCURRENCE)
+    assert not hasattr(occurrence, "__dict__")
+    with raises(AttributeError):
+        occurrence.answer = 42
+
+
+def test_record_init_with_keyword_arguments():
+    state = State(id="42", name="Pernambuco")
+    assert state == State.from_dict({"id": "42", "name": "Pernambuco"})
+    assert state != State(id="42", name="Rio de Janeiro")
+    assert repr(state) == "<State 42>"
+
+
+def test_to_dicts():
+    records = [State(id="1", name="Rio de Janeiro"), State(id="2")]
+    assert to_dicts(records) == [
+        {"id": "1", "name": "Rio de Janeiro"},
+        {"id": "2", "name": None},
+    ]
@@ -0,0 +1,127 @@
+from time import time
+
+from pytest import mark
+
+from crossfire.clients.reference import ReferenceData
+from crossfire.records import City
+from crossfire.testing import STATES, FakeAPI
+
+RIO, PERNAMBUCO = (state_id for state_id, _ in STATES)
+STATE = {"id": RIO, "name": "Rio de Janeiro"}
+CITIES = [
+    {"id": "1", "name": "Rio de Janeiro", "state": STATE},
+    {"id": "2", "name": "Niterói", "state": STATE},
+    {"id": "3", "name": "Recife", "state": {"id": PERNAMBUCO}},
+]
+
+
+def test_reference_data_finds_cities():
+    reference = ReferenceData([STATE], CITIES)
+    assert reference.find_cities() == CITIES
+    assert reference.find_cities(city_id="2") == [CITIES[1]]
+    assert reference.find_cities(city_id="42") == []
+    assert reference.find_cities(city_name="NITERÓI") == [CITIES[1]]
+    assert reference.find_cities(city_name="de jan") == [CITIES[0]]
+    assert reference.find_cities(state_id=RIO) == CITIES[:2]
+    assert reference.find_cities(city_name="Recife", state_id=RIO) == []
+    assert reference.find_cities(city_id="3", state_id=PERNAMBUCO) == [
+        CITIES[2]
+    ]
+
+
+def test_reference_data_freshness():
+    assert ReferenceData([], []).is_fresh(60)
+    assert not ReferenceData([], [], fetched_at=time() - 61).is_fresh(60)
+
+
+def test_reference_data_save_and_load(tmp_path):
+    path = tmp_path / "cache" / "reference.json"
+    ReferenceData([STATE], CITIES, fetched_at=42).save(path)
+    reference = ReferenceData.load(path)
+    assert reference.states == [STATE]
+    assert reference.cities == CITIES
+    assert reference.fetched_at == 42
+
+
+def test_reference_data_load_ignores_missing_or_invalid_files(tmp_path):
+    path = tmp_path / "reference.json"
+    assert ReferenceData.load(path) is None
+    path.write_text("{}")
+    assert ReferenceData.load(path) is None
+
+
+@mark.asyncio
+async def test_client_without_cache_always_hits_the_api(fake_api_client):
+    api = FakeAPI(total=200)
+    client = fake_api_client(api)
+    await client.states()
+    await client.states()
+    assert api.requests["states"] == 2
+
+
+@mark.asyncio
+async def test_client_with_cache_warms_it_with_one_request_per_state(
+    fake_api_client,
+):
+    api = FakeAPI(total=200)
+    client = fake_api_client(api, cache_ttl=60)
+    states, metadata = await client.states()
+    assert {state["id"] for state in states} == {RIO, PERNAMBUCO}
+    assert not metadata.page_count
+
+    cities, _ = await client.cities(city_name="niterói")
+    assert [city["name"] for city in cities] == ["Niterói"]
+    cities, _ = await client.cities(state_id=PERNAMBUCO, format="records")
+    assert all(isinstance(city, City) for city in cities)
+    assert {city.state.id for city in cities} == {PERNAMBUCO}
+
+    assert api.requests["states"] == 1
+    assert api.requests["cities"] == 2
+
+
+@mark.asyncio
+async def test_client_with_cache_refreshes_expired_data(fake_api_client):
+    api = FakeAPI(total=200)
+    client = fake_api_client(api, cache_ttl=60)
+    await client.states()
+    client.reference.fetched_at -= 61
+    await client.states()
+    assert api.requests["states"] == 2
+
+
+@mark.asyncio
+async def test_client_with_cache_file(tmp_path, fake_api_client):
+    path = tmp_path / "reference.json"
+    api = FakeAPI(total=200)
+    client = fake_api_client(api, cache_ttl=60, cache_path=path)
+    await client.cities()
+    assert path.exists()
+
+    other_api = FakeAPI(total=200)
+    other_client = fake_api_client(other_api, cache_ttl=60, cache_path=path)
+    cities, _ = await other_client.cities()
+    assert len(cities) == len((await client.cities())[0])
+    assert not other_api.requests
+
+
+@mark.asyncio
+@mark.parametrize(
+    "filters",
+    (
+        {"city_name": "Rio de Janeiro"},
+        {"city_name": "de"},
+        {"city_name": "RECIFE"},
+        {"city_name": "Rio", "state_id": PERNAMBUCO},
+        {"state_id": RIO},
+    ),
+)
+async def test_client_with_cache_finds_the_same_cities_as_the_api(
+    filters, fake_api_client
+):
+    client = fake_api_client(FakeAPI(total=200))
+    cached_client = fake_api_client(FakeAPI(total=200), cache_ttl=60)
+    expected, _ = await client.cities(**filters)
+    cities, _ = await cached_client.cities(**filters)
+    assert sorted(city["id"] for city in cities) == sorted(
+        city["id"] for city in expected
+    )
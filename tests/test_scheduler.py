@@ -0,0 +1,131 @@
+from asyncio import CancelledError, create_task, sleep
+
+from pytest import mark, raises
+
+from crossfire.clients import AsyncClient
+from crossfire.clients.occurrences import Occurrences
+from crossfire.clients.scheduler import PriorityError, Scheduler
+from crossfire.testing import STATES, FakeAPI
+
+
+async def grants(scheduler, requests):
+    """Queues `(query, priority)` requests while all slots are taken and
+    returns the queries in the order they get a slot."""
+    order = []
+
+    async def request(query, priority):
+        await scheduler.acquire(query, priority)
+        order.append(query)
+
+    tasks = [create_task(request(*args)) for args in requests]
+    await sleep(0)
+    for _ in requests:
+        scheduler.release()
+        await sleep(0)
+    for task in tasks:
+        await task
+    return order
+
+
+@mark.asyncio
+async def test_scheduler_starts_right_away_while_there_are_free_slots():
+    scheduler = Scheduler(2)
+    await scheduler.acquire("big")
+    await scheduler.acquire("small")
+    assert scheduler.in_use == 2
+    scheduler.release()
+    assert scheduler.in_use == 1
+
+
+@mark.asyncio
+async def test_scheduler_alternates_between_queries():
+    scheduler = Scheduler(1)
+    await scheduler.acquire("big")
+    requests = [("big", 1)] * 4 + [("small", 1)] * 2
+    order = await grants(scheduler, requests)
+    assert order[:4] == ["big", "small", "big", "small"]
+
+
+@mark.asyncio
+async def test_scheduler_weights_queries_by_priority():
+    scheduler = Scheduler(1)
+    await scheduler.acquire("big")
+    requests = [("big", 1)] * 4 + [("small", 3)] * 3
+    order = await grants(scheduler, requests)
+    assert order[:4].count("small") == 3
+
+
+@mark.asyncio
+async def test_scheduler_grows_unless_fixed():
+    fixed, growing = Scheduler(1), Scheduler(1, fixed=False)
+    for scheduler in (fixed, growing):
+        await scheduler.acquire("big")
+        task = create_task(scheduler.acquire("small"))
+        await sleep(0)
+        scheduler.grow(2)
+        await sleep(0)
+        assert task.done() is (scheduler is growing)
+        task.cancel()
+    assert (fixed.slots, growing.slots) == (1, 2)
+    assert growing.in_use == 2
+
+
+@mark.asyncio
+async def test_scheduler_forgets_cancelled_requests():
+    scheduler = Scheduler(1)
+    await scheduler.acquire("big")
+    task = create_task(scheduler.acquire("small"))
+    await sleep(0)
+    task.cancel()
+    with raises(CancelledError):
+        await task
+    assert not scheduler.waiting
+
+    scheduler.release()
+    assert scheduler.in_use == 0
+
+
+@mark.asyncio
+async def test_scheduler_passes_on_slots_of_cancelled_requests():
+    scheduler = Scheduler(1)
+    await scheduler.acquire("big")
+    first = create_task(scheduler.acquire("small"))
+    second = create_task(scheduler.acquire("other"))
+    await sleep(0)
+    scheduler.release()  # hands the slot to `first`
+    first.cancel()
+    with raises(CancelledError):
+        await first
+    await second
+    assert scheduler.in_use == 1
+
+
+def test_occurrences_validates_priority():
+    client = AsyncClient("fake@crossfire", "secret", progress=False)
+    for priority in (0, -1, True, "high"):
+        with raises(PriorityError):
+            Occurrences(client, STATES[0][0], priority=priority)
+
+
+@mark.asyncio
+async def test_small_query_is_not_stuck_behind_a_large_one(fake_api_client):
+    api = FakeAPI(total=400, take=5, latency=0.01)
+    client = fake_api_client(api, max_parallel_requests=2)
+    (large, _), (small, _) = STATES
+    bulk = create_task(client.occurrences(large))
+    await sleep(0.05)
+    await client.occurrences(small, type_occurrence="withVictim", priority=3)
+    assert not bulk.done()
+    assert api.max_in_flight <= 2
+    await bulk
+
+
+@mark.asyncio
+@mark.parametrize("client_limit,expected", ((None, 32), (4, 4)))
+async def test_query_limit_above_the_default_is_honored(
+    client_limit, expected, fake_api_client
+):
+    api = FakeAPI(total=400, take=5, latency=0.01)
+    client = fake_api_client(api, max_parallel_requests=client_limit)
+    await client.occurrences(STATES[0][0], max_parallel_requests=32)
+    assert api.max_in_flight == expected
@@ -0,0 +1,103 @@
+from pytest import importorskip, mark, raises
+
+numpy = importorskip("numpy")
+
+from crossfire.records import to_records  # noqa: E402
+from crossfire.spatial import (  # noqa: E402
+    SQRT3,
+    UnknownGridKindError,
+    bin,
+    from_mercator,
+    hex_cells,
+    hex_centers,
+    to_mercator,
+)
+from crossfire.testing import SyntheticData  # noqa: E402
+
+try:
+    from pandas import DataFrame
+
+    HAS_PANDAS = True
+except ImportError:
+    HAS_PANDAS = False
+
+skip_if_pandas_not_installed = mark.skipif(
+    not HAS_PANDAS, reason="pandas is not installed"
+)
+
+OCCURRENCES = SyntheticData().occurrences(300)
+
+
+def test_mercator_round_trip():
+    longitude = numpy.array([-43.2, -34.9, 0])
+    latitude = numpy.array([-22.9, -8.05, 0])
+    x, y = to_mercator(longitude, latitude)
+    assert numpy.allclose(from_mercator(x, y), (longitude, latitude))
+
+
+def test_hex_cells_are_the_nearest_hexagon():
+    random = numpy.random.default_rng(42)
+    x, y = random.uniform(-5000, 5000, (2, 1000))
+    cell_size = 700
+    q, r = hex_cells(x, y, cell_size)
+    center_x, center_y = hex_centers(q, r, cell_size)
+    distance = numpy.hypot(x - center_x, y - center_y)
+    assert (distance <= cell_size / SQRT3 + 1e-9).all()
+
+    for dq, dr in ((1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)):
+        neighbor_x, neighbor_y = hex_centers(q + dq, r + dr, cell_size)
+        neighbor = numpy.hypot(x - neighbor_x, y - neighbor_y)
+        assert (distance <= neighbor + 1e-9).all()
+
+
+@mark.parametrize("kind", ("hex", "square"))
+def test_bin_totals(kind):
+    cells = bin(OCCURRENCES, cell_size=5000, kind=kind)
+    assert sum(cell["count"] for cell in cells) == len(OCCURRENCES)
+    assert sum(cell["victims"] for cell in cells) == sum(
+        len(item["victims"]) for item in OCCURRENCES
+    )
+    assert len({(cell["column"], cell["row"]) for cell in cells}) == len(cells)
+
+
+def test_bin_square_cells_contain_their_occurrences():
+    cell_size = 2000
+    occurrence = OCCURRENCES[0]
+    (cell,) = bin([occurrence], cell_size=cell_size, kind="square")
+    x, y = to_mercator(
+        float(occurrence["longitude"]), float(occurrence["latitude"])
+    )
+    center_x, center_y = to_mercator(cell["longitude"], cell["latitude"])
+    assert abs(x - center_x) <= cell_size / 2
+    assert abs(y - center_y) <= cell_size / 2
+
+
+def test_bin_by_period():
+    cells = bin(OCCURRENCES, cell_size=10_000, by="month")
+    months = {item["date"][:7] for item in OCCURRENCES}
+    assert {cell["month"] for cell in cells} == months
+    assert sum(cell["count"] for cell in cells) == len(OCCURRENCES)
+
+
+def test_bin_ignores_occurrences_without_coordinates():
+    occurrences = [dict(OCCURRENCES[0], latitude=None), OCCURRENCES[1]]
+    cells = bin(occurrences, cell_size=1000)
+    assert sum(cell["count"] for cell in cells) == 1
+
+
+def test_bin_accepts_records():
+    expected = bin(OCCURRENCES, cell_size=5000)
+    assert bin(to_records(OCCURRENCES), cell_size=5000) == expected
+
+
+@skip_if_pandas_not_installed
+def test_bin_accepts_and_returns_data_frames():
+    expected = bin(OCCURRENCES, cell_size=5000, by="year")
+    df = bin(DataFrame(OCCURRENCES), cell_size=5000, by="year", format="df")
+    assert isinstance(df, DataFrame)
+    assert df.to_dict("records") == expected
+
+
+def test_bin_raises_error_for_unknown_kind():
+    with raises(UnknownGridKindError):
+        bin(OCCURRENCES, cell_size=1000, kind="triangle")
@@ -0,0 +1,153 @@
+from datetime import datetime
+from json import loads
+from math import ceil
+from time import monotonic
+
+from httpx import HTTPStatusError, ReadTimeout
+from pytest import mark, raises
+
+from crossfire.clients import IncorrectCredentialsError
+from crossfire.clients.occurrences import flatten
+from crossfire.errors import RetryAfterError
+from crossfire.records import Occurrence
+from crossfire.testing import STATES, FakeAPI, SyntheticData
+
+
+def test_synthetic_data_is_deterministic():
+    assert SyntheticData().occurrence(42) == SyntheticData().occurrence(42)
+    assert SyntheticData().occurrence(42) != SyntheticData().occurrence(21)
+    assert SyntheticData(seed=1).occurrence(42) != SyntheticData().occurrence(
+        42
+    )
+
+
+def test_synthetic_occurrence_has_the_shape_of_the_api():
+    occurrence = SyntheticData().occurrence(42)
+    assert Occurrence.from_dict(occurrence).extra is None
+    assert set(occurrence["state"]) == {"id", "name"}
+    assert float(occurrence["latitude"]) < 0
+    assert float(occurrence["longitude"]) < 0
+
+
+def test_synthetic_occurrences_need_flattening():
+    occurrences = flatten(SyntheticData().occurrences(5))
+    assert all("locality_name" in item for item in occurrences)
+    assert all("contextInfo_mainReason_name" in item for item in occurrences)
+
+
+def test_synthetic_pages():
+    pages = tuple(SyntheticData().pages(45, take=20))
+    assert len(pages) == 3
+    assert [len(page["data"]) for page in pages] == [20, 20, 5]
+    assert pages[0]["pageMeta"]["pageCount"] == 3
+    assert pages[0]["pageMeta"]["itemCount"] == 45
+    assert pages[0]["pageMeta"]["hasNextPage"]
+    assert not pages[-1]["pageMeta"]["hasNextPage"]
+
+
+def test_synthetic_raw_pages():
+    first, *_ = SyntheticData().raw_pages(2, take=1)
+    assert loads(first) == SyntheticData().page(2, 1, take=1)
+
+
+@mark.asyncio
+async def test_fake_api_serves_paginated_occurrences(fake_api_client):
+    api = FakeAPI(total=100, take=20)
+    client = fake_api_client(api)
+    state_id = STATES[0][0]
+    occurrences = await client.occurrences(state_id)
+    assert len(occurrences) == len(
+        [occ for occ in api.occurrences if occ["state"]["id"] == state_id]
+    )
+    assert api.requests["login"] == 1
+    assert api.requests["occurrences"] == ceil(len(occurrences) / 20)
+
+
+@mark.asyncio
+async def test_fake_api_filters_occurrences(fake_api_client):
+    client = fake_api_client(FakeAPI(total=100))
+    occurrences = await client.occurrences(
+        STATES[1][0],
+        type_occurrence="withVictim",
+        initial_date="2016-07-01",
+        final_date="2016-07-01",
+    )
+    assert occurrences
+    for occurrence in occurrences:
+        assert occurrence["state"]["id"] == STATES[1][0]
+        assert occurrence["victims"]
+        assert occurrence["date"].startswith("2016-07-01")
+
+
+@mark.asyncio
+async def test_fake_api_serves_states_and_cities(fake_api_client):
+    client = fake_api_client(FakeAPI(total=100))
+    states, _ = await client.states()
+    assert {state["id"] for state in states} == {state for state, _ in STATES}
+
+    cities, _ = await client.cities(state_id=STATES[1][0])
+    assert {city["name"] for city in cities} <= {
+        "Recife",
+        "Jaboatão dos Guararapes",
+    }
+
+
+@mark.asyncio
+async def test_fake_api_sends_last_update_headers(fake_api_client):
+    client = fake_api_client(
+        FakeAPI(total=10, last_update=datetime(2023, 1, 2, 3, 4))
+    )
+    url = f"{client.URL}/occurrences?idState={STATES[0][0]}"
+    _, metadata = await client.get(url)
+    assert metadata.last_update == "2023-01-02T03:04:00-03:00"
+    assert metadata.last_update_state_id == STATES[0][0]
+    assert (
+        metadata.last_update_state_timestamp == metadata.last_update_timestamp
+    )
+
+
+@mark.asyncio
+async def test_fake_api_rate_limits_requests(fake_api_client):
+    api = FakeAPI(total=10, rate_limit=(2, 60))
+    client = fake_api_client(api)
+    await client.states()
+    with raises(RetryAfterError) as error:
+        await client.states()
+    assert 1 <= error.value.retry_after <= 60
+    assert api.requests["states"] == 2
+
+
+@mark.asyncio
+async def test_fake_api_simulates_errors_and_timeouts(fake_api_client):
+    client = fake_api_client(FakeAPI(total=10, error_rate=1))
+    with raises(HTTPStatusError):
+        await client.token()
+
+    client = fake_api_client(FakeAPI(total=10, timeout_rate=1, timeout=0))
+    with raises(ReadTimeout):
+        await client.token()
+
+
+@mark.asyncio
+async def test_fake_api_expires_tokens(fake_api_client):
+    client = fake_api_client(FakeAPI(total=10, token_ttl=-1))
+    with raises(HTTPStatusError) as error:
+        await client.states()
+    assert error.value.response.status_code == 401
+
+
+@mark.asyncio
+async def test_fake_api_rejects_wrong_credentials(fake_api_client):
+    client = fake_api_client(FakeAPI(total=10, credentials={"email": "other"}))
+    with raises(IncorrectCredentialsError):
+        await client.token()
+
+
+@mark.asyncio
+async def test_fake_api_adds_latency_to_concurrent_requests(fake_api_client):
+    api = FakeAPI(total=200, take=10, latency=(0.01, 0.02))
+    client = fake_api_client(api)
+    start = monotonic()
+    await client.occurrences(STATES[0][0], max_parallel_requests=4)
+    assert monotonic() - start >= 0.01
+    assert api.max_in_flight == 4
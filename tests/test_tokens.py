@@ -0,0 +1,120 @@
+from asyncio import gather
+from datetime import datetime, timedelta
+
+from pytest import mark
+
+from crossfire.clients import AsyncClient
+from crossfire.clients.tokens import Token, TokenStore
+from crossfire.filelock import FileLock
+from crossfire.testing import FakeAPI
+
+
+def test_token_store_saves_and_loads_tokens(tmp_path):
+    store = TokenStore("fake@crossfire", tmp_path)
+    assert store.load() is None
+
+    token = Token("42", 3600)
+    store.save(token)
+    loaded = TokenStore("fake@crossfire", tmp_path).load()
+    assert loaded.value == "42"
+    assert abs(loaded.valid_until - token.valid_until) < timedelta(seconds=1)
+    assert store.path.stat().st_mode & 0o077 == 0
+
+
+def test_token_store_ignores_expired_tokens(tmp_path):
+    store = TokenStore("fake@crossfire", tmp_path)
+    store.save(Token("42", -1))
+    assert store.load() is None
+
+
+def test_token_expires_before_its_expiry_time():
+    assert Token("42", 3600).is_valid()
+    assert not Token("42", 30).is_valid()
+
+
+def test_token_store_ignores_tokens_about_to_expire(tmp_path):
+    store = TokenStore("fake@crossfire", tmp_path)
+    store.save(Token("42", 30))
+    assert store.load() is None
+
+
+def test_token_store_is_keyed_by_email(tmp_path):
+    TokenStore("fake@crossfire", tmp_path).save(Token("42", 3600))
+    assert TokenStore("other@crossfire", tmp_path).load() is None
+    assert "fake" not in TokenStore("fake@crossfire", tmp_path).path.name
+
+
+def test_token_store_ignores_invalid_files(tmp_path):
+    store = TokenStore("fake@crossfire", tmp_path)
+    store.path.write_text("{")
+    assert store.load() is None
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    path = tmp_path / "lock"
+    with FileLock(path):
+        other = FileLock(path)
+        assert not other.try_acquire()
+    assert other.try_acquire()
+    other.release()
+
+
+@mark.asyncio
+async def test_async_file_lock_waits_for_the_lock(tmp_path):
+    path = tmp_path / "lock"
+    lock = FileLock(path, interval=0.01)
+    lock.try_acquire()
+
+    async def release():
+        lock.release()
+
+    async def acquire():
+        async with FileLock(path, interval=0.01):
+            return datetime.now()
+
+    acquired, _ = await gather(acquire(), release())
+    assert acquired
+
+
+@mark.asyncio
+async def test_clients_share_the_token_with_token_cache(tmp_path):
+    api = FakeAPI(total=10)
+    clients = [
+        AsyncClient(
+            "fake@crossfire",
+            "secret",
+            transport=api,
+            progress=False,
+            token_cache=tmp_path,
+        )
+        for _ in range(3)
+    ]
+    tokens = await gather(*(client.token() for client in clients))
+    assert len(set(tokens)) == 1
+    assert api.requests["login"] == 1
+
+
+@mark.asyncio
+async def test_concurrent_calls_log_in_once(tmp_path):
+    api = FakeAPI(total=10, latency=0.01)
+    client = AsyncClient(
+        "fake@crossfire", "secret", transport=api, progress=False
+    )
+    await gather(*(client.token() for _ in range(5)))
+    assert api.requests["login"] == 1
+
+
+@mark.asyncio
+async def test_expired_cached_token_is_refreshed(tmp_path):
+    TokenStore("fake@crossfire", tmp_path).save(Token("old", -1))
+    api = FakeAPI(total=10)
+    client = AsyncClient(
+        "fake@crossfire",
+        "secret",
+        transport=api,
+        progress=False,
+        token_cache=tmp_path,
+    )
+    token = await client.token()
+    assert token != "old"
+    assert TokenStore("fake@crossfire", tmp_path).load().value == token
@@ -0,0 +1,50 @@
+from crossfire.clients.tuning import PageSizeTuner
+from crossfire.parser import Metadata
+
+
+def metadata(take):
+    return Metadata(
+        page=1,
+        take=take,
+        item_count=1000,
+        page_count=10,
+        has_previous_page=False,
+        has_next_page=True,
+    )
+
+
+def observe(tuner, fixed, per_record, sizes):
+    for size in sizes:
+        tuner.observe(size, metadata(size), size, fixed + per_record * size)
+
+
+def test_tuner_suggests_largest_size_without_observations():
+    assert PageSizeTuner().suggest(total=10_000, parallel=4) == 1000
+
+
+def test_tuner_learns_largest_size_accepted_by_the_server():
+    tuner = PageSizeTuner()
+    tuner.observe(1000, metadata(100), 100, 0.1)
+    assert tuner.max_size == 100
+    assert tuner.candidates() == (20, 50, 100)
+    assert tuner.suggest() == 100
+
+
+def test_tuner_fits_fixed_and_per_record_costs():
+    tuner = PageSizeTuner()
+    observe(tuner, 0.5, 0.001, (20, 100, 500))
+    fixed, per_record = tuner.model()
+    assert round(fixed, 6) == 0.5
+    assert round(per_record, 6) == 0.001
+
+
+def test_tuner_prefers_large_pages_when_requests_are_expensive():
+    tuner = PageSizeTuner()
+    observe(tuner, 1, 0.0001, (20, 100, 500))
+    assert tuner.suggest(total=10_000, parallel=4) == 1000
+
+
+def test_tuner_prefers_parallel_pages_when_records_are_expensive():
+    tuner = PageSizeTuner()
+    observe(tuner, 0.01, 0.01, (20, 100, 500))
+    assert tuner.suggest(total=1000, parallel=16) < 1000
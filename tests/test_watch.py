@@ -0,0 +1,129 @@
+from asyncio import Event, TimeoutError, create_task, sleep, wait_for
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from pytest import mark, raises
+
+from crossfire.errors import CrossfireError
+from crossfire.events import TqdmProgress
+from crossfire.records import Occurrence
+from crossfire.testing import STATES, FakeAPI, SyntheticData
+
+STATE, _ = STATES[1]
+
+
+def recent_api():
+    start = datetime.now() - timedelta(days=2)
+    occurrences = SyntheticData(start=start).occurrences(40)
+    return FakeAPI(occurrences=occurrences)
+
+
+def in_state(api):
+    return [o for o in api.occurrences if o["state"]["id"] == STATE]
+
+
+async def take(watcher, count):
+    return [await wait_for(watcher.__anext__(), 1) for _ in range(count)]
+
+
+def publish(api, *occurrences):
+    api.occurrences.extend(occurrences)
+    api.matches.clear()
+    api.last_update += timedelta(minutes=5)
+
+
+@mark.asyncio
+async def test_watch_yields_occurrences_in_the_window(fake_api_client):
+    api = recent_api()
+    watcher = fake_api_client(api).watch(STATE, interval=0.01)
+    occurrences = await take(watcher, len(in_state(api)))
+    assert {o["id"] for o in occurrences} == {o["id"] for o in in_state(api)}
+    await watcher.aclose()
+
+
+@mark.asyncio
+async def test_watch_only_downloads_when_data_is_updated(fake_api_client):
+    api = recent_api()
+    watcher = fake_api_client(api).watch(STATE, interval=0.01)
+    await take(watcher, len(in_state(api)))
+    downloads = api.requests["occurrences"]
+
+    with raises(TimeoutError):
+        await wait_for(watcher.__anext__(), 0.1)
+    polls = api.requests["occurrences"] - downloads
+    assert polls > 1  # a single-record request per check
+    await watcher.aclose()
+
+
+@mark.asyncio
+async def test_watch_yields_new_and_updated_occurrences(fake_api_client):
+    api = recent_api()
+    checked = Event()
+
+    async def pause(seconds):
+        checked.set()
+        await sleep(seconds)
+
+    watcher = fake_api_client(api).watch(STATE, interval=0.01, backfill=False)
+    with patch("crossfire.clients.sleep", pause):
+        task = create_task(watcher.__anext__())
+        await wait_for(checked.wait(), 1)  # the watcher saw the current data
+
+        new = dict(in_state(api)[0], id="new-occurrence")
+        updated = in_state(api)[1]
+        updated["policeAction"] = not updated["policeAction"]
+        publish(api, new)
+
+        first, second = await wait_for(task, 1), await take(watcher, 1)
+    assert {first["id"], second[0]["id"]} == {new["id"], updated["id"]}
+    await watcher.aclose()
+
+
+@mark.asyncio
+async def test_watch_yields_records(fake_api_client):
+    api = recent_api()
+    watcher = fake_api_client(api).watch(STATE, interval=0.01, format="records")
+    (occurrence,) = await take(watcher, 1)
+    assert isinstance(occurrence, Occurrence)
+    await watcher.aclose()
+
+
+@mark.asyncio
+async def test_watch_does_not_support_tabular_formats(fake_api_client):
+    watcher = fake_api_client(recent_api()).watch(STATE, format="df")
+    with raises(CrossfireError):
+        await watcher.__anext__()
+
+
+class BrokenAPI(FakeAPI):
+    """Answers occurrences requests with HTTP 503 while `broken`."""
+
+    broken = True
+
+    async def handle_async_request(self, request):
+        if self.broken and request.url.path.endswith("/occurrences"):
+            self.broken = False
+            return self.json(request, {"msg": "Unavailable"}, 503)
+        return await super().handle_async_request(request)
+
+
+@mark.asyncio
+async def test_watch_survives_transient_errors(fake_api_client):
+    start = datetime.now() - timedelta(days=2)
+    api = BrokenAPI(occurrences=SyntheticData(start=start).occurrences(40))
+    watcher = fake_api_client(api).watch(STATE, interval=0.01)
+    occurrences = await take(watcher, len(in_state(api)))
+    assert len(occurrences) == len(in_state(api))
+    await watcher.aclose()
+
+
+@mark.asyncio
+async def test_watch_does_not_show_progress_bars(fake_api_client):
+    api = recent_api()
+    watching = fake_api_client(api)
+    watching.events.subscribe(TqdmProgress())
+    watcher = watching.watch(STATE, interval=0.01)
+    with patch("crossfire.events.tqdm") as tqdm:
+        await take(watcher, 1)
+    tqdm.assert_not_called()
+    await watcher.aclose()